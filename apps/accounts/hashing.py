@@ -0,0 +1,100 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
+
+# Passwords hashed per pool task; large enough to amortize the pickling round trip.
+HASH_BATCH_SIZE = 25
+REHASH_POLICIES = ('match', 'upgrade', 'never')
+
+# Process pool that password checks started by the ASGI login app run on.
+password_executor = ContextVar('password_executor', default=None)
+
+
+def _setup_worker():
+    # Forked workers inherit a configured Django; spawned ones start from scratch.
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def hash_passwords(passwords):
+    """make_password() for a list of raw passwords. Runs inside pool workers."""
+    from django.contrib.auth.hashers import make_password
+
+    return [make_password(password) for password in passwords]
+
+
+def _configured_cost(hasher, key):
+    # bcrypt calls its work factor "rounds"; the other hashers name it as decode() does.
+    if key == 'work_factor' and not hasattr(hasher, 'work_factor'):
+        return getattr(hasher, 'rounds', None)
+    return getattr(hasher, key, None)
+
+
+def _is_weaker(encoded):
+    """
+    Whether ``encoded`` is weaker than what the preferred hasher produces:
+    another (older) algorithm, a lower work factor or a short salt. A hash
+    that is only stronger than the current settings is not.
+    """
+    from django.contrib.auth.hashers import get_hasher, identify_hasher
+
+    preferred = get_hasher('default')
+    hasher = identify_hasher(encoded)
+    if hasher.algorithm != preferred.algorithm:
+        return True
+    decoded = hasher.decode(encoded)
+    lower = higher = False
+    for key in ('iterations', 'work_factor', 'time_cost', 'memory_cost'):
+        stored, configured = decoded.get(key), _configured_cost(preferred, key)
+        if stored is not None and configured is not None:
+            lower = lower or stored < configured
+            higher = higher or stored > configured
+    return lower or not higher
+
+
+def verify_password(password, encoded):
+    """
+    check_password() returning (is_correct, needs_rehash), where rehashing
+    follows LOGIN_REHASH_POLICY: 'match' rehashes whenever Django would
+    (work factor raised or lowered, hasher changed), 'upgrade' only when the
+    stored hash is weaker than the preferred hasher, 'never' keeps stored
+    hashes as they are. Runs inside pool workers.
+    """
+    from django.conf import settings
+    from django.contrib.auth.hashers import check_password
+
+    must_update = []
+    is_correct = check_password(password, encoded, setter=must_update.append)
+    if not must_update:
+        return is_correct, False
+    policy = getattr(settings, 'LOGIN_REHASH_POLICY', 'match')
+    if policy == 'never':
+        return True, False
+    return True, policy == 'match' or _is_weaker(encoded)
+
+
+def password_hash_pool(workers=None):
+    """
+    A process pool for CPU-bound password hashing. This module imports no
+    models, so workers can unpickle tasks before Django is set up.
+    """
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_setup_worker)
+
+
+def run_password_task(func, *args):
+    """``func(*args)`` on password_executor when one is set, otherwise in this thread."""
+    executor = password_executor.get()
+    if executor is None:
+        return func(*args)
+    return executor.submit(func, *args).result()
+
+
+def submit_password_hashes(executor, passwords, batch_size=HASH_BATCH_SIZE):
+    """Queue ``passwords`` on ``executor`` in batches; returns the futures in order."""
+    return [
+        executor.submit(hash_passwords, passwords[start:start + batch_size])
+        for start in range(0, len(passwords), batch_size)
+    ]
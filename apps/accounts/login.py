@@ -0,0 +1,210 @@
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.signals import user_logged_in
+from django.db import close_old_connections
+from rest_framework.throttling import BaseThrottle
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.main.throttling import take_request_tokens
+
+from .hashing import password_executor, password_hash_pool
+from .serializers import LoginSerializer
+
+LOGIN_PATH = '/accounts/login/'
+LOGIN_HASH_MAX_PENDING = 64
+LOGIN_RETRY_AFTER = 1
+LOGIN_MAX_BODY = 64 * 1024
+
+
+class LoginBusy(Exception):
+    """More password checks are queued than LOGIN_HASH_MAX_PENDING allows."""
+
+
+class LoginPool:
+    """
+    Bounded pool for the authenticate() calls of async logins.
+    LOGIN_HASH_POOL picks threads (PBKDF2 releases the GIL while hashing),
+    which run authenticate() themselves, or processes (for hashers that do
+    not), which take the password checks while authenticate() runs on a
+    worker thread; LOGIN_HASH_WORKERS is the pool size. Once
+    LOGIN_HASH_MAX_PENDING logins are queued or running, run() raises
+    LoginBusy at once instead of letting the backlog, and every client's
+    wait, grow.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _get_executor(self):
+        if self._executor is None:
+            workers = getattr(settings, 'LOGIN_HASH_WORKERS', None) or os.cpu_count()
+            if getattr(settings, 'LOGIN_HASH_POOL', 'thread') == 'process':
+                self._executor = password_hash_pool(workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='login-hash')
+        return self._executor
+
+    def reset(self):
+        """Shut the pool down; the next login builds one from the current settings."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    async def run(self, func, *args, **kwargs):
+        with self._lock:
+            if self._pending >= getattr(settings, 'LOGIN_HASH_MAX_PENDING', LOGIN_HASH_MAX_PENDING):
+                raise LoginBusy()
+            self._pending += 1
+            executor = self._get_executor()
+        try:
+            if isinstance(executor, ThreadPoolExecutor):
+                return await sync_to_async(func, thread_sensitive=False, executor=executor)(*args, **kwargs)
+            token = password_executor.set(executor)
+            try:
+                return await sync_to_async(func, thread_sensitive=False)(*args, **kwargs)
+            finally:
+                password_executor.reset(token)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+login_pool = LoginPool()
+
+
+def _authenticate(request, credentials):
+    # Pool threads never see request_finished, so close their connections here.
+    try:
+        return authenticate(request, **credentials)
+    finally:
+        close_old_connections()
+
+
+async def authenticate_async(request, **credentials):
+    """
+    authenticate() without blocking the event loop: it runs on login_pool,
+    so the configured backends check the credentials and a failure sends
+    user_login_failed, as for the ``login`` view. Returns the user or None;
+    raises LoginBusy when the pool is saturated.
+    """
+    return await login_pool.run(_authenticate, request, credentials)
+
+
+def logged_in(request, user):
+    """Send user_logged_in, as login() would for a session; token logins never call it."""
+    user_logged_in.send(sender=user.__class__, request=request, user=user)
+
+
+def login_response_data(user):
+    refresh = RefreshToken.for_user(user)
+    return {
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+        'user': {
+            'email': user.email,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'role': user.role
+        }
+    }
+
+
+async def _send_json(send, status, body, headers=()):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), *headers]})
+    await send({'type': 'http.response.body', 'body': json.dumps(body, cls=JSONEncoder).encode()})
+
+
+async def _read_body(receive, limit):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if len(body) > limit:
+            return None
+        if not message.get('more_body'):
+            return body
+
+
+def _throttle_wait(scope):
+    """
+    Charge the login to the client's 'write' bucket, as CostRateThrottle
+    does for the WSGI login view, which this app bypasses. The client is
+    identified the way DRF identifies anonymous clients.
+    """
+    headers = dict(scope['headers'])
+    meta = {'REMOTE_ADDR': (scope.get('client') or ('',))[0]}
+    if b'x-forwarded-for' in headers:
+        meta['HTTP_X_FORWARDED_FOR'] = headers[b'x-forwarded-for'].decode('latin-1')
+    ident = BaseThrottle().get_ident(SimpleNamespace(META=meta))
+    return take_request_tokens(f'ip:{ident}', 'write', getattr(settings, 'THROTTLE_COSTS', {}).get('login', 1))
+
+
+def _parse_body(scope, body):
+    content_type = b''
+    for name, value in scope['headers']:
+        if name == b'content-type':
+            content_type = value.split(b';')[0].strip().lower()
+    if content_type == b'application/x-www-form-urlencoded':
+        return dict(parse_qsl(body.decode()))
+    return json.loads(body or b'{}')
+
+
+async def login_application(scope, receive, send):
+    """
+    ASGI app for POST /accounts/login/, answering like the ``login`` view.
+    Served outside the Django handler because its sync-only middleware would
+    pin every request to one thread while the password check waits on the
+    pool. Logins are throttled like other writes (429), and a saturated pool
+    answers 503 with Retry-After.
+    """
+    wait = _throttle_wait(scope)
+    if wait:
+        wait = math.ceil(wait)
+        return await _send_json(
+            send, 429, {'detail': f'Request was throttled. Expected available in {wait} seconds.'},
+            [(b'retry-after', str(wait).encode())],
+        )
+    body = await _read_body(receive, LOGIN_MAX_BODY)
+    if body is None:
+        return await _send_json(send, 400, {'detail': 'Request body too large or incomplete.'})
+    try:
+        data = _parse_body(scope, body)
+    except (ValueError, UnicodeDecodeError):
+        return await _send_json(send, 400, {'detail': 'JSON parse error.'})
+    serializer = LoginSerializer(data=data if isinstance(data, dict) else {})
+    if not serializer.is_valid():
+        return await _send_json(send, 400, serializer.errors)
+
+    try:
+        user = await authenticate_async(
+            None, email=serializer.validated_data['email'], password=serializer.validated_data['password'],
+        )
+    except LoginBusy:
+        return await _send_json(
+            send, 503, {'error': 'Too many logins in progress, retry shortly'},
+            [(b'retry-after', str(LOGIN_RETRY_AFTER).encode())],
+        )
+    if user is None:
+        return await _send_json(send, 400, {'error': 'Invalid credentials'})
+    await sync_to_async(logged_in)(None, user)
+    await _send_json(send, 200, await sync_to_async(login_response_data)(user))
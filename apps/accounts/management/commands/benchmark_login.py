@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils.module_loading import import_string
+
+from apps.accounts.hashing import REHASH_POLICIES
+from apps.accounts.login import LOGIN_PATH, logged_in, login_application, login_pool, login_response_data
+from apps.accounts.models import CustomUser
+
+BENCH_EMAIL = 'login-benchmark-{}@example.invalid'
+BENCH_PASSWORD = 'login-benchmark-password'
+
+
+def _ints(value):
+    return [int(part) for part in value.split(',') if part]
+
+
+class Command(BaseCommand):
+    help = "Measure login throughput (logins/s and logins/s per core) for each hasher, pool kind and pool size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help="Logins per configuration")
+        parser.add_argument('--concurrency', type=int, default=32, help="Logins in flight on the async path")
+        parser.add_argument('--users', type=int, default=20, help="Benchmark users the logins rotate over")
+        parser.add_argument('--hashers', help="Comma separated hasher paths (default: the preferred PASSWORD_HASHERS entry)")
+        parser.add_argument('--stored-hasher', help="Store the users' passwords with this hasher instead, to measure rehashing")
+        parser.add_argument('--policy', choices=REHASH_POLICIES, help="LOGIN_REHASH_POLICY to use (default: the setting)")
+        parser.add_argument('--pools', default='thread,process', help="Comma separated pool kinds")
+        parser.add_argument('--workers', type=_ints, help="Comma separated pool sizes (default: 1 and the CPU count)")
+        parser.add_argument('--skip-sync', action='store_true', help="Do not measure the synchronous login view path")
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count()
+        hashers = options['hashers'].split(',') if options['hashers'] else settings.PASSWORD_HASHERS[:1]
+        pools = [pool for pool in options['pools'].split(',') if pool]
+        if any(pool not in ('thread', 'process') for pool in pools):
+            raise CommandError("--pools takes 'thread' and/or 'process'.")
+        workers = options['workers'] or sorted({1, cores})
+        policy = options['policy'] or getattr(settings, 'LOGIN_REHASH_POLICY', 'match')
+        stored_hasher = options['stored_hasher']
+
+        self.stdout.write(
+            f"{options['logins']} logins per run, {options['users']} users, concurrency {options['concurrency']}, "
+            f"rehash policy '{policy}', {cores} CPU(s)"
+        )
+        self.stdout.write(f"{'hasher':<30} {'path':<8} {'workers':>7} {'logins/s':>9} {'per core':>9} "
+                          f"{'p50 ms':>8} {'p95 ms':>8}  statuses")
+        users = []
+        try:
+            for hasher in hashers:
+                hasher_list = [hasher] + ([stored_hasher] if stored_hasher and stored_hasher != hasher else [])
+                # Free logins, so the login throttle does not cap what is measured.
+                with override_settings(PASSWORD_HASHERS=hasher_list, LOGIN_REHASH_POLICY=policy,
+                                       THROTTLE_COSTS={**getattr(settings, 'THROTTLE_COSTS', {}), 'login': 0}):
+                    encoded = make_password(BENCH_PASSWORD, hasher=import_string(stored_hasher or hasher)())
+                    users = self.create_users(options['users'], encoded)
+                    if not options['skip_sync']:
+                        self.report(hasher, 'sync', 1, 1, *self.run_sync(users, options['logins']))
+                        self.reset_passwords(users, encoded)
+                    for pool in pools:
+                        for size in workers:
+                            with override_settings(LOGIN_HASH_POOL=pool, LOGIN_HASH_WORKERS=size):
+                                login_pool.reset()
+                                try:
+                                    result = asyncio.run(self.run_async(users, options['logins'], options['concurrency']))
+                                finally:
+                                    login_pool.reset()
+                            self.report(hasher, pool, size, min(size, cores), *result)
+                            self.reset_passwords(users, encoded)
+                    self.delete_users(users)
+                    users = []
+        finally:
+            self.delete_users(users)
+
+    def create_users(self, count, encoded):
+        self.delete_users(CustomUser.objects.filter(email__in=[BENCH_EMAIL.format(index) for index in range(count)]))
+        return CustomUser.objects.bulk_create([
+            CustomUser(email=BENCH_EMAIL.format(index), password=encoded, first_name='Login', last_name='Benchmark')
+            for index in range(count)
+        ])
+
+    def reset_passwords(self, users, encoded):
+        CustomUser.objects.filter(pk__in=[user.pk for user in users]).update(password=encoded)
+
+    def delete_users(self, users):
+        if users:
+            CustomUser.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def run_sync(self, users, logins):
+        """The ``login`` view's work, one login after another as on one worker thread."""
+        statuses = Counter()
+        latencies = []
+        started = time.perf_counter()
+        for index in range(logins):
+            begun = time.perf_counter()
+            user = authenticate(email=users[index % len(users)].email, password=BENCH_PASSWORD)
+            if user:
+                logged_in(None, user)
+                login_response_data(user)
+            statuses[200 if user else 400] += 1
+            latencies.append(time.perf_counter() - begun)
+        return time.perf_counter() - started, statuses, latencies
+
+    async def run_async(self, users, logins, concurrency):
+        """Logins through the ASGI login app, ``concurrency`` at a time."""
+        semaphore = asyncio.Semaphore(concurrency)
+        statuses = Counter()
+        latencies = []
+
+        async def login(index):
+            body = json.dumps({'email': users[index % len(users)].email, 'password': BENCH_PASSWORD}).encode()
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+            async def receive():
+                return messages.pop() if messages else {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses[message['status']] += 1
+
+            scope = {
+                'type': 'http', 'method': 'POST', 'path': LOGIN_PATH, 'query_string': b'',
+                'headers': [(b'content-type', b'application/json')],
+            }
+            async with semaphore:
+                begun = time.perf_counter()
+                await login_application(scope, receive, send)
+                latencies.append(time.perf_counter() - begun)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(login(index) for index in range(logins)))
+        return time.perf_counter() - started, statuses, latencies
+
+    def report(self, hasher, path, workers, cores, elapsed, statuses, latencies):
+        rate = sum(statuses.values()) / elapsed
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000
+        self.stdout.write(
+            f"{hasher.rsplit('.', 1)[-1]:<30} {path:<8} {workers:>7} {rate:>9.1f} {rate / cores:>9.1f} "
+            f"{p50:>8.1f} {p95:>8.1f}  {dict(sorted(statuses.items()))}"
+        )
@@ -2,6 +2,8 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, Permis
 from django.db import models
 from django.utils.timezone import now
 
+from .hashing import run_password_task, verify_password
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         """
@@ -57,3 +59,16 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     def __str__(self):
         return f"{self.email} ({self.role})"
+
+    def check_password(self, raw_password):
+        """
+        Same as AbstractBaseUser.check_password, except that rehashing a
+        correct password follows LOGIN_REHASH_POLICY.
+        """
+        is_correct, needs_rehash = run_password_task(verify_password, raw_password, self.password)
+        if needs_rehash:
+            self.set_password(raw_password)
+            # A rehash is not a password change.
+            self._password = None
+            self.save(update_fields=['password'])
+        return is_correct
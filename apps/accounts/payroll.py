@@ -0,0 +1,213 @@
+import csv
+import uuid
+from decimal import Decimal
+from itertools import groupby
+
+from django.core.cache import cache, caches
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.utils.timezone import now
+
+from .models import CustomUser
+
+PAYROLL_CACHE_TIMEOUT = 60 * 60
+PAYROLL_VERSION_KEY = 'payroll-version'
+# The version must be seen by every process (job workers, commands); the
+# rollups cached under it can stay in each process's default cache.
+PAYROLL_VERSION_CACHE = 'shared'
+PAYROLL_GROUP_FIELDS = ('department', 'division', 'role')
+PAYROLL_PERCENTILES = (25, 50, 75, 90)
+# Saves touching only other fields (e.g. last_login on every login) leave the rollups valid.
+PAYROLL_FIELDS = frozenset(('salary', 'department', 'division', 'role', 'is_active'))
+PAYROLL_EXPORT_FIELDS = (
+    'email', 'first_name', 'last_name', 'role', 'division', 'department', 'salary', 'is_active',
+)
+PAYROLL_EXPORT_CHUNK_SIZE = 2000
+
+CENT = Decimal('0.01')
+
+
+def invalidate_payroll():
+    """
+    Start a new payroll run version so every cached rollup is recomputed on
+    next read. Called from the CustomUser signals; bulk writes that bypass
+    them (queryset.update, bulk_create) must call it themselves.
+    """
+    caches[PAYROLL_VERSION_CACHE].set(PAYROLL_VERSION_KEY, uuid.uuid4().hex[:12], None)
+
+
+def payroll_version():
+    versions = caches[PAYROLL_VERSION_CACHE]
+    version = versions.get(PAYROLL_VERSION_KEY)
+    if version is None:
+        # A random token rather than a counter, so an evicted key cannot roll
+        # back to a version that still has stale rollups cached under it.
+        version = uuid.uuid4().hex[:12]
+        versions.add(PAYROLL_VERSION_KEY, version, None)
+        version = versions.get(PAYROLL_VERSION_KEY, version)
+    return version
+
+
+def payroll_queryset(role=None, include_inactive=False):
+    users = CustomUser.objects.all()
+    if role:
+        users = users.filter(role=role)
+    if not include_inactive:
+        users = users.filter(is_active=True)
+    return users
+
+
+def _money(value):
+    return value.quantize(CENT) if value is not None else None
+
+
+def _percentiles(salaries):
+    """Linear-interpolated percentiles of an ascending list of salaries."""
+    if not salaries:
+        return {f'p{point}': None for point in PAYROLL_PERCENTILES}
+    last = len(salaries) - 1
+    values = {}
+    for point in PAYROLL_PERCENTILES:
+        position = Decimal(last * point) / 100
+        lower = int(position)
+        upper = min(lower + 1, last)
+        value = salaries[lower] + (salaries[upper] - salaries[lower]) * (position - lower)
+        values[f'p{point}'] = _money(value)
+    return values
+
+
+def _stats(row, salaries):
+    return {
+        'headcount': row['headcount'],
+        'salaried': row['salaried'],
+        'total_salary': _money(row['total_salary']) or Decimal('0.00'),
+        'average_salary': _money(row['average_salary']),
+        'min_salary': _money(row['min_salary']),
+        'max_salary': _money(row['max_salary']),
+        'percentiles': _percentiles(salaries),
+    }
+
+
+def _aggregates():
+    return {
+        'headcount': Count('id'),
+        'salaried': Count('salary'),
+        'total_salary': Sum('salary'),
+        'average_salary': Avg('salary'),
+        'min_salary': Min('salary'),
+        'max_salary': Max('salary'),
+    }
+
+
+def _grouped(users, fields):
+    """(group values tuple -> aggregate row) from one GROUP BY query."""
+    rows = users.values(*fields).annotate(**_aggregates()).order_by(*fields)
+    return {tuple(row[field] for field in fields): row for row in rows}
+
+
+def _salaries_by(users, fields):
+    """(group values tuple -> ascending salaries) from one ordered query."""
+    rows = users.filter(salary__isnull=False).order_by(*fields, 'salary').values_list(*fields, 'salary')
+    width = len(fields)
+    return {
+        key: [row[width] for row in group]
+        for key, group in groupby(rows.iterator(), key=lambda row: row[:width])
+    }
+
+
+def compute_payroll_run(group_by='department', role=None, include_inactive=False):
+    """
+    Headcount and salary rollup per ``group_by`` value plus organisation
+    totals. Sums, averages and extremes come from one grouped aggregate;
+    percentiles from a single salary-ordered scan of the same users.
+    """
+    users = payroll_queryset(role, include_inactive)
+    groups = _grouped(users, (group_by,))
+    salaries = _salaries_by(users, (group_by,))
+    totals = users.aggregate(**_aggregates())
+    all_salaries = sorted(salary for values in salaries.values() for salary in values)
+    return {
+        'group_by': group_by,
+        'generated_at': now(),
+        'totals': _stats(totals, all_salaries),
+        'groups': [
+            {group_by: key[0], **_stats(row, salaries.get(key, []))}
+            for key, row in groups.items()
+        ],
+    }
+
+
+def compute_org_report(role=None, include_inactive=False):
+    """Division -> department tree of the same rollups as compute_payroll_run."""
+    users = payroll_queryset(role, include_inactive)
+    departments = _grouped(users, ('division', 'department'))
+    divisions = _grouped(users, ('division',))
+    salaries = _salaries_by(users, ('division', 'department'))
+    totals = users.aggregate(**_aggregates())
+
+    division_salaries = {}
+    for (division, _), values in salaries.items():
+        division_salaries.setdefault(division, []).extend(values)
+    for values in division_salaries.values():
+        values.sort()
+
+    department_stats = {}
+    for key, row in departments.items():
+        division, department = key
+        department_stats.setdefault(division, []).append(
+            {'department': department, **_stats(row, salaries.get(key, []))}
+        )
+
+    report = [
+        {
+            'division': division,
+            **_stats(row, division_salaries.get(division, [])),
+            'departments': department_stats.get(division, []),
+        }
+        for (division,), row in divisions.items()
+    ]
+    return {
+        'generated_at': now(),
+        'totals': _stats(totals, sorted(salary for values in division_salaries.values() for salary in values)),
+        'divisions': report,
+    }
+
+
+def _cached(name, params, compute):
+    version = payroll_version()
+    key = f'payroll:{name}:{version}:' + ':'.join(str(value) for value in params)
+    result = cache.get(key)
+    if result is None:
+        result = {'run': version, **compute()}
+        cache.set(key, result, PAYROLL_CACHE_TIMEOUT)
+    return result
+
+
+def get_payroll_run(group_by='department', role=None, include_inactive=False):
+    return _cached(
+        'run', (group_by, role or 'all', include_inactive),
+        lambda: compute_payroll_run(group_by, role, include_inactive),
+    )
+
+
+def get_org_report(role=None, include_inactive=False):
+    return _cached(
+        'org', (role or 'all', include_inactive),
+        lambda: compute_org_report(role, include_inactive),
+    )
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def payroll_csv_rows(role=None, include_inactive=False):
+    """
+    Yield the payroll register as CSV lines, reading users in chunks with
+    iterator() so memory stays flat however large the organisation is.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(PAYROLL_EXPORT_FIELDS)
+    users = payroll_queryset(role, include_inactive).order_by('division', 'department', 'email')
+    for row in users.values_list(*PAYROLL_EXPORT_FIELDS).iterator(chunk_size=PAYROLL_EXPORT_CHUNK_SIZE):
+        yield writer.writerow(row)
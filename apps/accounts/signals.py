@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser
+from .payroll import PAYROLL_FIELDS, invalidate_payroll
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_payroll_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or PAYROLL_FIELDS.intersection(update_fields):
+        invalidate_payroll()
+
+
+@receiver(post_delete, sender=CustomUser)
+def invalidate_payroll_on_delete(sender, instance, **kwargs):
+    invalidate_payroll()
@@ -1,3 +1,158 @@
-from django.test import TestCase
+import csv
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.core.cache import caches
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from apps.main.throttling import heavy_in_flight, token_buckets
+
+from .login import LOGIN_PATH, login_application, login_pool
+from .models import CustomUser
+from .payroll import PAYROLL_VERSION_CACHE
+
+PASSWORD = 'correct horse battery staple'
+
+
+class SignalRecorder:
+    def __init__(self, test, signal):
+        self.calls = []
+        signal.connect(self.receive)
+        test.addCleanup(signal.disconnect, self.receive)
+
+    def receive(self, sender, **kwargs):
+        self.calls.append(kwargs)
+
+
+class LoginViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='user@example.com', password=PASSWORD)
+
+    def test_login_sends_the_auth_signals(self):
+        logged_in = SignalRecorder(self, user_logged_in)
+        failed = SignalRecorder(self, user_login_failed)
+        client = APIClient()
+        response = client.post('/accounts/login/', {'email': 'user@example.com', 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(failed.calls), 1)
+        response = client.post('/accounts/login/', {'email': 'user@example.com', 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+        self.assertEqual([call['user'] for call in logged_in.calls], [self.user])
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+
+# The login app authenticates on pool threads, which only see committed rows.
+@override_settings(LOGIN_HASH_POOL='thread', LOGIN_HASH_WORKERS=2)
+class AsyncLoginTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='user@example.com', password=PASSWORD)
+        login_pool.reset()
+        self.addCleanup(login_pool.reset)
+
+    def login(self, password, client=('10.0.0.1', 1234)):
+        scope = {'type': 'http', 'method': 'POST', 'path': LOGIN_PATH, 'client': client,
+                 'headers': [(b'content-type', b'application/json')]}
+        messages = [{'type': 'http.request', 'body': json.dumps({'email': self.user.email, 'password': password}).encode()}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        async_to_sync(login_application)(scope, receive, send)
+        return sent[0]['status'], json.loads(sent[1]['body'])
+
+    def test_login_runs_the_auth_backends_and_signals(self):
+        logged_in = SignalRecorder(self, user_logged_in)
+        failed = SignalRecorder(self, user_login_failed)
+        status, body = self.login('wrong')
+        self.assertEqual(status, 400)
+        self.assertEqual(len(failed.calls), 1)
+        status, body = self.login(PASSWORD)
+        self.assertEqual(status, 200)
+        self.assertEqual(body['user']['email'], self.user.email)
+        self.assertEqual([call['user'] for call in logged_in.calls], [self.user])
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_inactive_users_cannot_log_in(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.login(PASSWORD)[0], 400)
+
+    @override_settings(LOGIN_HASH_MAX_PENDING=0)
+    def test_a_saturated_pool_answers_503(self):
+        self.assertEqual(self.login(PASSWORD)[0], 503)
+
+
+class PayrollTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin@example.com', 'pw')
+        for index, (division, department, salary, active) in enumerate((
+            ('Eng', 'Backend', 100, True), ('Eng', 'Backend', 200, True), ('Eng', 'Frontend', 300, True),
+            ('Ops', 'Support', 400, True), ('Ops', 'Support', 1000, False),
+        )):
+            CustomUser.objects.create_user(
+                f'staff{index}@example.com', 'pw', role='employee', division=division, department=department,
+                salary=Decimal(salary), is_active=active,
+            )
+
+    def setUp(self):
+        caches['default'].clear()
+        caches[PAYROLL_VERSION_CACHE].clear()
+        token_buckets.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def groups(self, **params):
+        response = self.client.get('/accounts/payroll/run/', {'role': 'employee', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data, {group['department']: group for group in response.data['groups']}
+
+    def test_run_groups_and_percentiles(self):
+        run, groups = self.groups()
+        self.assertEqual(run['totals']['total_salary'], Decimal('1000.00'))
+        backend = groups['Backend']
+        self.assertEqual((backend['headcount'], backend['total_salary'], backend['average_salary']),
+                         (2, Decimal('300.00'), Decimal('150.00')))
+        self.assertEqual(backend['percentiles']['p50'], Decimal('150.00'))
+        _, groups = self.groups(include_inactive='true')
+        self.assertEqual(groups['Support']['max_salary'], Decimal('1000.00'))
+        self.assertEqual(self.client.get('/accounts/payroll/run/', {'group_by': 'salary'}).status_code, 400)
+
+    def test_org_report_nests_departments_under_divisions(self):
+        report = self.client.get('/accounts/payroll/org-report/', {'role': 'employee'}).data
+        divisions = {division['division']: division for division in report['divisions']}
+        self.assertEqual(divisions['Eng']['total_salary'], Decimal('600.00'))
+        self.assertEqual([department['department'] for department in divisions['Eng']['departments']],
+                         ['Backend', 'Frontend'])
+
+    def test_only_payroll_changes_start_a_new_run(self):
+        run, _ = self.groups()
+        user = CustomUser.objects.get(email='staff0@example.com')
+        user.last_login = now()
+        user.save(update_fields=['last_login'])
+        self.assertEqual(self.groups()[0]['run'], run['run'])
+        user.salary = Decimal('150')
+        user.save()
+        new_run, groups = self.groups()
+        self.assertNotEqual(new_run['run'], run['run'])
+        self.assertEqual(groups['Backend']['total_salary'], Decimal('350.00'))
+
+    def test_export_streams_the_register_and_frees_its_slot(self):
+        response = self.client.get('/accounts/payroll/export/', {'role': 'employee'})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        response.close()
+        self.assertEqual(rows[0][:2], ['email', 'first_name'])
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(heavy_in_flight.count, 0)
@@ -5,4 +5,7 @@ urlpatterns = [
     path('register/', register, name='register'),
     path('login/', login, name='login'),
     path('logout/', logout, name='logout'),
+    path('payroll/run/', payroll_run, name='payroll-run'),
+    path('payroll/org-report/', org_report, name='payroll-org-report'),
+    path('payroll/export/', payroll_export, name='payroll-export'),
 ]
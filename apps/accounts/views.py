@@ -1,5 +1,5 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import status
@@ -9,6 +9,9 @@ from django.contrib.auth import authenticate
 from rest_framework_simplejwt.exceptions import TokenError
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from django.http import StreamingHttpResponse
+from apps.accounts.login import logged_in, login_response_data
+from apps.accounts.payroll import PAYROLL_GROUP_FIELDS, get_org_report, get_payroll_run, payroll_csv_rows
 
 @swagger_auto_schema(
     method='post',
@@ -64,19 +67,10 @@ def login(request):
     if serializer.is_valid():
         email = serializer.validated_data['email']
         password = serializer.validated_data['password']
-        user = authenticate(email=email, password=password)
+        user = authenticate(request, email=email, password=password)
         if user:
-            refresh = RefreshToken.for_user(user)
-            return Response({
-                'access': str(refresh.access_token),
-                'refresh': str(refresh),
-                'user': {
-                    'email': user.email,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name,
-                    'role': user.role
-                }
-            })
+            logged_in(request, user)
+            return Response(login_response_data(user))
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -111,3 +105,66 @@ def logout(request):
         return Response({'error': 'No token provided'}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+# Payroll Views
+PAYROLL_FILTER_PARAMETERS = [
+    openapi.Parameter('role', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      enum=[choice for choice, _ in CustomUser.role_choices]),
+    openapi.Parameter('include_inactive', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN),
+]
+
+def _payroll_filters(request):
+    role = request.query_params.get('role') or None
+    if role and role not in dict(CustomUser.role_choices):
+        return None, None, Response({'error': 'Invalid role'}, status=status.HTTP_400_BAD_REQUEST)
+    include_inactive = request.query_params.get('include_inactive') in ('1', 'true', 'True')
+    return role, include_inactive, None
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('group_by', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(PAYROLL_GROUP_FIELDS)),
+        *PAYROLL_FILTER_PARAMETERS,
+    ],
+    responses={200: openapi.Schema(type=openapi.TYPE_OBJECT), 400: 'Bad Request'}
+)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def payroll_run(request):
+    """Headcount, salary totals, averages and percentiles per department, division or role."""
+    group_by = request.query_params.get('group_by', 'department')
+    if group_by not in PAYROLL_GROUP_FIELDS:
+        return Response({'error': f'group_by must be one of {", ".join(PAYROLL_GROUP_FIELDS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    role, include_inactive, error = _payroll_filters(request)
+    if error:
+        return error
+    return Response(get_payroll_run(group_by, role, include_inactive))
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=PAYROLL_FILTER_PARAMETERS,
+    responses={200: openapi.Schema(type=openapi.TYPE_OBJECT), 400: 'Bad Request'}
+)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def org_report(request):
+    """Payroll rollups per division, with each division's departments nested under it."""
+    role, include_inactive, error = _payroll_filters(request)
+    if error:
+        return error
+    return Response(get_org_report(role, include_inactive))
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=PAYROLL_FILTER_PARAMETERS,
+    responses={200: 'text/csv payroll register', 400: 'Bad Request'}
+)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def payroll_export(request):
+    role, include_inactive, error = _payroll_filters(request)
+    if error:
+        return error
+    response = StreamingHttpResponse(payroll_csv_rows(role, include_inactive), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="payroll.csv"'
+    return response
@@ -4,19 +4,22 @@ from django.contrib import admin
 
 from django.contrib import admin
 from apps.main.models import *
+from apps.main.paginators import EstimatedCountPaginator
 
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ('admission_number', 'user', 'class_section', 'is_active')
-    search_fields = ('admission_number', 'user__username', 'user__first_name', 'user__last_name')
+    search_fields = ('admission_number', 'user__email', 'user__first_name', 'user__last_name')
     list_filter = ('class_section', 'is_active')
+    list_select_related = ('user', 'class_section__class_name', 'class_section__section')
     raw_id_fields = ('user',)
 
 @admin.register(Teacher)
 class TeacherAdmin(admin.ModelAdmin):
     list_display = ('employee_id', 'user', 'qualification', 'is_active')
-    search_fields = ('employee_id', 'user__username', 'user__first_name', 'user__last_name')
+    search_fields = ('employee_id', 'user__email', 'user__first_name', 'user__last_name')
     list_filter = ('is_active',)
+    list_select_related = ('user',)
     raw_id_fields = ('user',)
 
 @admin.register(Class)
@@ -32,8 +35,9 @@ class SectionAdmin(admin.ModelAdmin):
 @admin.register(ClassSection)
 class ClassSectionAdmin(admin.ModelAdmin):
     list_display = ('class_name', 'section', 'class_teacher', 'academic_year')
-    search_fields = ('class_name__name', 'section__name', 'class_teacher__user__username')
+    search_fields = ('class_name__name', 'section__name', 'class_teacher__user__email')
     list_filter = ('academic_year',)
+    list_select_related = ('class_name', 'section', 'class_teacher__user')
     raw_id_fields = ('class_teacher',)
 
 @admin.register(Subject)
@@ -44,9 +48,13 @@ class SubjectAdmin(admin.ModelAdmin):
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
     list_display = ('student', 'date', 'status')
-    search_fields = ('student__user__username', 'student__admission_number')
-    list_filter = ('status', 'date')
+    search_fields = ('student__admission_number__exact', 'student__user__email__exact')
+    list_filter = ('status',)
+    list_select_related = ('student',)
+    date_hierarchy = 'date'
     raw_id_fields = ('student',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Exam)
 class ExamAdmin(admin.ModelAdmin):
@@ -57,14 +65,59 @@ class ExamAdmin(admin.ModelAdmin):
 @admin.register(ExamResult)
 class ExamResultAdmin(admin.ModelAdmin):
     list_display = ('exam', 'student', 'subject', 'marks_obtained', 'max_marks')
-    search_fields = ('exam__name', 'student__user__username', 'subject__name')
+    search_fields = ('student__admission_number__exact', 'student__user__email__exact', 'subject__code__exact')
     list_filter = ('exam', 'subject')
+    list_select_related = ('exam', 'student', 'subject')
     raw_id_fields = ('exam', 'student', 'subject')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Fee)
 class FeeAdmin(admin.ModelAdmin):
     list_display = ('student', 'fee_type', 'amount', 'due_date', 'status')
-    search_fields = ('student__user__username', 'fee_type')
-    list_filter = ('status', 'fee_type', 'due_date')
+    search_fields = ('student__admission_number__exact', 'student__user__email__exact', 'receipt_number__exact')
+    list_filter = ('status', 'fee_type')
+    list_select_related = ('student',)
+    date_hierarchy = 'due_date'
     raw_id_fields = ('student',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
+
+@admin.register(FeeSchedule)
+class FeeScheduleAdmin(admin.ModelAdmin):
+    list_display = ('fee_type', 'class_name', 'class_section', 'academic_year', 'amount', 'due_date', 'is_active')
+    list_filter = ('academic_year', 'fee_type', 'is_active')
+    list_select_related = ('class_name', 'class_section__class_name', 'class_section__section')
+    raw_id_fields = ('class_section',)
+
+@admin.register(AcademicYearArchive)
+class AcademicYearArchiveAdmin(admin.ModelAdmin):
+    list_display = ('academic_year', 'start_date', 'end_date', 'attendance_rows', 'exam_result_rows', 'archived_at')
+    readonly_fields = list_display
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(ChangeLogEntry)
+class ChangeLogEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'model', 'object_id', 'action', 'created_at')
+    list_filter = ('model', 'action')
+    search_fields = ('object_id__exact',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'status', 'progress', 'attempts', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'task')
+    list_select_related = ('created_by',)
+    readonly_fields = ('locked_by', 'locked_at', 'started_at', 'finished_at', 'created_at')
+    raw_id_fields = ('created_by',)
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('id', 'method', 'path', 'url_name', 'status_code', 'mode', 'duration_ms', 'sql_count', 'created_at')
+    list_filter = ('mode', 'url_name')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
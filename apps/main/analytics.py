@@ -0,0 +1,91 @@
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+from .archive import exam_result_manager
+from .grading import GRADE_BANDS, GRADES, PASS_PERCENTAGE
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+ANALYTICS_CACHE_TIMEOUT = 60 * 60 * 24
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def _summarize(percentages):
+    if percentages.size == 0:
+        return {
+            'count': 0, 'mean': None, 'median': None, 'std_dev': None,
+            'min': None, 'max': None, 'percentiles': {}, 'pass_rate': None,
+            'grade_histogram': {grade: 0 for grade in GRADES},
+        }
+
+    # Band thresholds ascending: F < 50 <= D < 60 ... <= A+. digitize gives
+    # the band index, which maps onto the grades in reverse order.
+    thresholds = np.array([minimum for minimum, _ in reversed(GRADE_BANDS)], dtype=float)
+    counts = np.bincount(np.digitize(percentages, thresholds), minlength=len(GRADES))
+    histogram = {grade: int(count) for grade, count in zip(reversed(GRADES), counts)}
+
+    return {
+        'count': int(percentages.size),
+        'mean': round(float(percentages.mean()), 2),
+        'median': round(float(np.median(percentages)), 2),
+        'std_dev': round(float(percentages.std()), 2),
+        'min': round(float(percentages.min()), 2),
+        'max': round(float(percentages.max()), 2),
+        'percentiles': {
+            f'p{point}': round(float(value), 2)
+            for point, value in zip(PERCENTILES, np.percentile(percentages, PERCENTILES))
+        },
+        'pass_rate': round(float((percentages >= PASS_PERCENTAGE).mean()) * 100, 2),
+        'grade_histogram': {grade: histogram[grade] for grade in GRADES},
+    }
+
+
+def compute_exam_analytics(exam, class_section_id=None, subject_id=None):
+    """
+    Mark distribution for an exam, optionally narrowed to one class section
+    and/or subject. All marks are loaded in a single values_list query and
+    reduced with NumPy; when no subject is given a per-subject breakdown is
+    included as well.
+    """
+    if np is None:
+        raise ImproperlyConfigured("NumPy is required for exam analytics.")
+
+    results = exam_result_manager(exam.academic_year).filter(exam=exam)
+    if class_section_id:
+        results = results.filter(student__class_section_id=class_section_id)
+    if subject_id:
+        results = results.filter(subject_id=subject_id)
+
+    rows = list(results.values_list('subject_id', 'marks_obtained', 'max_marks'))
+    subject_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    marks = np.array([row[1] for row in rows], dtype=float)
+    max_marks = np.array([row[2] for row in rows], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = np.where(max_marks > 0, marks / max_marks * 100, 0.0)
+
+    analytics = {
+        'exam': exam.id,
+        'class_section': class_section_id,
+        'subject': subject_id,
+        'overall': _summarize(percentages),
+    }
+    if not subject_id:
+        analytics['by_subject'] = {
+            int(subject): _summarize(percentages[subject_ids == subject])
+            for subject in np.unique(subject_ids)
+        }
+    return analytics
+
+
+def get_exam_analytics(exam, class_section_id=None, subject_id=None):
+    # The exam's results_version is part of the key, so any result change
+    # makes the old entry unreachable instead of requiring an explicit purge.
+    key = f'exam-analytics:{exam.id}:{exam.results_version}:{class_section_id or "all"}:{subject_id or "all"}'
+    analytics = cache.get(key)
+    if analytics is None:
+        analytics = compute_exam_analytics(exam, class_section_id, subject_id)
+        cache.set(key, analytics, ANALYTICS_CACHE_TIMEOUT)
+    return analytics
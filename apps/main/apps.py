@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.core.management import call_command
+from django.db.models.signals import post_migrate
+
+
+def create_search_index(sender, **kwargs):
+    from .search import ensure_search_index
+    ensure_search_index()
+
+
+def create_cache_tables(sender, using, **kwargs):
+    # Tables of the DatabaseCache backends in CACHES.
+    call_command('createcachetable', database=using, verbosity=0)
 
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.main'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(create_search_index, sender=self)
+        post_migrate.connect(create_cache_tables, sender=self)
@@ -0,0 +1,193 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils.timezone import now
+
+from .models import AcademicYearArchive, Attendance, ExamResult, ExamResultQuerySet
+from .request_cache import request_cached
+
+ARCHIVE_CHUNK_SIZE = 5000
+ARCHIVED_MODELS = (Attendance, ExamResult)
+
+_archive_models = {}
+
+
+def academic_year_bounds(academic_year):
+    """
+    First and last day of an academic year such as "2023-2024", which starts
+    on the first of ACADEMIC_YEAR_START_MONTH of its first calendar year.
+    """
+    first_year = int(academic_year.split('-')[0])
+    month = getattr(settings, 'ACADEMIC_YEAR_START_MONTH', 7)
+    start = date(first_year, month, 1)
+    return start, date(first_year + 1, month, 1) - timedelta(days=1)
+
+
+def archive_table_name(model, academic_year):
+    return f"{model._meta.db_table}_archive_{academic_year.replace('-', '_')}"
+
+
+def archive_model(model, academic_year):
+    """
+    Unmanaged model over the per-year archive table of ``model``, so archived
+    rows can be queried, annotated and serialized like the hot table. Foreign
+    keys keep their joins but have no database constraint and no reverse
+    accessors, so deletes on the hot side never cascade into the archive.
+    """
+    key = (model, academic_year)
+    if key in _archive_models:
+        return _archive_models[key]
+
+    attrs = {
+        '__module__': model.__module__,
+        'Meta': type('Meta', (), {
+            'app_label': model._meta.app_label,
+            'db_table': archive_table_name(model, academic_year),
+            'managed': False,
+        }),
+    }
+    for field in model._meta.local_fields:
+        name, path, args, kwargs = field.deconstruct()
+        if field.is_relation:
+            kwargs.update(related_name='+', db_constraint=False, on_delete=models.DO_NOTHING)
+        attrs[name] = type(field)(*args, **kwargs)
+    if model is ExamResult:
+        attrs['objects'] = ExamResultQuerySet.as_manager()
+
+    suffix = academic_year.replace('-', '_')
+    _archive_models[key] = type(f'{model.__name__}Archive_{suffix}', (models.Model,), attrs)
+    return _archive_models[key]
+
+
+def _rows_to_archive(model, academic_year):
+    if model is Attendance:
+        start, end = academic_year_bounds(academic_year)
+        return Attendance.objects.filter(date__gte=start, date__lte=end)
+    return ExamResult.objects.filter(exam__academic_year=academic_year)
+
+
+def _move_rows(model, source_table, target_table, ids):
+    # Columns are named on both sides: the hot table's column order comes
+    # from its migration history, the archive's from the current fields.
+    columns = ', '.join(f'"{field.column}"' for field in model._meta.local_fields)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO "{target_table}" ({columns}) SELECT {columns} FROM "{source_table}" '
+            f'WHERE id IN ({placeholders})', ids
+        )
+        cursor.execute(f'DELETE FROM "{source_table}" WHERE id IN ({placeholders})', ids)
+
+
+def archive_academic_year(academic_year, chunk_size=ARCHIVE_CHUNK_SIZE, progress=None):
+    """
+    Move a closed academic year's Attendance and ExamResult rows into their
+    per-year archive tables, chunk by chunk, each chunk in its own short
+    transaction. Rerunning resumes where an interrupted run stopped.
+    """
+    start, end = academic_year_bounds(academic_year)
+    record, _ = AcademicYearArchive.objects.get_or_create(
+        academic_year=academic_year, defaults={'start_date': start, 'end_date': end}
+    )
+    for model in ARCHIVED_MODELS:
+        archived = archive_model(model, academic_year)
+        if archived._meta.db_table not in connection.introspection.table_names():
+            with connection.schema_editor() as schema_editor:
+                schema_editor.create_model(archived)
+
+        moved = 0
+        rows = _rows_to_archive(model, academic_year).order_by('id').values_list('id', flat=True)
+        while True:
+            ids = list(rows[:chunk_size])
+            if not ids:
+                break
+            _move_rows(model, model._meta.db_table, archived._meta.db_table, ids)
+            moved += len(ids)
+            if progress:
+                progress(model, moved)
+
+    record.attendance_rows = archive_model(Attendance, academic_year).objects.count()
+    record.exam_result_rows = archive_model(ExamResult, academic_year).objects.count()
+    record.archived_at = now()
+    record.save()
+    return record
+
+
+def _purge_orphans(archived):
+    # Rows whose student, exam or subject was deleted after archiving would
+    # have cascaded away in the hot table; drop them rather than fail the restore.
+    with connection.cursor() as cursor:
+        for field in archived._meta.local_fields:
+            if field.is_relation:
+                target = field.related_model._meta
+                cursor.execute(
+                    f'DELETE FROM "{archived._meta.db_table}" WHERE "{field.column}" NOT IN '
+                    f'(SELECT "{target.pk.column}" FROM "{target.db_table}")'
+                )
+
+
+def restore_academic_year(academic_year, chunk_size=ARCHIVE_CHUNK_SIZE, progress=None):
+    """Move an archived year back into the hot tables and drop its archive tables."""
+    record = AcademicYearArchive.objects.get(academic_year=academic_year)
+    for model in ARCHIVED_MODELS:
+        archived = archive_model(model, academic_year)
+        if archived._meta.db_table not in connection.introspection.table_names():
+            continue
+        _purge_orphans(archived)
+        moved = 0
+        rows = archived.objects.order_by('id').values_list('id', flat=True)
+        while True:
+            ids = list(rows[:chunk_size])
+            if not ids:
+                break
+            _move_rows(model, archived._meta.db_table, model._meta.db_table, ids)
+            moved += len(ids)
+            if progress:
+                progress(model, moved)
+        with connection.schema_editor() as schema_editor:
+            schema_editor.delete_model(archived)
+    record.delete()
+
+
+def _archive_catalog():
+    return request_cached('archive-catalog', lambda: list(
+        AcademicYearArchive.objects.order_by('start_date').values_list('academic_year', 'start_date', 'end_date')
+    ))
+
+
+def archived_years_between(start_date=None, end_date=None):
+    """Archived academic years overlapping [start_date, end_date] (open-ended when None)."""
+    # ISO dates compare correctly as strings, so query-string values work too.
+    return [
+        academic_year for academic_year, start, end in _archive_catalog()
+        if (not start_date or str(end) >= str(start_date)) and (not end_date or str(start) <= str(end_date))
+    ]
+
+
+def is_archived(academic_year):
+    return any(archived == academic_year for archived, _, _ in _archive_catalog())
+
+
+def attendance_querysets(start_date=None, end_date=None):
+    """
+    The hot Attendance manager plus one archive manager per archived year
+    the date range reaches into. Callers apply the same filters to each.
+    """
+    return [Attendance.objects] + [
+        archive_model(Attendance, academic_year).objects
+        for academic_year in archived_years_between(start_date, end_date)
+    ]
+
+
+def exam_result_manager(academic_year):
+    """ExamResult manager holding the results of ``academic_year``."""
+    if academic_year and is_archived(academic_year):
+        return archive_model(ExamResult, academic_year).objects
+    return ExamResult.objects
+
+
+def exam_result_managers():
+    return [ExamResult.objects] + [
+        archive_model(ExamResult, academic_year).objects for academic_year in archived_years_between()
+    ]
@@ -0,0 +1,150 @@
+import contextvars
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.http import Http404
+from django.urls import Resolver404, resolve
+from rest_framework.utils.encoders import JSONEncoder
+
+from .request_cache import request_cache_scope
+from .throttling import release_heavy_slot
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Routes that cannot run as a sub-request. The event stream is not a URLconf route at all.
+BATCH_EXCLUDED_URL_NAMES = ('batch-requests',)
+# Headers of the outer request that must not leak into sub-requests.
+BATCH_DROPPED_META = ('HTTP_IDEMPOTENCY_KEY', 'CONTENT_TYPE', 'CONTENT_LENGTH', 'QUERY_STRING', 'HTTP_X_PROFILE')
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_sub_requests(payload):
+    """Validate the ``requests`` list of a batch body into (id, method, path, query, body, headers) tuples."""
+    if not isinstance(payload, list) or not payload:
+        raise BatchError('requests must be a non-empty list')
+    limit = getattr(settings, 'BATCH_MAX_REQUESTS', BATCH_MAX_REQUESTS)
+    if len(payload) > limit:
+        raise BatchError(f'At most {limit} requests can be batched')
+    parsed = []
+    for index, item in enumerate(payload):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchError(f'requests[{index}] must be an object with a path')
+        method = str(item.get('method', 'GET')).upper()
+        if method not in BATCH_METHODS:
+            raise BatchError(f'requests[{index}].method must be one of {", ".join(BATCH_METHODS)}')
+        url = urlsplit(item['path'])
+        if not url.path.startswith('/main/'):
+            raise BatchError(f'requests[{index}].path must be a /main/ route')
+        headers = item.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise BatchError(f'requests[{index}].headers must be an object')
+        parsed.append((item.get('id', index), method, url.path, url.query, item.get('body'), headers))
+    return parsed
+
+
+def _build_request(outer, method, path, query, body, headers):
+    environ = {key: value for key, value in outer.META.items() if key not in BATCH_DROPPED_META}
+    content = json.dumps(body, cls=JSONEncoder).encode() if body is not None else b''
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': io.BytesIO(content),
+    })
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = str(value)
+    request = WSGIRequest(environ)
+    # DRF's forced authentication: sub-requests reuse the user and token the
+    # outer request already authenticated instead of decoding the JWT again.
+    request._force_auth_user = outer.user
+    request._force_auth_token = outer.auth
+    return request
+
+
+def _call_view(outer, match, sub_request):
+    """The rendered response of the sub-request's view, or its result dict when it fails."""
+    request_id, method, path, query, body, headers = sub_request
+    request = _build_request(outer, method, path, query, body, headers)
+    request.resolver_match = match
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+    except Http404:
+        return {'id': request_id, 'status': 404, 'body': {'detail': 'Not found.'}}
+    except Exception:
+        # One failing sub-request must not take the rest of the batch down.
+        logger.exception("Batched %s %s failed", method, path)
+        return {'id': request_id, 'status': 500, 'body': {'detail': 'Server error.'}}
+    finally:
+        # Sub-requests bypass the middleware, so give back any heavy-view slot here.
+        release_heavy_slot(request)
+    if getattr(response, 'streaming', False):
+        return {'id': request_id, 'status': 400, 'body': {'error': f'{path} returns a stream and cannot be batched'}}
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+def _run_one(outer, sub_request):
+    request_id, method, path, query, body, headers = sub_request
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return {'id': request_id, 'status': 404, 'body': {'detail': 'Not found.'}}
+    if match.url_name in BATCH_EXCLUDED_URL_NAMES:
+        return {'id': request_id, 'status': 400, 'body': {'error': f'{path} cannot be batched'}}
+
+    response = _call_view(outer, match, sub_request)
+    if isinstance(response, dict):
+        return response
+    content = response.content
+    try:
+        payload = json.loads(content) if content else None
+    except ValueError:
+        payload = content.decode(errors='replace')
+    result = {'id': request_id, 'status': response.status_code, 'body': payload}
+    if response.has_header('Retry-After'):
+        result['headers'] = {'Retry-After': response['Retry-After']}
+    return result
+
+
+def _run_in_thread(context, outer, sub_request):
+    try:
+        return context.run(_run_one, outer, sub_request)
+    finally:
+        # Worker threads open their own connections; do not leave them behind.
+        connections.close_all()
+
+
+def run_batch(outer, sub_requests, concurrent=False):
+    """
+    Run sub-requests against the resolved views in the outer request's
+    context and return their results in order. Every sub-request shares the
+    outer authentication and one request cache. ``concurrent`` runs them on a
+    small thread pool, but only when all of them are GETs; writes always run
+    one after another in the order given.
+    """
+    with request_cache_scope():
+        if concurrent and len(sub_requests) > 1 and all(sub[1] == 'GET' for sub in sub_requests):
+            workers = min(getattr(settings, 'BATCH_MAX_WORKERS', BATCH_MAX_WORKERS), len(sub_requests))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_run_in_thread, contextvars.copy_context(), outer, sub_request)
+                    for sub_request in sub_requests
+                ]
+                return [future.result() for future in futures]
+        return [_run_one(outer, sub_request) for sub_request in sub_requests]
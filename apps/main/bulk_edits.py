@@ -0,0 +1,295 @@
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import search
+from .archive import is_archived
+from .changelog import record_changes, INSERTED, UPDATED
+from .models import ClassSection, Exam, ExamResult, Fee, Student, Subject
+from .representation_cache import invalidate_representations
+
+BULK_EDIT_MAX_CHANGES = 1000
+# Rows per UPDATE statement; bulk_update writes one CASE WHEN per field.
+BULK_EDIT_BATCH_SIZE = 200
+
+STUDENT_EDIT_FIELDS = (
+    'admission_number', 'roll_number', 'date_of_birth', 'gender', 'address',
+    'guardian_name', 'guardian_phone', 'guardian_email', 'class_section', 'is_active',
+)
+# Student fields copied into the search index and into fee representations.
+STUDENT_SEARCH_FIELDS = frozenset(('admission_number', 'roll_number', 'guardian_name', 'guardian_phone'))
+STUDENT_FEE_FIELDS = frozenset(('admission_number', 'class_section'))
+EXAM_RESULT_KEY_FIELDS = ('exam', 'student', 'subject')
+EXAM_RESULT_EDIT_FIELDS = ('marks_obtained', 'max_marks', 'remarks')
+
+
+class BulkEditError(ValueError):
+    pass
+
+
+class BulkEditInvalid(Exception):
+    """Raised with the per-change errors when any change of a batch is invalid; nothing is written."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _check_changes(changes):
+    if not isinstance(changes, list) or not changes:
+        raise BulkEditError('changes must be a non-empty list')
+    if len(changes) > BULK_EDIT_MAX_CHANGES:
+        raise BulkEditError(f'At most {BULK_EDIT_MAX_CHANGES} changes can be applied at once')
+
+
+def _to_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _requested_ids(changes, field):
+    return {_to_id(change.get(field)) for change in changes if isinstance(change, dict)} - {None}
+
+
+def _set_values(instance, change, fields, related_ids, errors):
+    """
+    Clean the submitted ``fields`` of ``change`` like the model would and set
+    them on ``instance``; returns {field: [old, new]} for the values that
+    differ. Foreign keys are checked against ``related_ids`` (field -> ids
+    that exist) instead of one query per value.
+    """
+    diff = {}
+    for name in fields:
+        if name not in change:
+            continue
+        field = instance._meta.get_field(name)
+        value = change[name]
+        if isinstance(value, str):
+            value = value.strip()
+        if field.is_relation:
+            value = _to_id(value)
+            if value not in related_ids[name]:
+                errors[name] = [f'Invalid pk "{change[name]}" - object does not exist.']
+                continue
+        else:
+            try:
+                value = field.clean(value, instance)
+            except ValidationError as exc:
+                errors[name] = exc.messages
+                continue
+        old = getattr(instance, field.attname)
+        if value != old:
+            diff[name] = [old, value]
+            setattr(instance, field.attname, value)
+    return diff
+
+
+def _bulk_update(model, edits):
+    """bulk_update ``(instance, changed fields)`` pairs, one statement group per distinct field set."""
+    groups = defaultdict(list)
+    for instance, fields in edits:
+        groups[tuple(sorted(fields))].append(instance)
+    for fields, instances in groups.items():
+        model.objects.bulk_update(instances, fields, batch_size=BULK_EDIT_BATCH_SIZE)
+
+
+def bulk_update_students(changes):
+    """
+    Apply partial edits to many students at once. Each change names a
+    student by ``id`` and carries only the fields to change. All changes are
+    validated together, with one query per lookup rather than per row; if
+    any is invalid BulkEditInvalid lists the errors by index and nothing is
+    written. Otherwise only the fields that actually differ are written with
+    bulk_update in one transaction. Returns the per-student diff.
+    """
+    _check_changes(changes)
+    labels = {
+        class_section.id: Student.build_class_section_label(class_section)
+        for class_section in ClassSection.objects.filter(
+            pk__in=_requested_ids(changes, 'class_section')
+        ).select_related('class_name', 'section')
+    }
+    related_ids = {'class_section': labels.keys()}
+
+    with transaction.atomic():
+        students = Student.objects.select_for_update().in_bulk(_requested_ids(changes, 'id'))
+        errors = []
+        edits = []
+        seen = set()
+        for index, change in enumerate(changes):
+            if not isinstance(change, dict):
+                errors.append({'index': index, 'errors': {'change': ['Each change must be an object.']}})
+                continue
+            student = students.get(_to_id(change.get('id')))
+            if student is None:
+                errors.append({'index': index, 'errors': {'id': ['Unknown student.']}})
+                continue
+            if student.pk in seen:
+                errors.append({'index': index, 'errors': {'id': ['Student listed more than once.']}})
+                continue
+            seen.add(student.pk)
+            row_errors = {}
+            diff = _set_values(student, change, STUDENT_EDIT_FIELDS, related_ids, row_errors)
+            if row_errors:
+                errors.append({'index': index, 'errors': row_errors})
+            else:
+                edits.append((index, student, diff))
+
+        # Admission numbers must stay unique across the batch and the rest of the table.
+        numbers = defaultdict(list)
+        for index, student, _ in edits:
+            numbers[student.admission_number].append(index)
+        taken = set(Student.objects.filter(admission_number__in=numbers).exclude(
+            pk__in=seen).values_list('admission_number', flat=True))
+        for number, indexes in numbers.items():
+            if number in taken or len(indexes) > 1:
+                errors.extend(
+                    {'index': index, 'errors': {'admission_number': ['Student with this admission number already exists.']}}
+                    for index in indexes
+                )
+        if errors:
+            raise BulkEditInvalid(sorted(errors, key=lambda error: error['index']))
+
+        edits = [(index, student, diff) for index, student, diff in edits if diff]
+        for _, student, diff in edits:
+            if 'class_section' in diff:
+                # bulk_update skips the pre_save signal that keeps the label in sync.
+                student.class_section_label = labels[student.class_section_id]
+        _bulk_update(Student, [
+            (student, [Student._meta.get_field(name).attname for name in diff]
+             + (['class_section_label'] if 'class_section' in diff else []))
+            for _, student, diff in edits
+        ])
+        _students_updated(edits)
+
+    return {
+        'updated': len(edits),
+        'unchanged': len(changes) - len(edits),
+        'changes': [{'id': student.pk, 'changes': diff} for _, student, diff in edits],
+    }
+
+
+def _students_updated(edits):
+    # bulk_update skips the signals that normally do this.
+    student_ids = [student.pk for _, student, _ in edits]
+    changed = defaultdict(set)
+    for _, student, diff in edits:
+        for name in diff:
+            changed[name].add(student.pk)
+    invalidate_representations(Student, student_ids)
+    record_changes(Student, student_ids, UPDATED)
+    fee_students = set().union(*(changed[name] for name in STUDENT_FEE_FIELDS))
+    if fee_students:
+        # Fees embed the student's admission number and class section.
+        record_changes(Fee, Fee.objects.filter(student_id__in=fee_students).values_list('id', flat=True))
+    if changed['class_section'] or changed['is_active']:
+        # Class sections show student counts.
+        invalidate_representations(ClassSection, ClassSection.objects.values_list('id', flat=True))
+    if changed['class_section']:
+        # Per-class exam analytics are keyed on the exams' results version.
+        exam_ids = set(ExamResult.objects.filter(
+            student_id__in=changed['class_section']).values_list('exam_id', flat=True))
+        Exam.bump_results_version(exam_ids)
+    search.index_profiles(set().union(*(changed[name] for name in STUDENT_SEARCH_FIELDS)))
+
+
+def upsert_exam_results(changes):
+    """
+    Create or update many exam results at once, matched on (exam, student,
+    subject), so resubmitting a mark sheet updates rows instead of failing
+    on the unique constraint. New results need marks_obtained and max_marks;
+    existing ones take partial edits. Validation and writes work as in
+    bulk_update_students, with new rows added by one bulk_create. Results of
+    archived academic years cannot be edited. Returns the per-result diff.
+    """
+    _check_changes(changes)
+    exam_years = dict(Exam.objects.filter(pk__in=_requested_ids(changes, 'exam')).values_list('id', 'academic_year'))
+    related_ids = {
+        'exam': {exam_id for exam_id, year in exam_years.items() if not is_archived(year)},
+        'student': set(Student.objects.filter(pk__in=_requested_ids(changes, 'student')).values_list('id', flat=True)),
+        'subject': set(Subject.objects.filter(pk__in=_requested_ids(changes, 'subject')).values_list('id', flat=True)),
+    }
+
+    with transaction.atomic():
+        # A superset of the rows the changes refer to; matched exactly below.
+        existing = {
+            (result.exam_id, result.student_id, result.subject_id): result
+            for result in ExamResult.objects.select_for_update().filter(
+                exam_id__in=related_ids['exam'],
+                student_id__in=related_ids['student'],
+                subject_id__in=related_ids['subject'],
+            )
+        }
+        errors = []
+        edits = []
+        seen = set()
+        for index, change in enumerate(changes):
+            if not isinstance(change, dict):
+                errors.append({'index': index, 'errors': {'change': ['Each change must be an object.']}})
+                continue
+            row_errors = {}
+            key = ExamResult()
+            _set_values(key, change, EXAM_RESULT_KEY_FIELDS, related_ids, row_errors)
+            for name in EXAM_RESULT_KEY_FIELDS:
+                if name not in change:
+                    row_errors[name] = ['This field is required.']
+                elif name == 'exam' and name in row_errors and _to_id(change[name]) in exam_years:
+                    row_errors[name] = ['Results of archived academic years cannot be edited.']
+            if row_errors:
+                errors.append({'index': index, 'errors': row_errors})
+                continue
+            key = (key.exam_id, key.student_id, key.subject_id)
+            if key in seen:
+                errors.append({'index': index, 'errors': {'non_field_errors': ['Result listed more than once.']}})
+                continue
+            seen.add(key)
+
+            result = existing.get(key)
+            created = result is None
+            if created:
+                result = ExamResult(exam_id=key[0], student_id=key[1], subject_id=key[2])
+                row_errors.update({
+                    name: ['This field is required.'] for name in ('marks_obtained', 'max_marks') if name not in change
+                })
+            diff = _set_values(result, change, EXAM_RESULT_EDIT_FIELDS, related_ids, row_errors)
+            if not row_errors and result.max_marks <= 0:
+                row_errors['max_marks'] = ['Ensure this value is greater than 0.']
+            elif not row_errors and not 0 <= result.marks_obtained <= result.max_marks:
+                row_errors['marks_obtained'] = ['Ensure this value is between 0 and max_marks.']
+            if row_errors:
+                errors.append({'index': index, 'errors': row_errors})
+            else:
+                edits.append((result, created, diff))
+        if errors:
+            raise BulkEditInvalid(errors)
+
+        new_results = [result for result, created, _ in edits if created]
+        ExamResult.objects.bulk_create(new_results, batch_size=BULK_EDIT_BATCH_SIZE)
+        updated = [(result, diff) for result, created, diff in edits if not created and diff]
+        _bulk_update(ExamResult, [(result, list(diff)) for result, diff in updated])
+
+        # bulk_create and bulk_update skip the signals that normally do this.
+        exam_ids = {result.exam_id for result in new_results} | {result.exam_id for result, _ in updated}
+        Exam.bump_results_version(exam_ids)
+        # Exams report result counts, so their synced representation changed too.
+        record_changes(Exam, exam_ids)
+
+    return {
+        'created': len(new_results),
+        'updated': len(updated),
+        'unchanged': len(changes) - len(new_results) - len(updated),
+        'changes': [
+            {'id': result.pk, 'action': INSERTED, 'changes': {name: [None, value] for name, value in (
+                ('exam', result.exam_id), ('student', result.student_id), ('subject', result.subject_id),
+                ('marks_obtained', result.marks_obtained), ('max_marks', result.max_marks),
+                ('remarks', result.remarks),
+            )}}
+            for result in new_results
+        ] + [
+            {'id': result.pk, 'action': UPDATED, 'changes': diff}
+            for result, diff in updated
+        ],
+    }
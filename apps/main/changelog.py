@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, Max, OuterRef
+from django.utils.timezone import now
+
+from .models import ChangeLogEntry, Exam, Fee, Student, Teacher
+
+INSERTED, UPDATED, DELETED = 'INS', 'UPD', 'DEL'
+SYNC_MODELS = OrderedDict([
+    ('students', Student),
+    ('teachers', Teacher),
+    ('exams', Exam),
+    ('fees', Fee),
+])
+SYNC_KEYS = {model: key for key, model in SYNC_MODELS.items()}
+SYNC_PAGE_SIZE = 1000
+SYNC_MAX_PAGE_SIZE = 10000
+
+
+def record_changes(model, pks, action=UPDATED):
+    """
+    Append change log entries for ``pks``; models that are not synced are
+    ignored so callers can pass anything they already invalidate. SQLite
+    serializes writers, so entry ids become visible in increasing order and
+    a client never skips past an entry that has not committed yet.
+    """
+    key = SYNC_KEYS.get(model)
+    pks = set(pks)
+    if key and pks:
+        ChangeLogEntry.objects.bulk_create(
+            [ChangeLogEntry(model=key, object_id=pk, action=action) for pk in pks]
+        )
+
+
+def current_cursor():
+    return ChangeLogEntry.objects.aggregate(cursor=Max('id'))['cursor'] or 0
+
+
+def collect_changes(since, limit=SYNC_PAGE_SIZE):
+    """
+    Collapse up to ``limit`` log entries after ``since`` into per-model
+    inserted/updated/deleted id lists. An object inserted and deleted within
+    the window is dropped; one inserted and then updated counts as inserted.
+    Returns (changes, cursor, has_more).
+    """
+    entries = list(
+        ChangeLogEntry.objects.filter(id__gt=since).order_by('id')
+        .values_list('id', 'model', 'object_id', 'action')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    first_action, last_action = {}, {}
+    for _, model, object_id, action in entries:
+        first_action.setdefault((model, object_id), action)
+        last_action[(model, object_id)] = action
+
+    changes = {key: {'inserted': [], 'updated': [], 'deleted': []} for key in SYNC_MODELS}
+    for (model, object_id), action in last_action.items():
+        if model not in changes:
+            continue
+        inserted = first_action[(model, object_id)] == INSERTED
+        if action == DELETED:
+            if not inserted:
+                changes[model]['deleted'].append(object_id)
+        elif inserted:
+            changes[model]['inserted'].append(object_id)
+        else:
+            changes[model]['updated'].append(object_id)
+    cursor = entries[-1][0] if entries else since
+    return changes, cursor, has_more
+
+
+def compact_change_log(older_than=None):
+    """
+    Delete entries older than ``older_than`` (default CHANGE_LOG_COMPACT_AFTER)
+    that a later entry for the same object supersedes. Every object keeps its
+    latest entry, so syncing from any cursor still converges; only the
+    inserted/updated distinction is lost for very old cursors.
+    """
+    if older_than is None:
+        older_than = timedelta(days=getattr(settings, 'CHANGE_LOG_COMPACT_AFTER_DAYS', 7))
+    superseded = ChangeLogEntry.objects.filter(
+        model=OuterRef('model'), object_id=OuterRef('object_id'), id__gt=OuterRef('id')
+    )
+    deleted, _ = ChangeLogEntry.objects.filter(
+        Exists(superseded), created_at__lt=now() - older_than
+    ).delete()
+    return deleted
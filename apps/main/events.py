@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import threading
+from itertools import count
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = '/main/events/'
+KEEPALIVE_INTERVAL = 15
+MAX_PENDING_EVENTS = 1000
+
+
+class Subscription:
+    """
+    One connected client. Events are coalesced by key while the client is
+    between flushes: attendance statuses of the same section and day merge
+    into one event, and a fee only keeps its latest state. A client that
+    falls further behind than MAX_PENDING_EVENTS keys gets a single
+    'resync' event instead of an ever growing backlog.
+    """
+
+    def __init__(self, loop, class_section=None):
+        self.loop = loop
+        self.class_section = class_section
+        self.pending = {}
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def push(self, key, event):
+        # Runs on the subscriber's event loop.
+        if self.overflowed:
+            return
+        current = self.pending.get(key)
+        if current is not None and 'statuses' in event['data']:
+            current['data']['statuses'].update(event['data']['statuses'])
+        elif len(self.pending) >= MAX_PENDING_EVENTS:
+            self.pending.clear()
+            self.overflowed = True
+        else:
+            self.pending[key] = event
+        self.ready.set()
+
+    async def batches(self, window=None, keepalive=KEEPALIVE_INTERVAL):
+        """Yield lists of coalesced events; an empty list means nothing happened for ``keepalive`` seconds."""
+        if window is None:
+            window = getattr(settings, 'EVENT_COALESCE_WINDOW', 0.5)
+        while True:
+            try:
+                await asyncio.wait_for(self.ready.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield []
+                continue
+            if window:
+                await asyncio.sleep(window)
+            self.ready.clear()
+            if self.overflowed:
+                self.overflowed = False
+                yield [{'type': 'resync', 'data': {}}]
+                continue
+            events, self.pending = list(self.pending.values()), {}
+            yield events
+
+
+class Broadcaster:
+    """
+    In-process fan-out from model signals to event-stream subscribers.
+    publish() may be called from any thread; it hands the event to each
+    event loop with one call_soon_threadsafe, and the loop then pushes it
+    to its own subscribers. Only clients connected to the same worker
+    process see an event.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._ids = count(1)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscriber_count(self):
+        return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def subscribe(self, class_section=None):
+        subscription = Subscription(asyncio.get_running_loop(), class_section)
+        with self._lock:
+            self._subscribers.setdefault(subscription.loop, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.loop, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscribers.pop(subscription.loop, None)
+
+    def publish(self, event_type, key, data, class_section=None):
+        event = {'id': next(self._ids), 'type': event_type, 'data': data}
+        with self._lock:
+            loops = [(loop, list(subscriptions)) for loop, subscriptions in self._subscribers.items()]
+        for loop, subscriptions in loops:
+            try:
+                loop.call_soon_threadsafe(self._deliver, subscriptions, (event_type, key), event, class_section)
+            except RuntimeError:  # loop already closed
+                with self._lock:
+                    self._subscribers.pop(loop, None)
+
+    @staticmethod
+    def _deliver(subscriptions, key, event, class_section):
+        statuses = event['data'].get('statuses')
+        for subscription in subscriptions:
+            if subscription.class_section and subscription.class_section != class_section:
+                continue
+            if statuses is not None:
+                # Subscribers merge statuses into their pending event, so each needs its own dict.
+                subscription.push(key, {**event, 'data': {**event['data'], 'statuses': dict(statuses)}})
+            else:
+                subscription.push(key, event)
+
+
+broadcaster = Broadcaster()
+
+
+def format_event(event):
+    message = f"event: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+    if 'id' in event:
+        message = f"id: {event['id']}\n" + message
+    return message.encode()
+
+
+def _authenticate(raw_token):
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def _send_json(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+async def sse_application(scope, receive, send):
+    """
+    ASGI app for GET /main/events/: a text/event-stream of attendance and fee
+    events for staff users. The access token comes from the Authorization
+    header or, for browser EventSource clients that cannot set headers, the
+    access_token query parameter. ?class_section=<id> narrows the stream.
+    """
+    if scope['method'] != 'GET':
+        return await _send_json(send, 405, {'detail': 'Method not allowed.'})
+    query = parse_qs(scope.get('query_string', b'').decode())
+    raw_token = query.get('access_token', [None])[0]
+    for name, value in scope['headers']:
+        if name == b'authorization' and value.lower().startswith(b'bearer '):
+            raw_token = value[7:].decode()
+    user = await sync_to_async(_authenticate)(raw_token) if raw_token else None
+    if user is None:
+        return await _send_json(send, 401, {'detail': 'Authentication credentials were not provided.'})
+    if not user.is_staff:
+        return await _send_json(send, 403, {'detail': 'Staff access required.'})
+    try:
+        class_section = int(query['class_section'][0]) if 'class_section' in query else None
+    except ValueError:
+        return await _send_json(send, 400, {'error': 'class_section must be an integer'})
+
+    subscription = broadcaster.subscribe(class_section)
+
+    async def stream():
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        async for events in subscription.batches():
+            body = b''.join(format_event(event) for event in events) if events else b': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    sender = asyncio.ensure_future(stream())
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        broadcaster.unsubscribe(subscription)
+        for task in (sender, watcher):
+            task.cancel()
+
+
+def attendance_event(attendance, deleted=False):
+    class_section = attendance.student.class_section_id
+    return (
+        'attendance', (class_section, str(attendance.date)),
+        {
+            'class_section': class_section,
+            'date': str(attendance.date),
+            'statuses': {str(attendance.student_id): None if deleted else attendance.status},
+        },
+        class_section,
+    )
+
+
+def fee_event(fee):
+    class_section = fee.student.class_section_id
+    return (
+        'fee', fee.pk,
+        {
+            'fee': fee.pk,
+            'student': fee.student_id,
+            'class_section': class_section,
+            'status': fee.status,
+            'amount': str(fee.amount),
+            'paid_amount': str(fee.paid_amount),
+            'paid_date': str(fee.paid_date) if fee.paid_date else None,
+        },
+        class_section,
+    )
+
+
+def publish_on_commit(build_event, *args):
+    """
+    Build an event now, while the rows it reads still exist (a cascade may
+    delete the student before the commit), and publish it once the
+    transaction commits. Events are best effort: failures are logged and
+    never fail the write that caused them.
+    """
+    try:
+        event_type, key, data, class_section = build_event(*args)
+    except Exception:
+        logger.exception('Could not build %s', build_event.__name__)
+        return
+
+    def publish():
+        try:
+            broadcaster.publish(event_type, key, data, class_section=class_section)
+        except Exception:
+            logger.exception('Could not publish %s event', event_type)
+
+    transaction.on_commit(publish)
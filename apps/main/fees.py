@@ -0,0 +1,283 @@
+import csv
+import os
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Round
+from django.utils.timezone import now
+
+from .models import Fee, FeeSchedule, Student
+from .representation_cache import invalidate_representations
+from .changelog import record_changes, INSERTED
+from .events import broadcaster, fee_event, publish_on_commit
+
+FEE_BULK_CHUNK_SIZE = 1000
+
+
+def _schedule_students(schedule):
+    students = Student.objects.filter(is_active=True, class_section__academic_year=schedule.academic_year)
+    if schedule.class_section_id:
+        return students.filter(class_section_id=schedule.class_section_id)
+    return students.filter(class_section__class_name_id=schedule.class_name_id)
+
+
+def generate_term_fees(academic_year, schedule_ids=None, dry_run=False, chunk_size=FEE_BULK_CHUNK_SIZE):
+    """
+    Materialize a Fee row for every active student covered by the active
+    fee schedules of ``academic_year``. Fees already generated from a
+    schedule are skipped, so rerunning is safe. Everything is written with
+    chunked bulk_create inside one transaction, and the return value
+    reports created/skipped counts per schedule.
+    """
+    schedules = FeeSchedule.objects.filter(academic_year=academic_year, is_active=True).order_by('id')
+    if schedule_ids:
+        schedules = schedules.filter(pk__in=schedule_ids)
+
+    report = {'academic_year': academic_year, 'dry_run': dry_run, 'created': 0, 'skipped': 0, 'schedules': []}
+    with transaction.atomic():
+        for schedule in schedules:
+            student_ids = list(_schedule_students(schedule).values_list('id', flat=True))
+            existing = set(Fee.objects.filter(schedule=schedule).values_list('student_id', flat=True))
+            new_fees = [
+                Fee(
+                    student_id=student_id, schedule=schedule, fee_type=schedule.fee_type,
+                    amount=schedule.amount, due_date=schedule.due_date,
+                )
+                for student_id in student_ids if student_id not in existing
+            ]
+            skipped = len(student_ids) - len(new_fees)
+            if not dry_run:
+                Fee.objects.bulk_create(new_fees, batch_size=chunk_size)
+                # bulk_create skips the signals that normally do this.
+                invalidate_representations(Student, [fee.student_id for fee in new_fees])
+                record_changes(Student, [fee.student_id for fee in new_fees])
+                record_changes(Fee, [fee.pk for fee in new_fees], INSERTED)
+
+            report['schedules'].append({
+                'schedule': schedule.id,
+                'description': str(schedule),
+                'created': len(new_fees),
+                'skipped': skipped,
+            })
+            report['created'] += len(new_fees)
+            report['skipped'] += skipped
+    return report
+
+
+def apply_fee_payment(fee, amount, payment_method=''):
+    """
+    Add ``amount`` to the fee's paid_amount with one conditional UPDATE, so
+    payments recorded at the same time add up instead of overwriting each
+    other. Returns False without writing anything when ``amount`` is more
+    than the balance left in the database; otherwise ``fee`` is reloaded.
+    """
+    # Rounding keeps SQLite's float arithmetic from drifting off the cents.
+    updated = Fee.objects.filter(pk=fee.pk, amount=fee.amount, paid_amount__lte=fee.amount - amount).update(
+        paid_amount=Round(F('paid_amount') + amount, 2),
+        status=Case(When(paid_amount__gte=fee.amount - amount, then=Value('PAI')), default=F('status')),
+        paid_date=now().date(),
+        payment_method=payment_method,
+    )
+    if not updated:
+        return False
+    fee.refresh_from_db()
+    # update() skips the signals that normally do this.
+    invalidate_representations(Student, [fee.student_id])
+    record_changes(Student, [fee.student_id])
+    record_changes(Fee, [fee.pk])
+    if broadcaster.has_subscribers():
+        publish_on_commit(fee_event, fee)
+    return True
+
+
+RECONCILE_BATCH_SIZE = 500
+RECONCILE_OUTCOMES = ('matched', 'partial', 'overpaid', 'unmatched')
+RECONCILE_REPORT_FIELDS = (
+    'line', 'reference', 'admission_number', 'amount', 'date',
+    'fee_ids', 'unapplied_amount', 'reason',
+)
+
+
+def _parse_statement_line(row):
+    reference = (row.get('reference') or row.get('receipt_number') or '').strip()
+    admission_number = (row.get('admission_number') or '').strip()
+    try:
+        amount = Decimal((row.get('amount') or '').replace(',', '').strip())
+    except InvalidOperation:
+        amount = None
+    try:
+        paid_date = datetime.strptime((row.get('date') or '').strip(), '%Y-%m-%d').date()
+    except ValueError:
+        paid_date = now().date()
+    return reference, admission_number, amount, paid_date
+
+
+class OutstandingFeeIndex:
+    """
+    In-memory lookup of every unpaid fee, loaded with one values_list query:
+    by receipt number and, per admission number, in due-date order. Balances
+    are tracked here as lines are applied, so a payment that appears twice in
+    a statement is never applied past the fee amount.
+    """
+
+    def __init__(self):
+        self.student_id = {}
+        self.amount = {}
+        self.paid_amount = {}
+        self.status = {}
+        self.receipt_number = {}
+        self.by_receipt = {}
+        self.by_admission_number = defaultdict(list)
+        rows = (
+            Fee.objects.filter(status__in=('PEN', 'OVE'))
+            .order_by('due_date', 'id')
+            .values_list(
+                'id', 'student_id', 'amount', 'paid_amount', 'status', 'receipt_number', 'student__admission_number'
+            )
+        )
+        for fee_id, student_id, amount, paid_amount, status, receipt_number, admission_number in rows.iterator(chunk_size=5000):
+            self.student_id[fee_id] = student_id
+            self.amount[fee_id] = amount
+            self.paid_amount[fee_id] = paid_amount
+            self.status[fee_id] = status
+            self.receipt_number[fee_id] = receipt_number
+            if receipt_number:
+                self.by_receipt[receipt_number] = fee_id
+            self.by_admission_number[admission_number].append(fee_id)
+
+    def outstanding(self, fee_id):
+        return self.amount[fee_id] - self.paid_amount[fee_id]
+
+    def candidates(self, reference, admission_number, amount):
+        """
+        Fees a payment should go to, in application order: the fee with the
+        matching receipt number, else the student's open fees with an exact
+        balance match first and the rest oldest first.
+        """
+        fee_id = self.by_receipt.get(reference) if reference else None
+        if fee_id is not None and self.outstanding(fee_id) > 0:
+            return [fee_id]
+        open_fees = [
+            fee_id for fee_id in self.by_admission_number.get(admission_number, ())
+            if self.outstanding(fee_id) > 0
+        ]
+        exact = [fee_id for fee_id in open_fees if self.outstanding(fee_id) == amount][:1]
+        return exact + [fee_id for fee_id in open_fees if fee_id not in exact]
+
+
+def _flush_payments(index, pending, lines, writers, summary, payment_method, dry_run):
+    """
+    Write the payments buffered for a batch of statement lines, then report
+    those lines. Each fee is raised by what the batch applied to it, and only
+    while that still fits its balance: a fee paid elsewhere since the index
+    was loaded is left alone, and the money meant for it is reported as
+    unapplied on the lines that went to it.
+    """
+    rejected = set()
+    if pending and not dry_run:
+        # One short UPDATE per fee; rowcount tells which fees the guard refused.
+        with transaction.atomic(), connection.cursor() as cursor:
+            for fee_id, (applied, paid_date, receipt_number) in pending.items():
+                cursor.execute(
+                    f"UPDATE {Fee._meta.db_table} SET paid_amount = ROUND(paid_amount + %s, 2), "
+                    f"status = CASE WHEN ROUND(paid_amount + %s, 2) >= amount THEN 'PAI' ELSE status END, "
+                    f"paid_date = %s, payment_method = %s, "
+                    f"receipt_number = CASE WHEN receipt_number = '' THEN %s ELSE receipt_number END "
+                    f"WHERE id = %s AND ROUND(paid_amount + %s, 2) <= amount",
+                    [applied, applied, paid_date, payment_method, receipt_number, fee_id, applied]
+                )
+                if not cursor.rowcount:
+                    rejected.add(fee_id)
+                    # Treat it as settled so later lines move on to other fees.
+                    index.paid_amount[fee_id] = index.amount[fee_id]
+        written = [fee_id for fee_id in pending if fee_id not in rejected]
+        invalidate_representations(Student, [index.student_id[fee_id] for fee_id in written])
+        record_changes(Student, [index.student_id[fee_id] for fee_id in written])
+        record_changes(Fee, written)
+
+    for record, outcome, applications, remaining in lines:
+        applied_to = [fee_id for fee_id, _ in applications if fee_id not in rejected]
+        if len(applied_to) < len(applications):
+            remaining += sum(applied for fee_id, applied in applications if fee_id in rejected)
+            record['reason'] = 'fee was paid during reconciliation'
+            outcome = 'overpaid'
+        if outcome == 'overpaid':
+            record['unapplied_amount'] = remaining
+        record['fee_ids'] = ' '.join(str(fee_id) for fee_id in applied_to)
+        summary['applied_amount'] += sum(applied for fee_id, applied in applications if fee_id not in rejected)
+        writers[outcome].writerow(record)
+        summary[outcome] += 1
+    pending.clear()
+    lines.clear()
+
+
+def reconcile_payments(rows, output_dir, payment_method='Bank transfer', dry_run=False, batch_size=RECONCILE_BATCH_SIZE):
+    """
+    Apply bank statement lines (dicts with amount, date, reference and/or
+    admission_number) to outstanding fees. Lines are streamed; touched fees
+    are written back every ``batch_size`` lines with guarded UPDATEs in a
+    short transaction. matched.csv, partial.csv, overpaid.csv (money left
+    over once the fees were paid) and unmatched.csv are written to
+    ``output_dir`` and a summary with their paths is returned.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    index = OutstandingFeeIndex()
+    pending = {}
+    lines = []
+    summary = {outcome: 0 for outcome in RECONCILE_OUTCOMES}
+    summary.update({'lines': 0, 'applied_amount': Decimal(0), 'dry_run': dry_run, 'reports': {}})
+
+    handles = {outcome: open(os.path.join(output_dir, f'{outcome}.csv'), 'w', newline='') for outcome in RECONCILE_OUTCOMES}
+    try:
+        writers = {outcome: csv.DictWriter(handle, fieldnames=RECONCILE_REPORT_FIELDS) for outcome, handle in handles.items()}
+        for writer in writers.values():
+            writer.writeheader()
+
+        for line_number, row in enumerate(rows, start=1):
+            reference, admission_number, amount, paid_date = _parse_statement_line(row)
+            record = {
+                'line': line_number, 'reference': reference, 'admission_number': admission_number,
+                'amount': row.get('amount'), 'date': paid_date, 'fee_ids': '', 'unapplied_amount': '', 'reason': '',
+            }
+            summary['lines'] += 1
+
+            fee_ids = index.candidates(reference, admission_number, amount) if amount and amount > 0 else []
+            remaining = amount
+            applications = []
+            for fee_id in fee_ids:
+                if remaining <= 0:
+                    break
+                applied = min(remaining, index.outstanding(fee_id))
+                remaining -= applied
+                index.paid_amount[fee_id] += applied
+                if reference and not index.receipt_number[fee_id]:
+                    index.receipt_number[fee_id] = reference
+                applications.append((fee_id, applied))
+                total = pending[fee_id][0] + applied if fee_id in pending else applied
+                pending[fee_id] = (total, paid_date.isoformat(), index.receipt_number[fee_id])
+
+            if not applications:
+                record['reason'] = 'invalid amount' if not amount or amount <= 0 else 'no outstanding fee found'
+                outcome = 'unmatched'
+            elif remaining > 0:
+                record['reason'] = 'payment exceeds outstanding balance'
+                outcome = 'overpaid'
+            elif index.outstanding(applications[-1][0]) > 0:
+                outcome = 'partial'
+            else:
+                outcome = 'matched'
+            lines.append((record, outcome, applications, remaining))
+
+            if len(lines) >= batch_size:
+                _flush_payments(index, pending, lines, writers, summary, payment_method, dry_run)
+        _flush_payments(index, pending, lines, writers, summary, payment_method, dry_run)
+    finally:
+        for outcome, handle in handles.items():
+            handle.close()
+            summary['reports'][outcome] = handle.name
+
+    summary['applied_amount'] = str(summary['applied_amount'])
+    return summary
@@ -0,0 +1,55 @@
+from django.db.models import Case, CharField, F, FloatField, Func, Value, When
+
+# Grade bands shared by serializers, analytics and queryset annotations.
+# Each entry is (minimum percentage, grade); anything below the last band is an F.
+GRADE_BANDS = (
+    (90, 'A+'),
+    (80, 'A'),
+    (70, 'B'),
+    (60, 'C'),
+    (50, 'D'),
+)
+FAIL_GRADE = 'F'
+GRADES = tuple(grade for _, grade in GRADE_BANDS) + (FAIL_GRADE,)
+PASS_PERCENTAGE = GRADE_BANDS[-1][0]
+
+
+def grade_for_percentage(percentage):
+    # Pass the unrounded percentage: grade_expression() and the
+    # grade_percentage_range() filters grade the exact value as well.
+    for minimum, grade in GRADE_BANDS:
+        if percentage >= minimum:
+            return grade
+    return FAIL_GRADE
+
+
+def grade_percentage_range(grade):
+    """
+    Return the (minimum, upper bound) percentage range of ``grade``; the
+    upper bound is None for the top band. Filtering on this range instead of
+    on the grade expression lets the database use the percentage index.
+    """
+    upper = None
+    for minimum, band_grade in GRADE_BANDS:
+        if band_grade == grade:
+            return minimum, upper
+        upper = minimum
+    return None, upper
+
+
+def percentage_expression():
+    # The 100.0 factor is written into the SQL instead of being bound as a
+    # parameter, otherwise queries would not match the expression index.
+    return Func(
+        F('marks_obtained'), F('max_marks'),
+        template='(%(expressions)s)', arg_joiner=' * 100.0 / ',
+        output_field=FloatField(),
+    )
+
+
+def grade_expression(percentage='percentage'):
+    return Case(
+        *[When(**{f'{percentage}__gte': minimum}, then=Value(grade)) for minimum, grade in GRADE_BANDS],
+        default=Value(FAIL_GRADE),
+        output_field=CharField(),
+    )
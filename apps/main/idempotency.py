@@ -0,0 +1,106 @@
+import hashlib
+import json
+import random
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connections, router
+from django.utils.timezone import now
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_CACHE = 'idempotency'
+IDEMPOTENCY_TTL = 60 * 60 * 24
+# Lifetime of the in-progress lock. It outlasts the slowest idempotent write,
+# and a lock left by a crashed worker expires after it so the key can be retried.
+IDEMPOTENCY_LOCK_TTL = 5 * 60
+# Share of stored responses that also delete expired keys.
+IDEMPOTENCY_PURGE_RATE = 0.01
+IN_PROGRESS = '__in_progress__'
+
+IDEMPOTENCY_KEY_PARAMETER = openapi.Parameter(
+    IDEMPOTENCY_HEADER, openapi.IN_HEADER, type=openapi.TYPE_STRING,
+    description="Client-generated key; retries with the same key replay the first response"
+)
+
+
+def _fingerprint(request):
+    return hashlib.sha256(json.dumps(request.data, cls=JSONEncoder, sort_keys=True).encode()).hexdigest()
+
+
+def purge_expired_keys():
+    """
+    Delete expired entries from the idempotency cache and return how many
+    went. The database cache skips them on read but only deletes them once
+    MAX_ENTRIES is exceeded; other backends drop them on their own.
+    """
+    cache = caches[IDEMPOTENCY_CACHE]
+    if not isinstance(cache, DatabaseCache):
+        return 0
+    connection = connections[router.db_for_write(cache.cache_model_class)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {connection.ops.quote_name(cache._table)} WHERE {connection.ops.quote_name('expires')} < %s",
+            [connection.ops.adapt_datetimefield_value(now().replace(microsecond=0))]
+        )
+        return cursor.rowcount
+
+
+def idempotent(view):
+    """
+    Make a write view safe to retry. When the request carries an
+    Idempotency-Key header, the first response (anything below 500) is kept
+    in the idempotency cache for IDEMPOTENCY_TTL and returned as-is on
+    replays without running the view. A concurrent request with the same key
+    gets 409 while the first is in flight; reusing a key with a different
+    body gets 422. Place it directly above the view function, under
+    @api_view and @permission_classes.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+
+        cache = caches[IDEMPOTENCY_CACHE]
+        user_id = request.user.pk if request.user.is_authenticated else 'anon'
+        cache_key = 'idem:' + hashlib.sha256(f'{user_id}:{request.method}:{request.path}:{key}'.encode()).hexdigest()
+        fingerprint = _fingerprint(request)
+
+        # cache.add is atomic, so only one request can take the key.
+        if not cache.add(cache_key, IN_PROGRESS, IDEMPOTENCY_LOCK_TTL):
+            stored = cache.get(cache_key)
+            if stored is None or stored == IN_PROGRESS:
+                return Response(
+                    {'error': 'A request with this Idempotency-Key is still being processed'},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={'Retry-After': '1'}
+                )
+            if stored['fingerprint'] != fingerprint:
+                return Response(
+                    {'error': 'Idempotency-Key was already used with a different request body'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            return Response(stored['data'], status=stored['status'], headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+        if response.status_code >= 500:
+            cache.delete(cache_key)
+            return response
+        cache.set(cache_key, {
+            'fingerprint': fingerprint,
+            'status': response.status_code,
+            'data': json.loads(json.dumps(response.data, cls=JSONEncoder)),
+        }, IDEMPOTENCY_TTL)
+        if random.random() < IDEMPOTENCY_PURGE_RATE:
+            purge_expired_keys()
+        return response
+    return wrapper
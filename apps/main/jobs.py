@@ -0,0 +1,232 @@
+import csv
+import logging
+import os
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Task name -> callable(job, **params). The callable may report progress with
+# job.set_progress() and returns a JSON-serializable result (or None).
+TASKS = {}
+# Task name -> name of the param holding the task's uploaded input file.
+TASK_UPLOADS = {}
+# Where task inputs uploaded through the API are saved, relative to MEDIA_ROOT.
+JOB_UPLOAD_DIR = os.path.join('jobs', 'uploads')
+
+RETRY_BASE_DELAY = 30
+# Per-row errors kept in an onboarding job's result; all of them go to errors.csv.
+ONBOARD_RESULT_ERRORS = 100
+
+
+def task(name, upload=None):
+    def register(func):
+        TASKS[name] = func
+        if upload:
+            TASK_UPLOADS[name] = upload
+        return func
+    return register
+
+
+def job_upload_path(path):
+    """
+    Absolute path of an uploaded task input given relative to MEDIA_ROOT.
+    Raises ValueError unless it resolves to a file under JOB_UPLOAD_DIR, so
+    job params cannot point a task at any other file on the server.
+    """
+    uploads = os.path.realpath(os.path.join(settings.MEDIA_ROOT, JOB_UPLOAD_DIR))
+    resolved = os.path.realpath(os.path.join(settings.MEDIA_ROOT, str(path)))
+    if resolved == uploads or os.path.commonpath([uploads, resolved]) != uploads:
+        raise ValueError(f"{path!r} is not a file under {JOB_UPLOAD_DIR}")
+    return resolved
+
+
+def _remove_upload(job):
+    # The uploaded input is only needed until the job's last attempt.
+    param = TASK_UPLOADS.get(job.task)
+    if not param:
+        return
+    try:
+        os.remove(job_upload_path(job.params.get(param, '')))
+    except (OSError, ValueError):
+        logger.warning("Could not remove the uploaded input of job %s", job.pk, exc_info=True)
+
+
+def submit_job(task_name, params=None, user=None, max_attempts=3):
+    if task_name not in TASKS:
+        raise ValueError(f"Unknown task '{task_name}'")
+    if task_name in TASK_UPLOADS:
+        job_upload_path((params or {}).get(TASK_UPLOADS[task_name], ''))
+    return Job.objects.create(task=task_name, params=params or {}, created_by=user, max_attempts=max_attempts)
+
+
+def claim_jobs(limit):
+    """
+    Atomically move up to ``limit`` due jobs from Pending to Running and
+    return them. The claim is a single UPDATE ... WHERE id IN (SELECT ...),
+    which SQLite executes under its write lock, so concurrent workers can
+    never claim the same job.
+    """
+    if limit <= 0:
+        return []
+    token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    timestamp = now()
+    due = Job.objects.filter(status='PEN', run_after__lte=timestamp).order_by('run_after', 'id').values('id')[:limit]
+    Job.objects.filter(pk__in=due, status='PEN').update(
+        status='RUN', locked_by=token, locked_at=timestamp, started_at=timestamp
+    )
+    return list(Job.objects.filter(locked_by=token, status='RUN'))
+
+
+def heartbeat_jobs(locks):
+    """Refresh locked_at of the jobs still held under the ``locks`` claim tokens."""
+    if locks:
+        Job.objects.filter(status='RUN', locked_by__in=locks).update(locked_at=now())
+
+
+def requeue_stale_jobs(stale_after, held=()):
+    """
+    Put jobs whose worker died mid-run back in the queue. Running workers
+    refresh locked_at with heartbeat_jobs() and set_progress(); ``held``
+    claim tokens (the caller's own running jobs) are never requeued.
+    """
+    cutoff = now() - timedelta(seconds=stale_after)
+    return Job.objects.filter(status='RUN', locked_at__lt=cutoff).exclude(locked_by__in=held).update(
+        status='PEN', locked_by='', locked_at=None
+    )
+
+
+def run_job(job_id, locked_by):
+    """
+    Execute one job claimed under the ``locked_by`` token and record the
+    outcome. Failed jobs are retried with exponential back-off until
+    max_attempts is reached. If the claim was lost in the meantime (the job
+    was requeued and claimed again) the job is not run, or its outcome is
+    dropped, so the newer claim is never overwritten.
+    """
+    close_old_connections()
+    try:
+        job = Job.objects.filter(pk=job_id, locked_by=locked_by, status='RUN').first()
+        if job is None:
+            logger.warning("Job %s is no longer claimed by %s; skipping it", job_id, locked_by)
+            return 'LOST'
+        job.attempts += 1
+        try:
+            job.result = TASKS[job.task](job, **job.params)
+        except Exception:
+            logger.exception("Job %s (%s) failed", job.pk, job.task)
+            job.error = traceback.format_exc()
+            if job.attempts < job.max_attempts:
+                job.status = 'PEN'
+                job.run_after = now() + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+            else:
+                job.status = 'FAI'
+                job.finished_at = now()
+        else:
+            job.status = 'SUC'
+            job.progress = 100
+            job.error = ''
+            job.finished_at = now()
+        job.locked_by = ''
+        job.locked_at = None
+        fields = (
+            'result', 'result_file', 'error', 'status', 'progress', 'attempts',
+            'run_after', 'finished_at', 'locked_by', 'locked_at',
+        )
+        if not Job.objects.filter(pk=job.pk, locked_by=locked_by).update(**{field: getattr(job, field) for field in fields}):
+            logger.warning("Job %s (%s) lost its claim while running; its outcome was dropped", job.pk, job.task)
+            return 'LOST'
+        if job.status in ('SUC', 'FAI'):
+            _remove_upload(job)
+        return job.status
+    finally:
+        close_old_connections()
+
+
+def job_output_dir(job):
+    path = os.path.join(settings.MEDIA_ROOT, 'jobs', str(job.pk))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# Built-in tasks
+@task('report_cards')
+def report_cards_task(job, class_section=None, academic_year=None):
+    from .report_files import generate_report_card_files
+    from .reports import load_report_cards, serialize_report_cards
+
+    job.set_progress(0, 'Loading report data')
+    report_data = serialize_report_cards(load_report_cards(class_section, academic_year))
+    if not report_data:
+        return {'report_cards': 0}
+
+    def progress(done, total):
+        job.set_progress(done * 100 // total, f'Rendered {done}/{total}')
+
+    output_dir = job_output_dir(job)
+    summary_path = generate_report_card_files(report_data, output_dir, progress=progress)
+    job.result_file.name = os.path.relpath(summary_path, settings.MEDIA_ROOT)
+    return {'report_cards': len(report_data), 'output_dir': os.path.relpath(output_dir, settings.MEDIA_ROOT)}
+
+
+@task('rebuild_search_index')
+def rebuild_search_index_task(job):
+    from .search import rebuild_search_index
+
+    return {'indexed': rebuild_search_index()}
+
+
+@task('compact_change_log')
+def compact_change_log_task(job):
+    from .changelog import compact_change_log
+
+    return {'deleted': compact_change_log()}
+
+
+@task('generate_term_fees')
+def generate_term_fees_task(job, academic_year, schedule_ids=None, dry_run=False):
+    from .fees import generate_term_fees
+
+    return generate_term_fees(academic_year, schedule_ids, dry_run)
+
+
+@task('reconcile_payments', upload='path')
+def reconcile_payments_task(job, path, payment_method='Bank transfer', dry_run=False):
+    from .fees import reconcile_payments
+
+    output_dir = job_output_dir(job)
+    with open(job_upload_path(path), newline='') as handle:
+        summary = reconcile_payments(csv.DictReader(handle), output_dir, payment_method, dry_run)
+    summary['reports'] = {
+        outcome: os.path.relpath(report, settings.MEDIA_ROOT) for outcome, report in summary['reports'].items()
+    }
+    job.result_file.name = summary['reports']['unmatched']
+    return summary
+
+
+@task('onboard_users', upload='path')
+def onboard_users_task(job, path, format='csv', dry_run=False, workers=None):
+    from .onboarding import onboard_users, read_onboarding_rows, write_onboarding_errors
+
+    with open(job_upload_path(path), newline='') as handle:
+        rows = list(read_onboarding_rows(handle, format))
+
+    def progress(done, created):
+        job.set_progress(done * 100 // max(len(rows), 1), f'Processed {done}/{len(rows)} rows, created {created} users')
+
+    summary = onboard_users(rows, workers=workers, dry_run=dry_run, progress=progress)
+    errors_path = os.path.join(job_output_dir(job), 'errors.csv')
+    with open(errors_path, 'w', newline='') as handle:
+        write_onboarding_errors(summary['errors'], handle)
+    job.result_file.name = os.path.relpath(errors_path, settings.MEDIA_ROOT)
+    # The full list is in errors.csv; keep the stored result small.
+    summary['errors'] = summary['errors'][:ONBOARD_RESULT_ERRORS]
+    return summary
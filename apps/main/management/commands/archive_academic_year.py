@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.timezone import now
+
+from apps.main.archive import ARCHIVE_CHUNK_SIZE, academic_year_bounds, archive_academic_year
+
+
+class Command(BaseCommand):
+    help = "Move a closed academic year's attendance and exam results into per-year archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('academic_year', help="Academic year, e.g. 2023-2024")
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE)
+        parser.add_argument('--force', action='store_true', help="Archive a year that has not ended yet")
+        parser.add_argument('--vacuum', action='store_true', help="VACUUM the database afterwards to reclaim space")
+
+    def handle(self, *args, **options):
+        academic_year = options['academic_year']
+        try:
+            start, end = academic_year_bounds(academic_year)
+        except ValueError:
+            raise CommandError("academic_year must look like 2023-2024.")
+        if end >= now().date() and not options['force']:
+            raise CommandError(f"{academic_year} runs until {end}; use --force to archive it anyway.")
+
+        started = time.monotonic()
+        record = archive_academic_year(
+            academic_year, options['chunk_size'],
+            progress=lambda model, moved: self.stdout.write(f"  {model.__name__}: {moved} rows moved")
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {academic_year} ({start} to {end}) in {time.monotonic() - started:.2f}s: "
+            f"{record.attendance_rows} attendance rows, {record.exam_result_rows} exam results."
+        ))
+        if options['vacuum'] and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+            self.stdout.write("Database vacuumed.")
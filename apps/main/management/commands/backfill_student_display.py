@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from apps.main.models import Student
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Recompute Student.display_name and class_section_label from the user and class section"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        students = Student.objects.select_related(
+            'user', 'class_section__class_name', 'class_section__section'
+        ).order_by('id')
+        checked = updated = 0
+        last_id = 0
+        while True:
+            chunk = list(students.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            changed = []
+            for student in chunk:
+                display_name = Student.build_display_name(student.user)
+                label = Student.build_class_section_label(student.class_section)
+                if (student.display_name, student.class_section_label) != (display_name, label):
+                    student.display_name, student.class_section_label = display_name, label
+                    changed.append(student)
+            # bulk_update sends no signals; the columns are recomputed right here.
+            Student.objects.bulk_update(changed, ['display_name', 'class_section_label'])
+            checked += len(chunk)
+            updated += len(changed)
+            last_id = chunk[-1].id
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} students, updated {updated}."))
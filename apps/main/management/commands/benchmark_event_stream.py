@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.main.events import EVENTS_PATH, broadcaster, sse_application
+
+
+class Command(BaseCommand):
+    help = "Connect many in-process clients to the event stream and measure fan-out latency and memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=200, help="Attendance events to publish")
+        parser.add_argument('--sections', type=int, default=20, help="Class sections the events are spread over")
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(is_staff=True, is_active=True).first()
+        if user is None:
+            raise CommandError("A staff user is needed to authenticate the clients.")
+        asyncio.run(self.run(str(AccessToken.for_user(user)), options))
+
+    async def run(self, token, options):
+        clients, events, sections = options['clients'], options['events'], options['sections']
+        received = [0] * clients
+        finished = []
+        delivered = asyncio.Event()
+        disconnect = asyncio.Event()
+
+        def make_client(index):
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.body':
+                    received[index] += message['body'].count(b'\nevent: attendance')
+                    if b'event: benchmark' in message['body']:
+                        finished.append(index)
+                        if len(finished) == clients:
+                            delivered.set()
+
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': EVENTS_PATH,
+                'headers': [(b'authorization', f'Bearer {token}'.encode())], 'query_string': b'',
+            }
+            return sse_application(scope, receive, send)
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        connected = time.monotonic()
+        tasks = [asyncio.ensure_future(make_client(index)) for index in range(clients)]
+        while broadcaster.subscriber_count() < clients:
+            await asyncio.sleep(0.01)
+        memory = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        self.stdout.write(f"{clients} clients connected in {time.monotonic() - connected:.2f}s, "
+                          f"{memory / clients / 1024:.1f} KiB each")
+
+        def publish():
+            for number in range(events):
+                section = number % sections + 1
+                broadcaster.publish(
+                    'attendance', (section, '2024-01-01'),
+                    {'class_section': section, 'date': '2024-01-01', 'statuses': {str(number): 'P'}},
+                    class_section=section,
+                )
+            broadcaster.publish('benchmark', 'end', {})
+
+        started = time.monotonic()
+        threading.Thread(target=publish).start()
+        await asyncio.wait_for(delivered.wait(), 120)
+        elapsed = time.monotonic() - started
+        # Events are coalesced per section and day, so clients get far fewer messages than were published.
+        self.stdout.write(self.style.SUCCESS(
+            f"{events} events fanned out to {clients} clients in {elapsed:.2f}s "
+            f"({sum(received) / clients:.1f} coalesced messages per client)"
+        ))
+        disconnect.set()
+        await asyncio.gather(*tasks)
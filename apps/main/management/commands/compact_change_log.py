@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.main.changelog import compact_change_log
+
+
+class Command(BaseCommand):
+    help = "Remove change log entries superseded by a later change to the same object"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int,
+                            help="Only compact entries older than this (default: CHANGE_LOG_COMPACT_AFTER_DAYS)")
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        deleted = compact_change_log(timedelta(days=days) if days is not None else None)
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} superseded change log entries."))
@@ -0,0 +1,44 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.main.report_files import generate_report_card_files
+from apps.main.reports import load_report_cards, serialize_report_cards
+
+
+class Command(BaseCommand):
+    help = "Generate JSON/HTML report cards and a CSV summary for a class section or academic year"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class-section', type=int, help="ClassSection id")
+        parser.add_argument('--academic-year', help="Academic year, e.g. 2023-2024")
+        parser.add_argument('--output', help="Output directory (default: MEDIA_ROOT/report_cards/<scope>)")
+        parser.add_argument('--workers', type=int, default=None, help="Process pool size (default: CPU count)")
+
+    def handle(self, *args, **options):
+        class_section_id = options['class_section']
+        academic_year = options['academic_year']
+        if not class_section_id and not academic_year:
+            raise CommandError("Pass --class-section and/or --academic-year.")
+
+        scope = '-'.join(filter(None, [academic_year, f'cs{class_section_id}' if class_section_id else None]))
+        output_dir = options['output'] or os.path.join(settings.MEDIA_ROOT, 'report_cards', scope)
+
+        started = time.monotonic()
+        report_data = serialize_report_cards(load_report_cards(class_section_id, academic_year))
+        self.stdout.write(f"Loaded {len(report_data)} report cards in {time.monotonic() - started:.2f}s")
+        if not report_data:
+            return
+
+        def progress(done, total):
+            self.stdout.write(f"  rendered {done}/{total}")
+
+        summary_path = generate_report_card_files(
+            report_data, output_dir, workers=options['workers'], progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(report_data)} report cards to {output_dir} "
+            f"(summary: {summary_path}) in {time.monotonic() - started:.2f}s"
+        ))
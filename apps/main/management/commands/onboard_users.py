@@ -0,0 +1,50 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.main.onboarding import (
+    ONBOARD_CHUNK_SIZE, ONBOARD_FORMATS, onboard_users, read_onboarding_rows, write_onboarding_errors,
+)
+
+
+class Command(BaseCommand):
+    help = "Create users with student/teacher profiles from a CSV or JSON onboarding file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV (with header) or JSON onboarding file")
+        parser.add_argument('--format', choices=ONBOARD_FORMATS, help="Default: taken from the file extension")
+        parser.add_argument('--workers', type=int, help="Password hashing processes (default: CPU count)")
+        parser.add_argument('--chunk-size', type=int, default=ONBOARD_CHUNK_SIZE)
+        parser.add_argument('--errors', help="Write per-row errors to this CSV file")
+        parser.add_argument('--dry-run', action='store_true', help="Validate without creating anything")
+
+    def handle(self, *args, **options):
+        path = options['file']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist.")
+        fmt = options['format'] or ('json' if path.lower().endswith('.json') else 'csv')
+
+        def progress(rows, created):
+            self.stdout.write(f"  {rows} rows processed, {created} users created")
+
+        with open(path, newline='') as handle:
+            try:
+                rows = read_onboarding_rows(handle, fmt)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            summary = onboard_users(
+                rows, workers=options['workers'], chunk_size=options['chunk_size'],
+                dry_run=options['dry_run'], progress=progress,
+            )
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='') as handle:
+                write_onboarding_errors(summary['errors'], handle)
+        else:
+            for error in summary['errors'][:20]:
+                self.stdout.write(self.style.WARNING(f"  row {error['row']} ({error['email']}): {error['errors']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['rows']} rows in {summary['elapsed_seconds']:.2f}s ({summary['rows_per_second']} rows/s): "
+            f"{summary['created']} created ({summary['students']} students, {summary['teachers']} teachers), "
+            f"{summary['failed']} failed{' (dry run)' if summary['dry_run'] else ''}"
+        ))
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+
+from apps.main.querylog import query_stats
+
+ORDERINGS = ('total_ms', 'count', 'max_ms', 'max_per_request')
+
+
+class Command(BaseCommand):
+    help = (
+        "Request the given URLs in-process and print the SQL they ran, grouped by "
+        "fingerprint, with likely N+1 statements flagged"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help="Paths to GET, e.g. /main/students/")
+        parser.add_argument('--user', help="Email of the user to authenticate as (default: first superuser)")
+        parser.add_argument('--repeat', type=int, default=1, help="Request each URL this many times")
+        parser.add_argument('--order-by', choices=ORDERINGS, default='total_ms')
+        parser.add_argument('--n-plus-one', action='store_true', help="Only show statements flagged as N+1")
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(is_active=True)
+        user = (users.filter(email=options['user']) if options['user'] else users.filter(is_superuser=True)).first()
+        if user is None:
+            raise CommandError("No matching active user to authenticate as.")
+
+        client = APIClient(SERVER_NAME=(settings.ALLOWED_HOSTS or ['localhost'])[0].lstrip('.'))
+        client.force_authenticate(user)
+        query_stats.reset()
+        for url in options['urls']:
+            for _ in range(max(options['repeat'], 1)):
+                response = client.get(url)
+                if response.status_code >= 400:
+                    self.stderr.write(f"GET {url} returned {response.status_code}")
+
+        entries = query_stats.report(
+            order_by=options['order_by'], n_plus_one=options['n_plus_one'], limit=options['limit']
+        )
+        for entry in entries:
+            flag = self.style.WARNING(' N+1') if entry['n_plus_one_requests'] else ''
+            self.stdout.write(
+                f"{entry['url_name'] or '-':<24} {entry['count']:>6}x  {entry['avg_per_request']:>7}/req  "
+                f"{entry['total_ms']:>9.2f} ms total  {entry['max_ms']:>8.2f} ms max{flag}"
+            )
+            self.stdout.write(f"    {entry['fingerprint'][:300]}")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.main.search import rebuild_search_index, search_supported
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over students and teachers"
+
+    def handle(self, *args, **options):
+        if not search_supported():
+            self.stderr.write("Full-text search requires the SQLite backend.")
+            return
+        total = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} students and teachers."))
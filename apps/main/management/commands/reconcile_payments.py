@@ -0,0 +1,39 @@
+import csv
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.main.fees import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = "Reconcile a bank statement CSV (amount, date, reference and/or admission_number) against outstanding fees"
+
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help="Path to the bank statement CSV")
+        parser.add_argument('--output', help="Report directory (default: MEDIA_ROOT/reconciliation/<statement name>)")
+        parser.add_argument('--payment-method', default='Bank transfer')
+        parser.add_argument('--dry-run', action='store_true', help="Match and report without updating fees")
+
+    def handle(self, *args, **options):
+        statement = options['statement']
+        if not os.path.exists(statement):
+            raise CommandError(f"{statement} does not exist.")
+        name = os.path.splitext(os.path.basename(statement))[0]
+        output_dir = options['output'] or os.path.join(settings.MEDIA_ROOT, 'reconciliation', name)
+
+        started = time.monotonic()
+        with open(statement, newline='') as handle:
+            summary = reconcile_payments(
+                csv.DictReader(handle), output_dir, options['payment_method'], options['dry_run']
+            )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['lines']} lines in {elapsed:.2f}s: {summary['matched']} matched, "
+            f"{summary['partial']} partial, {summary['overpaid']} overpaid, {summary['unmatched']} unmatched; "
+            f"applied {summary['applied_amount']}{' (dry run)' if summary['dry_run'] else ''}"
+        ))
+        for outcome, path in summary['reports'].items():
+            self.stdout.write(f"  {outcome}: {path}")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.main.archive import ARCHIVE_CHUNK_SIZE, restore_academic_year
+from apps.main.models import AcademicYearArchive
+
+
+class Command(BaseCommand):
+    help = "Move an archived academic year back into the attendance and exam result tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('academic_year', help="Academic year, e.g. 2023-2024")
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        academic_year = options['academic_year']
+        try:
+            restore_academic_year(
+                academic_year, options['chunk_size'],
+                progress=lambda model, moved: self.stdout.write(f"  {model.__name__}: {moved} rows restored")
+            )
+        except AcademicYearArchive.DoesNotExist:
+            raise CommandError(f"{academic_year} is not archived.")
+        self.stdout.write(self.style.SUCCESS(f"Restored {academic_year}."))
@@ -0,0 +1,65 @@
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.main.jobs import claim_jobs, heartbeat_jobs, requeue_stale_jobs, run_job
+
+# Seconds between refreshing the locks of running jobs and requeueing stale ones.
+HEARTBEAT_INTERVAL = 30
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the database queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help="Jobs run at the same time")
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when idle")
+        parser.add_argument('--stale-after', type=int, default=3600,
+                            help="Requeue running jobs locked longer than this many seconds")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is drained")
+
+    def handle(self, *args, **options):
+        concurrency = max(options['concurrency'], 1)
+        if options['pool'] == 'process':
+            # Forked children must not reuse the parent's database connection.
+            executor = ProcessPoolExecutor(max_workers=concurrency, initializer=connections.close_all)
+        else:
+            executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+
+        running = {}
+        last_heartbeat = 0
+        self.stdout.write(f"Worker started ({options['pool']} pool, concurrency {concurrency})")
+        try:
+            while not stopping:
+                for future in [future for future in running if future.done()]:
+                    job = running.pop(future)
+                    try:
+                        self.stdout.write(f"Finished {job.task} #{job.pk}: {future.result()}")
+                    except Exception as exc:
+                        self.stderr.write(f"Job #{job.pk} crashed the worker: {exc}")
+
+                if time.monotonic() - last_heartbeat >= min(HEARTBEAT_INTERVAL, options['stale_after'] / 2):
+                    locks = [job.locked_by for job in running.values()]
+                    heartbeat_jobs(locks)
+                    requeue_stale_jobs(options['stale_after'], held=locks)
+                    last_heartbeat = time.monotonic()
+                claimed = claim_jobs(concurrency - len(running))
+                for job in claimed:
+                    self.stdout.write(f"Running {job}")
+                    running[executor.submit(run_job, job.pk, job.locked_by)] = job
+
+                if options['once'] and not running and not claimed:
+                    break
+                time.sleep(0.1 if running or claimed else options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write("Waiting for running jobs to finish...")
+            executor.shutdown(wait=True)
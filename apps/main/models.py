@@ -3,6 +3,8 @@ from django.utils.timezone import now
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .grading import grade_expression, percentage_expression
+
 class Student(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='student_profile')
     admission_number = models.CharField(max_length=20, unique=True)
@@ -21,9 +23,30 @@ class Student(models.Model):
     class_section = models.ForeignKey('ClassSection', on_delete=models.CASCADE)
     admission_date = models.DateField(default=now)
     is_active = models.BooleanField(default=True)
+    # Copies of the user's name and the class section label, kept in sync by
+    # signals so row serializers need no user/class/section joins.
+    display_name = models.CharField(max_length=301, blank=True, editable=False)
+    class_section_label = models.CharField(max_length=210, blank=True, editable=False)
+    # Token under which the serialized representation is cached; replaced on
+    # every change (apps/main/representation_cache.py).
+    representation_version = models.CharField(max_length=12, blank=True, editable=False)
 
     def __str__(self):
-        return f"{self.admission_number} - {self.user.first_name} {self.user.last_name}"
+        return f"{self.admission_number} - {self.get_display_name()}"
+
+    @staticmethod
+    def build_display_name(user):
+        return f"{user.first_name} {user.last_name}"
+
+    @staticmethod
+    def build_class_section_label(class_section):
+        return f"{class_section.class_name.name} - {class_section.section.name}"
+
+    def get_display_name(self):
+        return self.display_name or self.build_display_name(self.user)
+
+    def get_class_section_label(self):
+        return self.class_section_label or self.build_class_section_label(self.class_section)
 
 class Teacher(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='teacher_profile')
@@ -33,6 +56,7 @@ class Teacher(models.Model):
     subjects = models.ManyToManyField('Subject')
     date_joined = models.DateField(default=now)
     is_active = models.BooleanField(default=True)
+    representation_version = models.CharField(max_length=12, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.employee_id} - {self.user.first_name} {self.user.last_name}"
@@ -58,6 +82,7 @@ class ClassSection(models.Model):
     class_teacher = models.ForeignKey(Teacher, on_delete=models.SET_NULL, null=True)
     academic_year = models.CharField(max_length=9)  # e.g., "2023-2024"
     room_number = models.CharField(max_length=10, blank=True)
+    representation_version = models.CharField(max_length=12, blank=True, editable=False)
 
     class Meta:
         unique_together = ['class_name', 'section', 'academic_year']
@@ -76,7 +101,7 @@ class Subject(models.Model):
 
 class Attendance(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
-    date = models.DateField()
+    date = models.DateField(db_index=True)
     status_choices = [
         ('P', 'Present'),
         ('A', 'Absent'),
@@ -105,10 +130,20 @@ class Exam(models.Model):
     end_date = models.DateField()
     academic_year = models.CharField(max_length=9)
     is_active = models.BooleanField(default=True)
+    # Bumped whenever one of the exam's results changes; used in cache keys.
+    results_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.name} - {self.academic_year}"
 
+    @classmethod
+    def bump_results_version(cls, exam_ids):
+        cls.objects.filter(pk__in=exam_ids).update(results_version=models.F('results_version') + 1)
+
+class ExamResultQuerySet(models.QuerySet):
+    def with_grades(self):
+        return self.annotate(percentage=percentage_expression()).annotate(grade=grade_expression())
+
 class ExamResult(models.Model):
     exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
@@ -117,14 +152,21 @@ class ExamResult(models.Model):
     max_marks = models.DecimalField(max_digits=5, decimal_places=2)
     remarks = models.TextField(blank=True)
 
+    objects = ExamResultQuerySet.as_manager()
+
     class Meta:
         unique_together = ['exam', 'student', 'subject']
+        indexes = [
+            models.Index(models.F('exam'), percentage_expression(), name='main_examresult_exam_pct_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student} - {self.subject} - {self.exam}"
 
 class Fee(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    # Set for fees materialized from a FeeSchedule; makes generation idempotent.
+    schedule = models.ForeignKey('FeeSchedule', on_delete=models.SET_NULL, null=True, blank=True)
     fee_type_choices = [
         ('TUI', 'Tuition Fee'),
         ('LAB', 'Laboratory Fee'),
@@ -134,7 +176,8 @@ class Fee(models.Model):
     ]
     fee_type = models.CharField(max_length=3, choices=fee_type_choices)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    due_date = models.DateField()
+    paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    due_date = models.DateField(db_index=True)
     paid_date = models.DateField(null=True, blank=True)
     status_choices = [
         ('PEN', 'Pending'),
@@ -143,7 +186,123 @@ class Fee(models.Model):
     ]
     status = models.CharField(max_length=3, choices=status_choices, default='PEN')
     payment_method = models.CharField(max_length=50, blank=True)
-    receipt_number = models.CharField(max_length=50, blank=True)
+    receipt_number = models.CharField(max_length=50, blank=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'student'], name='main_fee_unique_schedule_student'),
+        ]
+
+    def __str__(self):
+        return f"{self.student} - {self.get_fee_type_display()} - {self.due_date}"
+
+class FeeSchedule(models.Model):
+    # Applies to every active student of class_section, or of every section of
+    # class_name in academic_year when no section is given.
+    class_name = models.ForeignKey(Class, on_delete=models.CASCADE, null=True, blank=True)
+    class_section = models.ForeignKey(ClassSection, on_delete=models.CASCADE, null=True, blank=True)
+    academic_year = models.CharField(max_length=9)
+    fee_type = models.CharField(max_length=3, choices=Fee.fee_type_choices)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    due_date = models.DateField()
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        target = self.class_section or self.class_name
+        return f"{target} - {self.get_fee_type_display()} - {self.due_date}"
+
+class AcademicYearArchive(models.Model):
+    # Catalog of academic years whose Attendance/ExamResult rows were moved
+    # to per-year archive tables (see apps/main/archive.py).
+    academic_year = models.CharField(max_length=9, unique=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    attendance_rows = models.PositiveIntegerField(default=0)
+    exam_result_rows = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Archive {self.academic_year}"
+
+class ChangeLogEntry(models.Model):
+    # Append-only feed of changed synced objects; the id is the sync cursor.
+    action_choices = [
+        ('INS', 'Inserted'),
+        ('UPD', 'Updated'),
+        ('DEL', 'Deleted'),
+    ]
+    model = models.CharField(max_length=20)
+    object_id = models.PositiveIntegerField()
+    action = models.CharField(max_length=3, choices=action_choices)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['model', 'object_id'])]
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.model} {self.object_id}"
+
+class Job(models.Model):
+    status_choices = [
+        ('PEN', 'Pending'),
+        ('RUN', 'Running'),
+        ('SUC', 'Succeeded'),
+        ('FAI', 'Failed')
+    ]
+    task = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=3, choices=status_choices, default='PEN')
+    progress = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(100)])
+    progress_message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.FileField(upload_to='jobs/', blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=now)
+    locked_by = models.CharField(max_length=100, blank=True, db_index=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} - {self.get_status_display()}"
+
+    def set_progress(self, progress, message=''):
+        # Doubles as a heartbeat: a fresh locked_at keeps the job from being requeued as stale.
+        self.progress = max(0, min(int(progress), 100))
+        self.progress_message = message[:255]
+        Job.objects.filter(pk=self.pk, locked_by=self.locked_by).update(
+            progress=self.progress, progress_message=self.progress_message, locked_at=now()
+        )
+
+
+class RequestProfile(models.Model):
+    mode_choices = [
+        ('CPR', 'cProfile'),
+        ('SMP', 'Sampling'),
+    ]
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    url_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    mode = models.CharField(max_length=3, choices=mode_choices)
+    duration_ms = models.FloatField()
+    sql_count = models.PositiveIntegerField(default=0)
+    sql_time_ms = models.FloatField(default=0)
+    sql_summary = models.JSONField(default=list, blank=True)
+    hotspots = models.JSONField(default=list, blank=True)
+    stats_file = models.FileField(upload_to='profiles/', blank=True)
+    collapsed_file = models.FileField(upload_to='profiles/', blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
-        return f"{self.student} - {self.get_fee_type_display()} - {self.due_date}"
\ No newline at end of file
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
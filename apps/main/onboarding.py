@@ -0,0 +1,310 @@
+import csv
+import json
+import time
+from contextlib import nullcontext
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from apps.accounts.hashing import password_hash_pool, submit_password_hashes
+from apps.accounts.payroll import invalidate_payroll
+
+from . import search
+from .changelog import record_changes, INSERTED
+from .models import ClassSection, Student, Subject, Teacher
+from .representation_cache import invalidate_representations
+
+User = get_user_model()
+
+ONBOARD_CHUNK_SIZE = 500
+ONBOARD_FORMATS = ('csv', 'json')
+ONBOARD_PROFILES = ('student', 'teacher', '')
+ONBOARD_USER_FIELDS = ('first_name', 'last_name', 'phone_number', 'department', 'division', 'salary')
+ONBOARD_STUDENT_FIELDS = (
+    'admission_number', 'roll_number', 'date_of_birth', 'gender', 'address',
+    'guardian_name', 'guardian_phone', 'guardian_email', 'admission_date',
+)
+ONBOARD_TEACHER_FIELDS = ('employee_id', 'qualification', 'experience_years', 'date_joined')
+ONBOARD_ERROR_FIELDS = ('row', 'email', 'errors')
+# Role given to a new user when the row does not name one.
+ONBOARD_DEFAULT_ROLES = {'student': 'student', 'teacher': 'employee'}
+
+
+def read_onboarding_rows(handle, fmt='csv'):
+    """
+    Rows of an onboarding file as dicts. CSV files need a header row; JSON
+    files hold a list of objects, or an object with such a list under "users".
+    Teacher subjects are subject codes separated by ";" (or a JSON list).
+    """
+    if fmt == 'json':
+        data = json.load(handle)
+        if isinstance(data, dict):
+            data = data.get('users')
+        if not isinstance(data, list):
+            raise ValueError('JSON onboarding files must contain a list of users')
+        return data
+    return csv.DictReader(handle)
+
+
+def _value(row, key):
+    value = row.get(key)
+    if value is None:
+        return ''
+    return value.strip() if isinstance(value, str) else value
+
+
+def _clean(instance, exclude):
+    try:
+        instance.full_clean(exclude=exclude, validate_unique=False)
+    except ValidationError as exc:
+        return exc.message_dict
+    return {}
+
+
+class _PendingUser:
+    __slots__ = ('row', 'user', 'password', 'student', 'teacher', 'subject_ids')
+
+    def __init__(self, row, user, password):
+        self.row = row
+        self.user = user
+        self.password = password
+        self.student = None
+        self.teacher = None
+        self.subject_ids = []
+
+
+class _Lookups:
+    """Class sections and subjects loaded once, plus the unique values already seen in the file."""
+
+    def __init__(self):
+        self.class_section_labels = {
+            class_section.id: Student.build_class_section_label(class_section)
+            for class_section in ClassSection.objects.select_related('class_name', 'section')
+        }
+        self.subject_ids = dict(Subject.objects.values_list('code', 'id'))
+        self.seen = {'email': set(), 'admission_number': set(), 'employee_id': set()}
+
+    def claim(self, field, value, errors):
+        if value in self.seen[field]:
+            errors.setdefault(field, []).append('Duplicate value in this file.')
+        self.seen[field].add(value)
+
+
+def _prepare_row(number, row, lookups):
+    """Build the unsaved user and profile for one row; returns (pending user, errors)."""
+    if not isinstance(row, dict):
+        return None, {'row': ['Each user must be an object.']}
+    errors = {}
+    profile = str(_value(row, 'profile')).lower()
+    if profile not in ONBOARD_PROFILES:
+        errors['profile'] = ['Must be "student", "teacher" or empty.']
+
+    user = User(
+        email=User.objects.normalize_email(_value(row, 'email')),
+        role=_value(row, 'role') or ONBOARD_DEFAULT_ROLES.get(profile, 'employee'),
+    )
+    for field in ONBOARD_USER_FIELDS:
+        if _value(row, field) != '':
+            setattr(user, field, _value(row, field))
+    errors.update(_clean(user, exclude=['password']))
+    lookups.claim('email', user.email, errors)
+    pending = _PendingUser(number, user, _value(row, 'password') or None)
+
+    if profile == 'student':
+        student = Student(**{field: _value(row, field) for field in ONBOARD_STUDENT_FIELDS if _value(row, field) != ''})
+        errors.update(_clean(student, exclude=['user', 'class_section']))
+        try:
+            student.class_section_id = int(_value(row, 'class_section'))
+        except (TypeError, ValueError):
+            student.class_section_id = None
+        if student.class_section_id not in lookups.class_section_labels:
+            errors['class_section'] = ['Unknown class section.']
+        else:
+            # pre_save does not run for bulk_create, so the copies are filled in here.
+            student.class_section_label = lookups.class_section_labels[student.class_section_id]
+        student.display_name = Student.build_display_name(user)
+        lookups.claim('admission_number', student.admission_number, errors)
+        pending.student = student
+    elif profile == 'teacher':
+        teacher = Teacher(**{field: _value(row, field) for field in ONBOARD_TEACHER_FIELDS if _value(row, field) != ''})
+        errors.update(_clean(teacher, exclude=['user']))
+        codes = _value(row, 'subjects')
+        codes = [code.strip() for code in codes.split(';')] if isinstance(codes, str) else list(codes or [])
+        codes = [code for code in codes if code]
+        unknown = [code for code in codes if code not in lookups.subject_ids]
+        if unknown:
+            errors['subjects'] = [f"Unknown subject code(s): {', '.join(map(str, unknown))}."]
+        pending.subject_ids = [lookups.subject_ids[code] for code in codes if code in lookups.subject_ids]
+        lookups.claim('employee_id', teacher.employee_id, errors)
+        pending.teacher = teacher
+    return pending, errors
+
+
+def _existing_values(pending):
+    """Unique values of a chunk that are already taken in the database, one query per field."""
+    emails = [item.user.email for item in pending]
+    admission_numbers = [item.student.admission_number for item in pending if item.student]
+    employee_ids = [item.teacher.employee_id for item in pending if item.teacher]
+    return {
+        'email': set(User.objects.filter(email__in=emails).values_list('email', flat=True)),
+        'admission_number': set(Student.objects.filter(
+            admission_number__in=admission_numbers).values_list('admission_number', flat=True)),
+        'employee_id': set(Teacher.objects.filter(
+            employee_id__in=employee_ids).values_list('employee_id', flat=True)),
+    }
+
+
+def _validate_chunk(chunk, lookups, summary):
+    pending = []
+    errors = {}
+    for number, row in chunk:
+        item, row_errors = _prepare_row(number, row, lookups)
+        if row_errors:
+            errors[number] = (_value(row, 'email') if isinstance(row, dict) else '', row_errors)
+        else:
+            pending.append(item)
+
+    existing = _existing_values(pending)
+    valid = []
+    for item in pending:
+        taken = {
+            field: ['Already exists.']
+            for field, value in (
+                ('email', item.user.email),
+                ('admission_number', item.student and item.student.admission_number),
+                ('employee_id', item.teacher and item.teacher.employee_id),
+            )
+            if value and value in existing[field]
+        }
+        if taken:
+            errors[item.row] = (item.user.email, taken)
+        else:
+            valid.append(item)
+
+    for number in sorted(errors):
+        email, row_errors = errors[number]
+        summary['errors'].append({'row': number, 'email': email, 'errors': row_errors})
+    summary['failed'] += len(errors)
+    return valid
+
+
+def _reset(item):
+    # A rolled back bulk_create may already have assigned primary keys.
+    for instance in (item.user, item.student, item.teacher):
+        if instance is not None:
+            instance.pk = None
+            instance._state.adding = True
+
+
+def _insert(pending):
+    with transaction.atomic():
+        User.objects.bulk_create([item.user for item in pending])
+        for item in pending:
+            for profile in (item.student, item.teacher):
+                if profile is not None:
+                    profile.user = item.user
+        students = Student.objects.bulk_create([item.student for item in pending if item.student])
+        teachers = Teacher.objects.bulk_create([item.teacher for item in pending if item.teacher])
+        Teacher.subjects.through.objects.bulk_create([
+            Teacher.subjects.through(teacher_id=item.teacher.pk, subject_id=subject_id)
+            for item in pending if item.teacher for subject_id in item.subject_ids
+        ])
+    return students, teachers
+
+
+def _save_chunk(pending, summary):
+    """
+    Insert a chunk in one transaction. If it hits an IntegrityError (e.g. a
+    user created concurrently) every row is retried on its own, so only the
+    offending rows fail.
+    """
+    try:
+        students, teachers = _insert(pending)
+    except IntegrityError as exc:
+        if len(pending) == 1:
+            summary['errors'].append({'row': pending[0].row, 'email': pending[0].user.email, 'errors': {'database': [str(exc)]}})
+            summary['failed'] += 1
+            return
+        for item in pending:
+            _reset(item)
+            _save_chunk([item], summary)
+        return
+
+    student_ids = [student.pk for student in students]
+    teacher_ids = [teacher.pk for teacher in teachers]
+    # bulk_create skips the signals that normally do this.
+    invalidate_representations(Student, student_ids)
+    record_changes(Student, student_ids, INSERTED)
+    invalidate_representations(Teacher, teacher_ids)
+    record_changes(Teacher, teacher_ids, INSERTED)
+    if student_ids:
+        # Class sections show student counts.
+        invalidate_representations(ClassSection, ClassSection.objects.values_list('id', flat=True))
+    search.index_profiles(student_ids, teacher_ids)
+    summary['created'] += len(pending)
+    summary['students'] += len(student_ids)
+    summary['teachers'] += len(teacher_ids)
+
+
+def _finish_chunk(pending, futures, summary):
+    hashes = [password for future in futures for password in future.result()]
+    for item, password in zip(pending, hashes):
+        item.user.password = password
+    if pending:
+        _save_chunk(pending, summary)
+
+
+def onboard_users(rows, workers=None, chunk_size=ONBOARD_CHUNK_SIZE, dry_run=False, progress=None):
+    """
+    Create users with their student or teacher profiles from onboarding
+    rows. Rows are validated in chunks; the passwords of a valid chunk are
+    hashed across a process pool while the next chunk is validated, and each
+    chunk is then written with bulk_create in its own transaction. Invalid
+    rows are skipped and listed under ``errors``; ``progress(rows, created)``
+    is called after every chunk. Returns counts and throughput.
+    """
+    started = time.monotonic()
+    lookups = _Lookups()
+    summary = {
+        'rows': 0, 'created': 0, 'students': 0, 'teachers': 0, 'failed': 0,
+        'dry_run': dry_run, 'errors': [],
+    }
+    numbered = enumerate(rows, start=1)
+    with nullcontext() if dry_run else password_hash_pool(workers) as executor:
+        previous = None
+        while True:
+            chunk = list(islice(numbered, chunk_size))
+            if not chunk:
+                break
+            summary['rows'] += len(chunk)
+            pending = _validate_chunk(chunk, lookups, summary)
+            if dry_run:
+                summary['created'] += len(pending)
+                continue
+            futures = submit_password_hashes(executor, [item.password for item in pending])
+            if previous:
+                _finish_chunk(*previous, summary)
+                if progress:
+                    progress(summary['rows'] - len(chunk), summary['created'])
+            previous = (pending, futures)
+        if previous:
+            _finish_chunk(*previous, summary)
+
+    if summary['created'] and not dry_run:
+        invalidate_payroll()
+    if progress:
+        progress(summary['rows'], summary['created'])
+    elapsed = time.monotonic() - started
+    summary['elapsed_seconds'] = round(elapsed, 3)
+    summary['rows_per_second'] = round(summary['rows'] / elapsed, 1) if elapsed else None
+    summary['created_per_second'] = round(summary['created'] / elapsed, 1) if elapsed else None
+    return summary
+
+
+def write_onboarding_errors(errors, handle):
+    writer = csv.DictWriter(handle, fieldnames=ONBOARD_ERROR_FIELDS)
+    writer.writeheader()
+    for error in errors:
+        writer.writerow({**error, 'errors': json.dumps(error['errors'])})
@@ -0,0 +1,34 @@
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for very large tables where an exact COUNT(*) is too slow.
+
+    An unfiltered queryset is estimated from MAX(pk), which SQLite answers
+    from the primary key index. A filtered queryset is counted exactly but
+    only up to ``count_limit`` rows, so the cost stays bounded.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return queryset.model._default_manager.aggregate(total=Max('pk'))['total'] or 0
+        return queryset.order_by()[:self.count_limit].count()
+
+
+class StandardResultsPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+def paginated_response(request, queryset, serializer_class):
+    paginator = StandardResultsPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(serializer_class(page, many=True).data)
@@ -0,0 +1,217 @@
+import cProfile
+import logging
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from itertools import count
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+
+from .models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+MODE_CPROFILE, MODE_SAMPLE = 'cprofile', 'sample'
+MODE_CODES = {MODE_CPROFILE: 'CPR', MODE_SAMPLE: 'SMP'}
+SAMPLE_INTERVAL = 0.005
+MAX_STACK_DEPTH = 100
+HOTSPOT_COUNT = 20
+SLOW_STATEMENT_COUNT = 10
+# Old profiles beyond PROFILING_KEEP are deleted on every PRUNE_EVERY-th save
+# per process rather than on each one.
+PRUNE_EVERY = 20
+
+_saved_profiles = count(1)
+
+
+def _label(filename, lineno, name):
+    # Trim paths to the project or the installed package so labels stay readable.
+    for prefix in (str(settings.BASE_DIR) + os.sep, 'site-packages' + os.sep):
+        index = filename.find(prefix)
+        if index != -1:
+            filename = filename[index + len(prefix):]
+            break
+    return f"{name} ({filename}:{lineno})"
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's stack every SAMPLE_INTERVAL seconds into collapsed-stack counts."""
+
+    def __init__(self, thread_id, root_code=None, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        # Frames from root_code outwards (server and middleware plumbing) are left out.
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                if code is self.root_code:
+                    break
+                stack.append(_label(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class SQLRecorder:
+    """execute_wrapper that times every statement run while it is installed."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql, time.perf_counter() - started))
+
+    def summary(self):
+        slowest = sorted(self.statements, key=lambda statement: statement[1], reverse=True)
+        return [
+            {'sql': sql[:500], 'time_ms': round(duration * 1000, 3)}
+            for sql, duration in slowest[:SLOW_STATEMENT_COUNT]
+        ]
+
+
+def _requested_mode(request):
+    """Profiling mode for this request, or None to run it normally."""
+    default_mode = getattr(settings, 'PROFILING_MODE', MODE_CPROFILE)
+    header = request.META.get(PROFILE_HEADER)
+    if header:
+        if _is_staff(request):
+            return header if header in MODE_CODES else default_mode
+        return None
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        return default_mode
+    return None
+
+
+def _is_staff(request):
+    # Middleware runs before DRF authentication, so check the JWT here too.
+    if request.user.is_authenticated:
+        return request.user.is_staff
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework.exceptions import AuthenticationFailed
+
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return bool(authenticated and authenticated[0].is_staff)
+
+
+def _save_profile(request, response, mode, duration, recorder, stacks, stats=None):
+    user = getattr(request, 'user', None)
+    match = getattr(request, 'resolver_match', None)
+    profile = RequestProfile(
+        method=request.method,
+        path=request.get_full_path()[:500],
+        url_name=(match.view_name if match else '')[:200],
+        status_code=response.status_code,
+        mode=MODE_CODES[mode],
+        duration_ms=round(duration * 1000, 3),
+        sql_count=len(recorder.statements),
+        sql_time_ms=round(sum(duration for _, duration in recorder.statements) * 1000, 3),
+        sql_summary=recorder.summary(),
+        user=user if user is not None and user.is_authenticated else None,
+    )
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    if stats is not None:
+        profile.hotspots = [
+            {'function': _label(*func), 'calls': calls, 'self_ms': round(total * 1000, 3),
+             'cumulative_ms': round(cumulative * 1000, 3)}
+            for func, (_, calls, total, cumulative, _) in
+            sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:HOTSPOT_COUNT]
+        ]
+        profile.stats_file.save(f'{name}.pstats', ContentFile(marshal.dumps(stats)), save=False)
+    else:
+        leaves = Counter()
+        for stack, samples in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += samples
+        profile.hotspots = [
+            {'function': function, 'samples': samples, 'approx_ms': round(samples * SAMPLE_INTERVAL * 1000, 1)}
+            for function, samples in leaves.most_common(HOTSPOT_COUNT)
+        ]
+    collapsed = '\n'.join(f"{stack} {samples}" for stack, samples in stacks.most_common())
+    profile.collapsed_file.save(f'{name}.collapsed.txt', ContentFile(collapsed.encode()), save=False)
+    profile.save()
+    if next(_saved_profiles) % PRUNE_EVERY == 0:
+        _prune_profiles()
+    return profile
+
+
+def _prune_profiles():
+    keep = getattr(settings, 'PROFILING_KEEP', 200)
+    stale = RequestProfile.objects.order_by('-created_at', '-id')[keep:]
+    for profile in stale:
+        for artifact in (profile.stats_file, profile.collapsed_file):
+            if artifact:
+                artifact.delete(save=False)
+        profile.delete()
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a PROFILING_SAMPLE_RATE fraction of requests, plus any request
+    from a staff user that sends ``X-Profile: cprofile`` or ``X-Profile:
+    sample``. The pstats dump and collapsed stacks (for flamegraph tools)
+    are saved as a RequestProfile together with the URL name and a summary
+    of the SQL that ran. ``sample`` skips cProfile and its overhead.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = _requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        recorder = SQLRecorder()
+        # The sampler runs in both modes: cProfile only records caller/callee
+        # pairs, so real stacks for the flamegraph have to come from sampling.
+        sampler = StackSampler(threading.get_ident(), ProfilingMiddleware.__call__.__code__)
+        profiler = cProfile.Profile() if mode == MODE_CPROFILE else None
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            with connection.execute_wrapper(recorder):
+                if profiler is not None:
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - started
+
+        stats = None
+        if profiler is not None:
+            profiler.create_stats()
+            stats = profiler.stats
+        try:
+            _save_profile(request, response, mode, duration, recorder, sampler.stacks, stats)
+        except Exception:
+            # Profiling is best effort; the request itself already succeeded.
+            logger.exception('Could not save the profile of %s %s', request.method, request.path)
+        return response
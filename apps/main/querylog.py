@@ -0,0 +1,148 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """
+    Normalize a statement so that queries differing only in literal values
+    or IN-list length share one fingerprint: literals and placeholders become
+    ``?`` and ``IN (?, ?, ...)`` collapses to ``IN (...)``.
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryStats:
+    """
+    Bounded per-process aggregate keyed by (fingerprint, URL name). When
+    QUERY_LOG_MAX_ENTRIES is reached the least recently seen entry is
+    dropped, so memory stays flat however many distinct statements run.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, url_name, statements, path):
+        """Fold one request's statements ({fingerprint: [count, time, max, rows, sql]}) into the totals."""
+        threshold = getattr(settings, 'QUERY_LOG_N_PLUS_ONE_THRESHOLD', 10)
+        limit = getattr(settings, 'QUERY_LOG_MAX_ENTRIES', 2000)
+        with self._lock:
+            for sql_fingerprint, (count, total, maximum, rows, example) in statements.items():
+                key = (sql_fingerprint, url_name)
+                entry = self._entries.pop(key, None)
+                if entry is None:
+                    entry = {
+                        'fingerprint': sql_fingerprint, 'url_name': url_name, 'example': example,
+                        'count': 0, 'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                        'n_plus_one_requests': 0, 'max_per_request': 0, 'last_path': '',
+                    }
+                entry['count'] += count
+                entry['requests'] += 1
+                entry['total_ms'] += total * 1000
+                entry['max_ms'] = max(entry['max_ms'], maximum * 1000)
+                entry['rows'] += rows
+                entry['max_per_request'] = max(entry['max_per_request'], count)
+                entry['last_path'] = path
+                if count >= threshold:
+                    entry['n_plus_one_requests'] += 1
+                self._entries[key] = entry
+            while len(self._entries) > limit:
+                self._entries.popitem(last=False)
+
+    def report(self, url_name=None, order_by='total_ms', n_plus_one=False, limit=50):
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        if url_name:
+            entries = [entry for entry in entries if entry['url_name'] == url_name]
+        if n_plus_one:
+            entries = [entry for entry in entries if entry['n_plus_one_requests']]
+        for entry in entries:
+            entry['total_ms'] = round(entry['total_ms'], 3)
+            entry['max_ms'] = round(entry['max_ms'], 3)
+            entry['avg_per_request'] = round(entry['count'] / entry['requests'], 2)
+        entries.sort(key=lambda entry: entry[order_by], reverse=True)
+        return entries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+
+query_stats = QueryStats()
+
+
+class RequestQueryLog:
+    """execute_wrapper collecting one request's statements by fingerprint."""
+
+    def __init__(self):
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            # SQLite reports -1 for SELECTs, so rows only counts written rows there.
+            rows = max(getattr(context['cursor'], 'rowcount', -1), 0)
+            key = fingerprint(sql)
+            entry = self.statements.get(key)
+            if entry is None:
+                self.statements[key] = [1, duration, duration, rows, sql[:1000]]
+            else:
+                entry[0] += 1
+                entry[1] += duration
+                entry[2] = max(entry[2], duration)
+                entry[3] += rows
+            slow_ms = getattr(settings, 'QUERY_LOG_SLOW_MS', 200)
+            if duration * 1000 >= slow_ms:
+                logger.warning("Slow query (%.1f ms): %s", duration * 1000, sql[:1000])
+
+    def n_plus_one_candidates(self):
+        threshold = getattr(settings, 'QUERY_LOG_N_PLUS_ONE_THRESHOLD', 10)
+        return {key: entry[0] for key, entry in self.statements.items() if entry[0] >= threshold}
+
+
+class QueryLogMiddleware:
+    """
+    Aggregates every request's SQL into ``query_stats`` per URL name and
+    logs statements a request repeated QUERY_LOG_N_PLUS_ONE_THRESHOLD or
+    more times, the usual sign of a per-row lookup in a serializer.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_LOG_ENABLED', True):
+            return self.get_response(request)
+        log = RequestQueryLog()
+        with connection.execute_wrapper(log):
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.view_name if match else ''
+        query_stats.record(url_name, log.statements, request.path)
+        for sql_fingerprint, count in log.n_plus_one_candidates().items():
+            logger.warning("Possible N+1 in %s: %d x %s", url_name or request.path, count, sql_fingerprint[:300])
+        return response
+
@@ -0,0 +1,126 @@
+import csv
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Report card files are rendered in pool workers from plain serialized
+# dicts. This module imports no models, so workers can unpickle tasks
+# before Django is set up.
+
+REPORT_CSV_FIELDS = (
+    'admission_number', 'name', 'class_section', 'attendance_percentage',
+    'total_fees', 'paid_fees', 'pending_fees', 'overdue_fees',
+    'overall_percentage', 'overall_grade', 'class_rank',
+)
+
+
+def _setup_worker():
+    # Forked workers inherit a configured Django; spawned ones start from scratch.
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _csv_row(report):
+    student = report['student_detail']
+    fee_summary = report['fee_summary']
+    return {
+        'admission_number': student['admission_number'],
+        'name': f"{student['user']['first_name'] or ''} {student['user']['last_name'] or ''}".strip(),
+        'class_section': student['class_section_name'],
+        'attendance_percentage': report['attendance_summary']['attendance_percentage'],
+        'total_fees': fee_summary['total_fees'],
+        'paid_fees': fee_summary['paid_fees'],
+        'pending_fees': fee_summary['pending_fees'],
+        'overdue_fees': fee_summary['overdue_fees'],
+        'overall_percentage': report['overall_percentage'],
+        'overall_grade': report['overall_grade'],
+        'class_rank': report['class_rank'],
+    }
+
+
+def _render_html(report):
+    row = _csv_row(report)
+    summary = ''.join(
+        f"<tr><th>{html.escape(field.replace('_', ' ').title())}</th><td>{html.escape(str(row[field]))}</td></tr>"
+        for field in REPORT_CSV_FIELDS
+    )
+    results = ''.join(
+        "<tr><td>{}</td><td>{}</td><td>{} / {}</td><td>{}</td><td>{}</td></tr>".format(
+            html.escape(str(result['exam'])), html.escape(result['subject_detail']['name']),
+            html.escape(str(result['marks_obtained'])), html.escape(str(result['max_marks'])),
+            html.escape(str(result['percentage'])), html.escape(result['grade']),
+        )
+        for result in report['exam_results']
+    )
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+        f"<title>Report card - {html.escape(row['name'])}</title></head><body>"
+        f"<h1>{html.escape(row['name'])}</h1><table>{summary}</table>"
+        "<h2>Exam results</h2><table><tr><th>Exam</th><th>Subject</th><th>Marks</th>"
+        f"<th>Percentage</th><th>Grade</th></tr>{results}</table></body></html>"
+    )
+
+
+def report_card_filename(report):
+    """
+    '<student id>-<admission number>' with anything but letters, digits, '.',
+    '_' and '-' replaced, so free-text admission numbers such as "2024/001"
+    or "../x" can neither break open() nor leave the output directory.
+    """
+    student = report['student_detail']
+    admission_number = re.sub(r'[^\w.-]+', '_', str(student['admission_number']))
+    return f"{student['id']}-{admission_number}"
+
+
+def render_report_card_files(reports, output_dir):
+    """
+    Write the JSON and HTML files for a chunk of serialized report cards and
+    return their CSV summary rows. Runs inside pool workers.
+    """
+    rows = []
+    for report in reports:
+        name = report_card_filename(report)
+        with open(os.path.join(output_dir, f'{name}.json'), 'w') as handle:
+            json.dump(report, handle, default=str)
+        with open(os.path.join(output_dir, f'{name}.html'), 'w') as handle:
+            handle.write(_render_html(report))
+        rows.append(_csv_row(report))
+    return rows
+
+
+def generate_report_card_files(report_data, output_dir, workers=None, chunk_size=50, progress=None):
+    """
+    Render serialized report cards to per-student JSON/HTML files across a
+    process pool and write a summary.csv. ``progress(done, total)`` is called
+    as chunks complete. Returns the path of the summary CSV.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # Plain dicts pickle cheaply and keep the workers free of Django state.
+    reports = json.loads(json.dumps(report_data, default=str))
+    chunks = [reports[index:index + chunk_size] for index in range(0, len(reports), chunk_size)]
+
+    rows_by_chunk = {}
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) as executor:
+        futures = {
+            executor.submit(render_report_card_files, chunk, output_dir): position
+            for position, chunk in enumerate(chunks)
+        }
+        for future in as_completed(futures):
+            rows_by_chunk[futures[future]] = future.result()
+            done += len(chunks[futures[future]])
+            if progress:
+                progress(done, len(reports))
+
+    summary_path = os.path.join(output_dir, 'summary.csv')
+    with open(summary_path, 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, fieldnames=REPORT_CSV_FIELDS)
+        writer.writeheader()
+        for position in range(len(chunks)):
+            writer.writerows(rows_by_chunk[position])
+    return summary_path
@@ -0,0 +1,140 @@
+from collections import defaultdict
+from decimal import Decimal
+from itertools import chain
+
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils.timezone import now
+
+from .archive import attendance_querysets, exam_result_manager
+from .grading import grade_for_percentage
+from .models import Fee, Student
+from .serializers import StudentAcademicReportSerializer
+
+
+def _percentage(part, total):
+    return round(float(part) / float(total) * 100, 2) if total else 0
+
+
+def _competition_ranks(scores):
+    # Standard competition ranking ("1224"): ties share a rank and the next
+    # rank skips accordingly. Students without results are not ranked.
+    ranks = {}
+    ordered = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    for position, (student_id, score) in enumerate(ordered, start=1):
+        if position > 1 and score == ordered[position - 2][1]:
+            ranks[student_id] = ranks[ordered[position - 2][0]]
+        else:
+            ranks[student_id] = position
+    return ranks
+
+
+def load_report_cards(class_section_id=None, academic_year=None):
+    """
+    Build StudentAcademicReportSerializer input for every student of a class
+    section or academic year with a fixed number of set-based queries: one
+    for students, two grouped attendance queries, one for fees and one for
+    exam results. Per-student figures are attached to the preloaded objects
+    so the nested serializers never query the database.
+    """
+    students = Student.objects.select_related(
+        'user', 'class_section__class_name', 'class_section__section'
+    ).order_by('class_section_id', 'roll_number', 'id')
+    if class_section_id:
+        students = students.filter(class_section_id=class_section_id)
+    if academic_year:
+        students = students.filter(class_section__academic_year=academic_year)
+    students = list(students)
+    if not students:
+        return []
+    student_map = {student.id: student for student in students}
+    student_ids = list(student_map)
+
+    # Attendance of archived years is folded in; each table adds two queries.
+    attendance_counts = defaultdict(lambda: defaultdict(int))
+    monthly = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    for manager in attendance_querysets():
+        for row in (manager.filter(student_id__in=student_ids)
+                    .values('student_id', 'status').annotate(total=Count('id')).order_by()):
+            attendance_counts[row['student_id']][row['status']] += row['total']
+        for row in (manager.filter(student_id__in=student_ids)
+                    .annotate(month=TruncMonth('date'))
+                    .values('student_id', 'month', 'status').annotate(total=Count('id')).order_by()):
+            monthly[row['student_id']][row['month'].strftime('%Y-%m')][row['status']] += row['total']
+
+    fees = defaultdict(list)
+    for fee in Fee.objects.filter(student_id__in=student_ids).order_by('due_date', 'id'):
+        fee.student = student_map[fee.student_id]
+        fees[fee.student_id].append(fee)
+
+    year_by_student = {student.id: student.class_section.academic_year for student in students}
+    result_querysets = [
+        exam_result_manager(academic_year).with_grades().select_related('subject', 'exam')
+        .filter(student_id__in=student_ids, exam__academic_year=academic_year)
+        .order_by('exam_id', 'subject_id')
+        for academic_year in sorted(set(year_by_student.values()))
+    ]
+    exam_results = defaultdict(list)
+    marks_totals = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    for result in chain(*result_querysets):
+        if result.exam.academic_year != year_by_student[result.student_id]:
+            continue
+        result.student = student_map[result.student_id]
+        exam_results[result.student_id].append(result)
+        marks_totals[result.student_id][0] += result.marks_obtained
+        marks_totals[result.student_id][1] += result.max_marks
+
+    overall = {
+        student_id: _percentage(obtained, maximum)
+        for student_id, (obtained, maximum) in marks_totals.items()
+    }
+    scores_by_section = defaultdict(dict)
+    for student_id, score in overall.items():
+        scores_by_section[student_map[student_id].class_section_id][student_id] = score
+    ranks = {}
+    for scores in scores_by_section.values():
+        ranks.update(_competition_ranks(scores))
+
+    today = now().date()
+    report_cards = []
+    for student in students:
+        counts = attendance_counts[student.id]
+        total_days = sum(counts.values())
+        student.attendance_total = total_days
+        student.attendance_present = counts['P']
+        student.pending_fee_count = sum(1 for fee in fees[student.id] if fee.status == 'PEN')
+
+        student_fees = fees[student.id]
+        report_cards.append({
+            'student_detail': student,
+            'attendance_summary': {
+                'total_days': total_days,
+                'present_days': counts['P'],
+                'absent_days': counts['A'],
+                'late_days': counts['L'],
+                'attendance_percentage': _percentage(counts['P'], total_days),
+                'monthly_report': {
+                    month: dict(statuses) for month, statuses in sorted(monthly[student.id].items())
+                },
+            },
+            'fee_summary': {
+                'total_fees': sum((fee.amount for fee in student_fees), Decimal(0)),
+                'paid_fees': sum((fee.amount for fee in student_fees if fee.status == 'PAI'), Decimal(0)),
+                'pending_fees': sum((fee.amount for fee in student_fees if fee.status == 'PEN'), Decimal(0)),
+                'overdue_fees': sum(
+                    (fee.amount for fee in student_fees
+                     if fee.status == 'OVE' or (fee.status == 'PEN' and fee.due_date < today)),
+                    Decimal(0)
+                ),
+                'payment_history': student_fees,
+            },
+            'exam_results': exam_results[student.id],
+            'overall_percentage': overall.get(student.id, 0),
+            'class_rank': ranks.get(student.id),
+            'overall_grade': grade_for_percentage(overall[student.id]) if student.id in overall else None,
+        })
+    return report_cards
+
+
+def serialize_report_cards(report_cards):
+    return StudentAcademicReportSerializer(report_cards, many=True).data
@@ -0,0 +1,76 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+REPRESENTATION_CACHE = 'representations'
+REPRESENTATION_CACHE_CHUNK_SIZE = 500
+
+
+def representation_cache_enabled():
+    return getattr(settings, 'REPRESENTATION_CACHE_ENABLED', False)
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def invalidate_representations(model, pks):
+    """
+    Give every object in ``pks`` a fresh version so cached representations
+    built from the old state are never read again. The version is a column
+    of the row, so every process sees it and list views read it along with
+    the primary keys. A random token is used rather than a counter: saving
+    a stale instance writes its old token back, and a counter would then
+    revisit a value that still has a stale representation cached under it.
+    """
+    pks = list(set(pks))
+    if pks and representation_cache_enabled():
+        version = _new_version()
+        for start in range(0, len(pks), REPRESENTATION_CACHE_CHUNK_SIZE):
+            model.objects.filter(pk__in=pks[start:start + REPRESENTATION_CACHE_CHUNK_SIZE]).update(
+                representation_version=version
+            )
+
+
+def serialize_cached(serializer_class, queryset):
+    """
+    Equivalent of ``serializer_class(queryset, many=True).data`` that reuses
+    per-object representations cached under (serializer, pk, version). Only
+    the primary keys and versions are read up front; cached rows come from
+    one get_many and the misses are loaded from ``queryset`` and serialized
+    in chunks.
+    """
+    if not representation_cache_enabled():
+        return serializer_class(queryset, many=True).data
+
+    cache = caches[REPRESENTATION_CACHE]
+    rows = list(queryset.values_list('pk', 'representation_version'))
+    pks = [pk for pk, _ in rows]
+    keys = {pk: f'repr:{serializer_class.__name__}:{pk}:{version}' for pk, version in rows}
+    representations = cache.get_many(list(keys.values()))
+
+    missing = [pk for pk in pks if keys[pk] not in representations]
+    for start in range(0, len(missing), REPRESENTATION_CACHE_CHUNK_SIZE):
+        objects = list(queryset.filter(pk__in=missing[start:start + REPRESENTATION_CACHE_CHUNK_SIZE]))
+        fresh = {
+            keys[obj.pk]: data
+            for obj, data in zip(objects, serializer_class(objects, many=True).data)
+        }
+        cache.set_many(fresh)
+        representations.update(fresh)
+
+    return [representations[keys[pk]] for pk in pks if keys[pk] in representations]
+
+
+def serialize_cached_object(serializer_class, obj):
+    if not representation_cache_enabled():
+        return serializer_class(obj).data
+
+    cache = caches[REPRESENTATION_CACHE]
+    key = f'repr:{serializer_class.__name__}:{obj.pk}:{obj.representation_version}'
+    data = cache.get(key)
+    if data is None:
+        data = serializer_class(obj).data
+        cache.set(key, data)
+    return data
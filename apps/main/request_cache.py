@@ -0,0 +1,27 @@
+import contextvars
+from contextlib import contextmanager
+
+_request_cache = contextvars.ContextVar('request_cache', default=None)
+
+
+@contextmanager
+def request_cache_scope(cache=None):
+    """
+    Share one memo dict across everything run inside the block, e.g. all
+    sub-requests of a /main/batch/ call. Outside a scope nothing is memoized.
+    """
+    token = _request_cache.set({} if cache is None else cache)
+    try:
+        yield _request_cache.get()
+    finally:
+        _request_cache.reset(token)
+
+
+def request_cached(key, loader):
+    """Return ``loader()``, reusing the value already loaded under ``key`` in the current scope."""
+    cache = _request_cache.get()
+    if cache is None:
+        return loader()
+    if key not in cache:
+        cache[key] = loader()
+    return cache[key]
@@ -0,0 +1,203 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from .models import Student, Teacher
+
+User = get_user_model()
+
+SEARCH_TABLE = 'main_search_index'
+
+# Students and teachers share one index; the rowid encodes which one a row is.
+KIND_STUDENT = 'student'
+KIND_TEACHER = 'teacher'
+
+# Ids per statement when indexing profiles in bulk; stays under SQLite's variable limit.
+SEARCH_BULK_CHUNK_SIZE = 500
+
+SEARCH_COLUMNS = (
+    'name', 'email', 'admission_number', 'roll_number',
+    'guardian_name', 'guardian_phone', 'employee_id',
+)
+# Columns that only staff may search on or see in results.
+STAFF_SEARCH_COLUMNS = frozenset(('guardian_phone',))
+
+
+def search_supported():
+    return connection.vendor == 'sqlite'
+
+
+def _rowid(kind, pk):
+    return pk * 2 + (1 if kind == KIND_TEACHER else 0)
+
+
+def ensure_search_index():
+    """
+    Create the FTS5 table if it does not exist yet. Runs after migrate and
+    before a rebuild, not on every write. Prefix indexes on 2-4 characters
+    keep typeahead queries on short prefixes fast.
+    """
+    if not search_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            f"kind UNINDEXED, object_id UNINDEXED, {', '.join(SEARCH_COLUMNS)}, "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+        )
+
+
+def _full_name(user):
+    return f"{user.first_name or ''} {user.last_name or ''}".strip()
+
+
+def index_student(student):
+    if not search_supported():
+        return
+    user = student.user
+    _write_row(KIND_STUDENT, student.pk, {
+        'name': _full_name(user),
+        'email': user.email,
+        'admission_number': student.admission_number,
+        'roll_number': student.roll_number,
+        'guardian_name': student.guardian_name,
+        'guardian_phone': student.guardian_phone,
+        'employee_id': '',
+    })
+
+
+def index_teacher(teacher):
+    if not search_supported():
+        return
+    user = teacher.user
+    _write_row(KIND_TEACHER, teacher.pk, {
+        'name': _full_name(user),
+        'email': user.email,
+        'admission_number': '',
+        'roll_number': '',
+        'guardian_name': '',
+        'guardian_phone': '',
+        'employee_id': teacher.employee_id,
+    })
+
+
+def remove_from_index(kind, pk):
+    if not search_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [_rowid(kind, pk)])
+
+
+def _write_row(kind, pk, values):
+    rowid = _rowid(kind, pk)
+    columns = ', '.join(SEARCH_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(SEARCH_COLUMNS))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [rowid])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, {columns}) "
+            f"VALUES (%s, %s, %s, {placeholders})",
+            [rowid, kind, pk] + [values[column] for column in SEARCH_COLUMNS]
+        )
+
+
+def _insert_profiles(cursor, student_ids=None, teacher_ids=None):
+    # INSERT ... SELECT straight from the profile tables; ``None`` means all rows.
+    columns = ', '.join(SEARCH_COLUMNS)
+    user_table = User._meta.db_table
+    name_sql = "TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, ''))"
+    for kind, ids, alias, select in (
+        (KIND_STUDENT, student_ids, 's',
+         f"SELECT s.id * 2, %s, s.id, {name_sql}, u.email, s.admission_number, "
+         f"s.roll_number, s.guardian_name, s.guardian_phone, '' "
+         f"FROM {Student._meta.db_table} s JOIN {user_table} u ON u.id = s.user_id"),
+        (KIND_TEACHER, teacher_ids, 't',
+         f"SELECT t.id * 2 + 1, %s, t.id, {name_sql}, u.email, '', '', '', '', t.employee_id "
+         f"FROM {Teacher._meta.db_table} t JOIN {user_table} u ON u.id = t.user_id"),
+    ):
+        if ids is None:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, {columns}) {select}", [kind])
+            continue
+        ids = list(ids)
+        for start in range(0, len(ids), SEARCH_BULK_CHUNK_SIZE):
+            chunk = ids[start:start + SEARCH_BULK_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})",
+                [_rowid(kind, pk) for pk in chunk]
+            )
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, {columns}) "
+                f"{select} WHERE {alias}.id IN ({placeholders})",
+                [kind] + chunk
+            )
+
+
+def index_profiles(student_ids=(), teacher_ids=()):
+    """Index many students and teachers at once, e.g. after a bulk_create that sent no signals."""
+    if not search_supported() or not (student_ids or teacher_ids):
+        return
+    with connection.cursor() as cursor:
+        _insert_profiles(cursor, student_ids, teacher_ids)
+
+
+def rebuild_search_index():
+    """
+    Repopulate the whole index with two set-based INSERT ... SELECT
+    statements and return the number of indexed rows.
+    """
+    if not search_supported():
+        return 0
+    ensure_search_index()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        _insert_profiles(cursor)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def build_match_expression(terms, columns=SEARCH_COLUMNS):
+    # Every word becomes a quoted prefix term so user input can never be
+    # parsed as FTS5 syntax; the terms are ANDed together and only match
+    # in ``columns``.
+    expression = ' '.join(f'"{term}"*' for term in terms)
+    if tuple(columns) == SEARCH_COLUMNS:
+        return expression
+    return f"{{{' '.join(columns)}}} : ({expression})"
+
+
+def search_index(query, kind=None, limit=20, offset=0, staff=False):
+    """
+    Return up to ``limit`` ranked matches for ``query`` plus a flag telling
+    whether more results exist past this page. Unless ``staff`` is set, the
+    STAFF_SEARCH_COLUMNS are neither matched nor returned.
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms or not search_supported():
+        return [], False
+
+    columns = SEARCH_COLUMNS if staff else tuple(
+        column for column in SEARCH_COLUMNS if column not in STAFF_SEARCH_COLUMNS
+    )
+    sql = (
+        f"SELECT kind, object_id, {', '.join(columns)} FROM {SEARCH_TABLE} "
+        f"WHERE {SEARCH_TABLE} MATCH %s"
+    )
+    params = [build_match_expression(terms, columns)]
+    if kind:
+        sql += " AND kind = %s"
+        params.append(kind)
+    # Ranking a one- or two-letter prefix means scoring most of the table,
+    # so such queries return matches in index order instead.
+    if max(len(term) for term in terms) >= 3:
+        sql += " ORDER BY rank"
+    sql += " LIMIT %s OFFSET %s"
+    params += [limit + 1, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+    return rows[:limit], len(rows) > limit
@@ -1,12 +1,16 @@
 # serializers.py
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from datetime import datetime
 
 from .models import (
     Student, Teacher, Class, Section, ClassSection, 
-    Subject, Attendance, Exam, ExamResult, Fee
+    Subject, Attendance, Exam, ExamResult, Fee, FeeSchedule, Job, RequestProfile
 )
+from .grading import grade_for_percentage
+from .archive import archived_years_between, attendance_querysets, is_archived
 
 User = get_user_model()
 
@@ -33,17 +37,61 @@ class StudentSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id', 'admission_date', 'attendance_percentage', 'pending_fees')
 
+    @staticmethod
+    def _count_per_student(queryset):
+        return Coalesce(
+            Subquery(
+                queryset.filter(student=OuterRef('pk')).order_by().values('student')
+                .annotate(count=Count('id')).values('count'),
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """
+        Join the user and class section and annotate the attendance and
+        pending fee counts, one subquery per attendance table, so a list of
+        any length is serialized in a single query.
+        """
+        total = present = Value(0)
+        for manager in attendance_querysets():
+            total = total + cls._count_per_student(manager.all())
+            present = present + cls._count_per_student(manager.filter(status='P'))
+        return queryset.select_related('user', 'class_section__class_name', 'class_section__section').annotate(
+            attendance_total=total,
+            attendance_present=present,
+            pending_fee_count=cls._count_per_student(Fee.objects.filter(status='PEN')),
+        )
+
     def get_class_section_name(self, obj):
-        return f"{obj.class_section.class_name.name} - {obj.class_section.section.name}"
+        return obj.get_class_section_label()
 
     def get_attendance_percentage(self, obj):
-        total_days = Attendance.objects.filter(student=obj).count()
+        # Batch loaders may precompute attendance_total / attendance_present
+        # and pending_fee_count to save the per-student count queries.
+        if hasattr(obj, 'attendance_total'):
+            total_days, present_days = obj.attendance_total, obj.attendance_present
+        else:
+            total_days = present_days = 0
+            # A list serializer reuses one child instance, so the archive
+            # catalog is read once per list rather than once per student.
+            if not hasattr(self, '_attendance_managers'):
+                self._attendance_managers = attendance_querysets()
+            for manager in self._attendance_managers:
+                counts = manager.filter(student=obj).aggregate(
+                    total=Count('id'), present=Count('id', filter=Q(status='P'))
+                )
+                total_days += counts['total']
+                present_days += counts['present']
         if total_days == 0:
             return 0
-        present_days = Attendance.objects.filter(student=obj, status='P').count()
         return round((present_days / total_days) * 100, 2)
 
     def get_pending_fees(self, obj):
+        if hasattr(obj, 'pending_fee_count'):
+            return obj.pending_fee_count
         return Fee.objects.filter(student=obj, status='PEN').count()
 
 class TeacherSerializer(serializers.ModelSerializer):
@@ -60,12 +108,25 @@ class TeacherSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id', 'date_joined')
 
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """
+        Load everything the serializer reads in a fixed number of queries.
+        ``prefix`` is the lookup path to the teacher when it is nested.
+        """
+        return queryset.select_related(f'{prefix}user').prefetch_related(
+            f'{prefix}subjects',
+            Prefetch(
+                f'{prefix}classsection_set',
+                queryset=ClassSection.objects.select_related('class_name', 'section')
+            ),
+        )
+
     def get_subjects_detail(self, obj):
         return [{'id': subject.id, 'name': subject.name} for subject in obj.subjects.all()]
 
     def get_class_sections(self, obj):
-        class_sections = ClassSection.objects.filter(class_teacher=obj)
-        return [f"{cs.class_name.name} - {cs.section.name}" for cs in class_sections]
+        return [f"{cs.class_name.name} - {cs.section.name}" for cs in obj.classsection_set.all()]
 
 class ClassSerializer(serializers.ModelSerializer):
     total_students = serializers.SerializerMethodField()
@@ -74,7 +135,13 @@ class ClassSerializer(serializers.ModelSerializer):
         model = Class
         fields = ('id', 'name', 'description', 'total_students')
 
+    @staticmethod
+    def annotate_queryset(queryset):
+        return queryset.annotate(total_students=Count('classsection__student'))
+
     def get_total_students(self, obj):
+        if hasattr(obj, 'total_students'):
+            return obj.total_students
         return Student.objects.filter(class_section__class_name=obj).count()
 
 class SectionSerializer(serializers.ModelSerializer):
@@ -97,7 +164,16 @@ class ClassSectionSerializer(serializers.ModelSerializer):
             'academic_year', 'room_number', 'students_count'
         )
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        queryset = queryset.select_related('section').prefetch_related(
+            Prefetch('class_name', queryset=ClassSerializer.annotate_queryset(Class.objects.all())),
+        ).annotate(students_count=Count('student'))
+        return TeacherSerializer.setup_eager_loading(queryset, prefix='class_teacher__')
+
     def get_students_count(self, obj):
+        if hasattr(obj, 'students_count'):
+            return obj.students_count
         return Student.objects.filter(class_section=obj).count()
 
 class SubjectSerializer(serializers.ModelSerializer):
@@ -107,9 +183,14 @@ class SubjectSerializer(serializers.ModelSerializer):
         model = Subject
         fields = ('id', 'name', 'code', 'description', 'credits', 'teachers')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(
+            Prefetch('teacher_set', queryset=Teacher.objects.select_related('user'))
+        )
+
     def get_teachers(self, obj):
-        teachers = Teacher.objects.filter(subjects=obj)
-        return [f"{teacher.user.first_name} {teacher.user.last_name}" for teacher in teachers]
+        return [f"{teacher.user.first_name} {teacher.user.last_name}" for teacher in obj.teacher_set.all()]
 
 class AttendanceSerializer(serializers.ModelSerializer):
     student_detail = serializers.SerializerMethodField()
@@ -123,11 +204,17 @@ class AttendanceSerializer(serializers.ModelSerializer):
             'remarks'
         )
 
+    def validate_date(self, value):
+        # Archived years are read-only; a new hot row would collide with the restore.
+        if archived_years_between(value, value):
+            raise serializers.ValidationError('Attendance of archived academic years cannot be edited.')
+        return value
+
     def get_student_detail(self, obj):
         return {
-            'name': f"{obj.student.user.first_name} {obj.student.user.last_name}",
+            'name': obj.student.get_display_name(),
             'admission_number': obj.student.admission_number,
-            'class_section': f"{obj.student.class_section.class_name.name} - {obj.student.class_section.section.name}"
+            'class_section': obj.student.get_class_section_label()
         }
 
 class ExamSerializer(serializers.ModelSerializer):
@@ -163,11 +250,16 @@ class ExamResultSerializer(serializers.ModelSerializer):
             'max_marks', 'percentage', 'grade', 'remarks'
         )
 
+    def validate_exam(self, value):
+        if is_archived(value.academic_year):
+            raise serializers.ValidationError('Results of archived academic years cannot be edited.')
+        return value
+
     def get_student_detail(self, obj):
         return {
-            'name': f"{obj.student.user.first_name} {obj.student.user.last_name}",
+            'name': obj.student.get_display_name(),
             'admission_number': obj.student.admission_number,
-            'class_section': f"{obj.student.class_section.class_name.name} - {obj.student.class_section.section.name}"
+            'class_section': obj.student.get_class_section_label()
         }
 
     def get_subject_detail(self, obj):
@@ -177,22 +269,16 @@ class ExamResultSerializer(serializers.ModelSerializer):
         }
 
     def get_percentage(self, obj):
-        return round((obj.marks_obtained / obj.max_marks) * 100, 2)
+        # Always the Decimal from the marks, whether or not the row carries
+        # the float annotation of ExamResult.objects.with_grades().
+        return round(obj.marks_obtained * 100 / obj.max_marks, 2)
 
     def get_grade(self, obj):
-        percentage = self.get_percentage(obj)
-        if percentage >= 90:
-            return 'A+'
-        elif percentage >= 80:
-            return 'A'
-        elif percentage >= 70:
-            return 'B'
-        elif percentage >= 60:
-            return 'C'
-        elif percentage >= 50:
-            return 'D'
-        else:
-            return 'F'
+        # Querysets built with with_grades() carry the database-computed
+        # grade; both grade the unrounded percentage.
+        if getattr(obj, 'grade', None) is not None:
+            return obj.grade
+        return grade_for_percentage(obj.marks_obtained * 100 / obj.max_marks)
 
 class FeeSerializer(serializers.ModelSerializer):
     student_detail = serializers.SerializerMethodField()
@@ -204,17 +290,17 @@ class FeeSerializer(serializers.ModelSerializer):
         model = Fee
         fields = (
             'id', 'student', 'student_detail', 'fee_type',
-            'fee_type_display', 'amount', 'due_date',
+            'fee_type_display', 'amount', 'paid_amount', 'due_date',
             'paid_date', 'status', 'status_display',
             'payment_method', 'receipt_number', 'is_overdue'
         )
-        read_only_fields = ('is_overdue',)
+        read_only_fields = ('paid_amount', 'is_overdue')
 
     def get_student_detail(self, obj):
         return {
-            'name': f"{obj.student.user.first_name} {obj.student.user.last_name}",
+            'name': obj.student.get_display_name(),
             'admission_number': obj.student.admission_number,
-            'class_section': f"{obj.student.class_section.class_name.name} - {obj.student.class_section.section.name}"
+            'class_section': obj.student.get_class_section_label()
         }
 
     def get_is_overdue(self, obj):
@@ -222,6 +308,24 @@ class FeeSerializer(serializers.ModelSerializer):
             return True
         return False
 
+class FeeScheduleSerializer(serializers.ModelSerializer):
+    fee_type_display = serializers.CharField(source='get_fee_type_display', read_only=True)
+
+    class Meta:
+        model = FeeSchedule
+        fields = (
+            'id', 'class_name', 'class_section', 'academic_year',
+            'fee_type', 'fee_type_display', 'amount', 'due_date', 'is_active'
+        )
+
+    def validate(self, data):
+        if bool(data.get('class_name')) == bool(data.get('class_section')):
+            raise serializers.ValidationError("Set exactly one of class_name or class_section.")
+        class_section = data.get('class_section')
+        if class_section and class_section.academic_year != data.get('academic_year'):
+            raise serializers.ValidationError("academic_year must match the class section's academic year.")
+        return data
+
 class StudentAttendanceReportSerializer(serializers.Serializer):
     total_days = serializers.IntegerField()
     present_days = serializers.IntegerField()
@@ -242,5 +346,36 @@ class StudentAcademicReportSerializer(serializers.Serializer):
     attendance_summary = StudentAttendanceReportSerializer()
     fee_summary = StudentFeeSummarySerializer()
     exam_results = ExamResultSerializer(many=True)
-    class_rank = serializers.IntegerField()
-    overall_grade = serializers.CharField()
\ No newline at end of file
+    overall_percentage = serializers.FloatField()
+    class_rank = serializers.IntegerField(allow_null=True)
+    overall_grade = serializers.CharField(allow_null=True)
+
+class JobSerializer(serializers.ModelSerializer):
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'task', 'params', 'status', 'status_display',
+            'progress', 'progress_message', 'result', 'result_file',
+            'error', 'attempts', 'max_attempts', 'created_at',
+            'started_at', 'finished_at'
+        )
+        read_only_fields = fields
+
+class RequestProfileSerializer(serializers.ModelSerializer):
+    mode_display = serializers.CharField(source='get_mode_display', read_only=True)
+
+    class Meta:
+        model = RequestProfile
+        fields = (
+            'id', 'method', 'path', 'url_name', 'status_code', 'mode', 'mode_display',
+            'duration_ms', 'sql_count', 'sql_time_ms', 'stats_file', 'collapsed_file',
+            'user', 'created_at'
+        )
+        read_only_fields = fields
+
+class RequestProfileDetailSerializer(RequestProfileSerializer):
+    class Meta(RequestProfileSerializer.Meta):
+        fields = RequestProfileSerializer.Meta.fields + ('sql_summary', 'hotspots')
+        read_only_fields = fields
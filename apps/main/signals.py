@@ -0,0 +1,251 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    Student, Teacher, Class, Section, ClassSection,
+    Subject, Attendance, Exam, ExamResult, Fee
+)
+from .representation_cache import invalidate_representations
+from .changelog import record_changes, INSERTED, UPDATED, DELETED
+from .events import attendance_event, broadcaster, fee_event, publish_on_commit
+from . import search
+
+User = get_user_model()
+
+# User fields copied into Student.display_name and the search index, and
+# embedded in student and teacher representations.
+DISPLAY_NAME_FIELDS = frozenset(('first_name', 'last_name'))
+SEARCH_USER_FIELDS = frozenset(('email', 'first_name', 'last_name'))
+PROFILE_USER_FIELDS = frozenset(('email', 'first_name', 'last_name', 'phone_number', 'role'))
+
+
+def _user_fields_changed(fields, created, update_fields):
+    # Saves such as update_last_login name their fields; skip those that touch none of ``fields``.
+    return not created and (update_fields is None or not fields.isdisjoint(update_fields))
+
+
+# Denormalized student display columns
+@receiver(pre_save, sender=Student)
+def set_student_display_columns(sender, instance, **kwargs):
+    instance.display_name = Student.build_display_name(instance.user)
+    labels = ClassSection.objects.filter(pk=instance.class_section_id).values_list('class_name__name', 'section__name')
+    instance.class_section_label = ' - '.join(labels.first() or ())
+
+
+def _relabel_students(class_sections):
+    for class_section in class_sections.select_related('class_name', 'section'):
+        Student.objects.filter(class_section=class_section).exclude(
+            class_section_label=Student.build_class_section_label(class_section)
+        ).update(class_section_label=Student.build_class_section_label(class_section))
+
+
+@receiver(post_save, sender=User)
+def rename_student_profile(sender, instance, created, update_fields=None, **kwargs):
+    if _user_fields_changed(DISPLAY_NAME_FIELDS, created, update_fields):
+        Student.objects.filter(user=instance).exclude(
+            display_name=Student.build_display_name(instance)
+        ).update(display_name=Student.build_display_name(instance))
+
+
+@receiver(post_save, sender=ClassSection)
+def relabel_class_section_students(sender, instance, created, **kwargs):
+    if not created:
+        _relabel_students(ClassSection.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Class)
+@receiver(post_save, sender=Section)
+def relabel_class_or_section_students(sender, instance, created, **kwargs):
+    if not created:
+        field = 'class_name' if sender is Class else 'section'
+        _relabel_students(ClassSection.objects.filter(**{field: instance}))
+
+
+# Search index sync
+@receiver(post_save, sender=Student)
+def index_student_on_save(sender, instance, **kwargs):
+    search.index_student(instance)
+
+
+@receiver(post_delete, sender=Student)
+def unindex_student_on_delete(sender, instance, **kwargs):
+    search.remove_from_index(search.KIND_STUDENT, instance.pk)
+
+
+@receiver(post_save, sender=Teacher)
+def index_teacher_on_save(sender, instance, **kwargs):
+    search.index_teacher(instance)
+
+
+@receiver(post_delete, sender=Teacher)
+def unindex_teacher_on_delete(sender, instance, **kwargs):
+    search.remove_from_index(search.KIND_TEACHER, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def reindex_profiles_on_user_save(sender, instance, created, update_fields=None, **kwargs):
+    if not _user_fields_changed(SEARCH_USER_FIELDS, created, update_fields):
+        return
+    for profile in Student.objects.filter(user=instance).select_related('user'):
+        search.index_student(profile)
+    for profile in Teacher.objects.filter(user=instance).select_related('user'):
+        search.index_teacher(profile)
+
+
+# Exam result versioning
+@receiver(post_save, sender=ExamResult)
+@receiver(post_delete, sender=ExamResult)
+def bump_exam_results_version(sender, instance, **kwargs):
+    Exam.bump_results_version([instance.exam_id])
+    # Exams report result counts, so their synced representation changed too.
+    record_changes(Exam, [instance.exam_id])
+
+
+# Representation cache invalidation
+def _invalidate_class_sections(class_sections):
+    class_sections = list(class_sections.values_list('id', 'class_teacher_id'))
+    invalidate_representations(ClassSection, [pk for pk, _ in class_sections])
+    teacher_ids = [teacher_id for _, teacher_id in class_sections if teacher_id]
+    invalidate_representations(Teacher, teacher_ids)
+    record_changes(Teacher, teacher_ids)
+
+
+@receiver(pre_save, sender=Student)
+def remember_previous_class_section(sender, instance, **kwargs):
+    instance._previous_class_section_id = (
+        Student.objects.filter(pk=instance.pk).values_list('class_section_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def invalidate_student_representation(sender, instance, **kwargs):
+    invalidate_representations(Student, [instance.pk])
+    if kwargs.get('created') is False:
+        # Fees embed the student's name and class section.
+        record_changes(Fee, Fee.objects.filter(student_id=instance.pk).values_list('id', flat=True))
+    # Class sections show their own student count and, through the class,
+    # the count of every section of it; the student may just have moved.
+    class_section_ids = {instance.class_section_id, getattr(instance, '_previous_class_section_id', None)}
+    invalidate_representations(ClassSection, ClassSection.objects.filter(
+        class_name__in=ClassSection.objects.filter(pk__in=class_section_ids - {None}).values('class_name')
+    ).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+@receiver(post_save, sender=Fee)
+@receiver(post_delete, sender=Fee)
+def invalidate_student_counts(sender, instance, **kwargs):
+    invalidate_representations(Student, [instance.student_id])
+    record_changes(Student, [instance.student_id])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_profiles(sender, instance, created, update_fields=None, **kwargs):
+    if not _user_fields_changed(PROFILE_USER_FIELDS, created, update_fields):
+        return
+    student_ids = list(Student.objects.filter(user=instance).values_list('id', flat=True))
+    invalidate_representations(Student, student_ids)
+    record_changes(Student, student_ids)
+    record_changes(Fee, Fee.objects.filter(student_id__in=student_ids).values_list('id', flat=True))
+    teacher_ids = list(Teacher.objects.filter(user=instance).values_list('id', flat=True))
+    if teacher_ids:
+        invalidate_representations(Teacher, teacher_ids)
+        record_changes(Teacher, teacher_ids)
+        _invalidate_class_sections(ClassSection.objects.filter(class_teacher_id__in=teacher_ids))
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def invalidate_teacher_representation(sender, instance, **kwargs):
+    invalidate_representations(Teacher, [instance.pk])
+    _invalidate_class_sections(ClassSection.objects.filter(class_teacher_id=instance.pk))
+
+
+@receiver(m2m_changed, sender=Teacher.subjects.through)
+def invalidate_teacher_subjects(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Teacher):
+        teacher_ids = [instance.pk]
+    else:
+        teacher_ids = list(pk_set or Teacher.objects.filter(subjects=instance).values_list('id', flat=True))
+    invalidate_representations(Teacher, teacher_ids)
+    record_changes(Teacher, teacher_ids)
+    _invalidate_class_sections(ClassSection.objects.filter(class_teacher_id__in=teacher_ids))
+
+
+@receiver(post_save, sender=Subject)
+def invalidate_subject_teachers(sender, instance, **kwargs):
+    teacher_ids = list(Teacher.objects.filter(subjects=instance).values_list('id', flat=True))
+    invalidate_representations(Teacher, teacher_ids)
+    record_changes(Teacher, teacher_ids)
+    _invalidate_class_sections(ClassSection.objects.filter(class_teacher_id__in=teacher_ids))
+
+
+@receiver(pre_save, sender=ClassSection)
+def remember_previous_class_teacher(sender, instance, **kwargs):
+    instance._previous_class_teacher_id = (
+        ClassSection.objects.filter(pk=instance.pk).values_list('class_teacher_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=ClassSection)
+@receiver(post_delete, sender=ClassSection)
+def invalidate_class_section_representation(sender, instance, **kwargs):
+    invalidate_representations(ClassSection, [instance.pk])
+    student_ids = list(Student.objects.filter(class_section_id=instance.pk).values_list('id', flat=True))
+    invalidate_representations(Student, student_ids)
+    record_changes(Student, student_ids)
+    teacher_ids = list(filter(None, [
+        instance.class_teacher_id, getattr(instance, '_previous_class_teacher_id', None)
+    ]))
+    invalidate_representations(Teacher, teacher_ids)
+    record_changes(Teacher, teacher_ids)
+
+
+@receiver(post_save, sender=Class)
+@receiver(post_save, sender=Section)
+def invalidate_class_or_section(sender, instance, **kwargs):
+    field = 'class_name' if sender is Class else 'section'
+    class_sections = ClassSection.objects.filter(**{field: instance})
+    _invalidate_class_sections(class_sections)
+    student_ids = list(Student.objects.filter(class_section__in=class_sections).values_list('id', flat=True))
+    invalidate_representations(Student, student_ids)
+    record_changes(Student, student_ids)
+    record_changes(Fee, Fee.objects.filter(student_id__in=student_ids).values_list('id', flat=True))
+
+
+# Delta-sync change log
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Teacher)
+@receiver(post_save, sender=Exam)
+@receiver(post_save, sender=Fee)
+def log_synced_save(sender, instance, created, **kwargs):
+    record_changes(sender, [instance.pk], INSERTED if created else UPDATED)
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Teacher)
+@receiver(post_delete, sender=Exam)
+@receiver(post_delete, sender=Fee)
+def log_synced_delete(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], DELETED)
+
+
+# Live event stream
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def publish_attendance_event(sender, instance, **kwargs):
+    if broadcaster.has_subscribers():
+        publish_on_commit(attendance_event, instance, 'created' not in kwargs)
+
+
+@receiver(post_save, sender=Fee)
+def publish_fee_event(sender, instance, **kwargs):
+    if broadcaster.has_subscribers():
+        publish_on_commit(fee_event, instance)
@@ -1,3 +1,832 @@
-from django.test import TestCase
+import asyncio
+import csv
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.accounts.models import CustomUser
+
+from .archive import archive_academic_year, restore_academic_year
+from .events import Subscription, broadcaster, sse_application
+from .fees import reconcile_payments
+from .idempotency import IDEMPOTENCY_CACHE, purge_expired_keys
+from .jobs import claim_jobs, run_job
+from .paginators import EstimatedCountPaginator
+from .querylog import fingerprint, query_stats
+from .search import rebuild_search_index
+from .serializers import ExamResultSerializer
+from .throttling import heavy_in_flight, token_buckets
+from .models import (
+    AcademicYearArchive, Attendance, ChangeLogEntry, Class, ClassSection, Exam, ExamResult, Fee, FeeSchedule, Job, RequestProfile, Section,
+    Student, Subject, Teacher,
+)
+
+
+class SchoolFixtures:
+    """One class section with a teacher, a subject, an exam and a few students."""
+
+    student_count = 3
+
+    @classmethod
+    def create_school(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin@example.com', 'pw')
+        teacher_user = CustomUser.objects.create_user(
+            'teacher@example.com', 'pw', first_name='Tess', last_name='Teacher'
+        )
+        cls.teacher = Teacher.objects.create(
+            user=teacher_user, employee_id='T001', qualification='MSc', experience_years=5
+        )
+        cls.subject = Subject.objects.create(name='Mathematics', code='MATH')
+        cls.teacher.subjects.add(cls.subject)
+        cls.class_section = ClassSection.objects.create(
+            class_name=Class.objects.create(name='Grade 5'),
+            section=Section.objects.create(name='A'),
+            class_teacher=cls.teacher,
+            academic_year='2023-2024',
+        )
+        cls.exam = Exam.objects.create(
+            name='Midterm', exam_type='MID', start_date=date(2024, 3, 1),
+            end_date=date(2024, 3, 5), academic_year='2023-2024',
+        )
+        cls.students = []
+        for index in range(cls.student_count):
+            user = CustomUser.objects.create_user(
+                f'student{index}@example.com', 'pw', first_name=f'Stu{index}', last_name='Dent', role='student'
+            )
+            student = Student.objects.create(
+                user=user, admission_number=f'ADM{index:03}', roll_number=str(index + 1),
+                date_of_birth=date(2012, 1, 1), gender='F', address='1 School Road',
+                guardian_name=f'Guardian{index}', guardian_phone=f'55500{index}',
+                class_section=cls.class_section,
+            )
+            ExamResult.objects.create(
+                exam=cls.exam, student=student, subject=cls.subject, marks_obtained=60 + index * 10, max_marks=100
+            )
+            Attendance.objects.create(student=student, date=date(2024, 3, 1), status='P' if index % 2 else 'A')
+            Fee.objects.create(student=student, fee_type='TUI', amount=100, due_date=date(2024, 1, 1))
+            cls.students.append(student)
+
+    def setUp(self):
+        # Token buckets live in the process; start every test with full ones.
+        token_buckets.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def use_temporary_media_root(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return media_root.name
+
+
+class SchoolTestCase(SchoolFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_school()
+
+
+class GenerateReportCardsCommandTests(SchoolTestCase):
+    def test_writes_a_file_per_student_and_a_summary(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            call_command(
+                'generate_report_cards', class_section=self.class_section.id,
+                output=output_dir, workers=1, stdout=StringIO(),
+            )
+            with open(os.path.join(output_dir, 'summary.csv')) as handle:
+                rows = list(csv.DictReader(handle))
+            self.assertEqual(
+                sorted(row['admission_number'] for row in rows),
+                [student.admission_number for student in self.students],
+            )
+            for student in self.students:
+                self.assertTrue(os.path.exists(os.path.join(output_dir, f'{student.id}-{student.admission_number}.html')))
+
+
+class AttendanceMatrixTests(SchoolTestCase):
+    url = '/main/attendance/matrix/'
+
+    def test_packs_one_status_code_per_day(self):
+        response = self.client.get(self.url, {
+            'class_section': self.class_section.id, 'start_date': '2024-02-29', 'end_date': '2024-03-02',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['matrix'], ['-A-', '-P-', '-A-'])
+
+    def test_rejects_a_non_integer_class_section(self):
+        response = self.client.get(self.url, {
+            'class_section': 'abc', 'start_date': '2024-03-01', 'end_date': '2024-03-02',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class FeePaymentTests(SchoolTestCase):
+    url = '/main/fees/payment/'
+
+    def setUp(self):
+        super().setUp()
+        self.fee = Fee.objects.get(student=self.students[0])
+
+    def test_partial_payments_add_up(self):
+        for paid_amount in ('30.00', '25.50'):
+            response = self.client.post(self.url, {'fee_id': self.fee.id, 'paid_amount': paid_amount}, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.fee.refresh_from_db()
+        self.assertEqual(self.fee.paid_amount, Decimal('55.50'))
+        self.assertEqual(self.fee.status, 'PEN')
+
+    def test_settles_the_balance_without_paid_amount(self):
+        response = self.client.post(self.url, {'fee_id': self.fee.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'PAI')
+
+    def test_rejects_non_finite_and_excess_amounts(self):
+        for paid_amount in ('NaN', 'Infinity', 'abc', '100.01'):
+            response = self.client.post(self.url, {'fee_id': self.fee.id, 'paid_amount': paid_amount}, format='json')
+            self.assertEqual(response.status_code, 400, paid_amount)
+        self.fee.refresh_from_db()
+        self.assertEqual(self.fee.paid_amount, 0)
+
+
+class ReconcilePaymentsTests(SchoolTestCase):
+    def reconcile(self, rows):
+        with tempfile.TemporaryDirectory() as output_dir:
+            summary = reconcile_payments(rows, output_dir)
+            reports = {}
+            for outcome, path in summary['reports'].items():
+                with open(path) as handle:
+                    reports[outcome] = list(csv.DictReader(handle))
+        return summary, reports
+
+    def test_reports_matched_partial_overpaid_and_unmatched_lines(self):
+        summary, reports = self.reconcile([
+            {'admission_number': 'ADM000', 'amount': '100.00', 'date': '2024-02-01'},
+            {'admission_number': 'ADM001', 'amount': '40.00', 'date': '2024-02-01'},
+            {'admission_number': 'ADM002', 'amount': '150.00', 'date': '2024-02-01'},
+            {'admission_number': 'NOPE', 'amount': '10.00', 'date': '2024-02-01'},
+        ])
+        self.assertEqual(
+            [summary[outcome] for outcome in ('matched', 'partial', 'overpaid', 'unmatched')], [1, 1, 1, 1]
+        )
+        self.assertEqual(reports['overpaid'][0]['unapplied_amount'], '50.00')
+        self.assertEqual(summary['applied_amount'], '240.00')
+        fees = {fee.student_id: fee for fee in Fee.objects.all()}
+        self.assertEqual(fees[self.students[1].id].paid_amount, Decimal('40.00'))
+        self.assertEqual(fees[self.students[2].id].status, 'PAI')
+
+    def test_keeps_payments_recorded_while_reconciling(self):
+        fee = Fee.objects.get(student=self.students[0])
+
+        def rows():
+            yield {'admission_number': 'ADM000', 'amount': '60.00', 'date': '2024-02-01'}
+            # Paid at the counter after the reconciliation loaded its balances.
+            Fee.objects.filter(pk=fee.pk).update(paid_amount=70)
+
+        summary, reports = self.reconcile(rows())
+        fee.refresh_from_db()
+        self.assertEqual(fee.paid_amount, Decimal('70.00'))
+        self.assertEqual(summary['overpaid'], 1)
+        self.assertEqual(reports['overpaid'][0]['reason'], 'fee was paid during reconciliation')
+        self.assertEqual(summary['applied_amount'], '0')
+
+
+class SyncChangesTests(SchoolTestCase):
+    url = '/main/sync/'
+
+    def test_returns_objects_changed_since_the_cursor(self):
+        cursor = self.client.get(self.url).data['cursor']
+        student = self.students[0]
+        student.roll_number = '42'
+        student.save()
+        Fee.objects.get(student=self.students[1]).delete()
+
+        response = self.client.get(self.url, {'since': cursor})
+        self.assertEqual(response.status_code, 200)
+        changes = response.data['changes']
+        self.assertEqual([row['id'] for row in changes['students']['updated']], [student.id, self.students[1].id])
+        self.assertEqual(changes['students']['updated'][0]['roll_number'], '42')
+        self.assertEqual(len(changes['fees']['deleted']), 1)
+        self.assertGreater(response.data['cursor'], cursor)
+
+    def test_logs_one_entry_per_edit(self):
+        before = ChangeLogEntry.objects.count()
+        for roll_number in ('7', '8'):
+            self.students[0].roll_number = roll_number
+            self.students[0].save()
+        self.assertEqual(ChangeLogEntry.objects.filter(id__gt=before, model='students').count(), 2)
+
+    def test_login_bookkeeping_saves_log_nothing(self):
+        user = self.students[0].user
+        before = ChangeLogEntry.objects.count()
+        user.last_login = now()
+        user.save(update_fields=['last_login'])
+        self.assertEqual(ChangeLogEntry.objects.count(), before)
+
+        user.first_name = 'Renamed'
+        user.save(update_fields=['first_name'])
+        self.assertEqual(
+            set(ChangeLogEntry.objects.filter(id__gt=before).values_list('model', flat=True)), {'students', 'fees'}
+        )
+
+
+class UserSaveSignalTests(SchoolTestCase):
+    def test_renaming_a_user_renames_the_student(self):
+        user = self.students[0].user
+        user.last_name = 'Renamed'
+        user.save()
+        self.assertEqual(Student.objects.get(user=user).display_name, 'Stu0 Renamed')
+
+    def test_last_login_save_leaves_profiles_alone(self):
+        user = self.students[0].user
+        user.last_login = now()
+        with CaptureQueriesContext(connection) as queries:
+            user.save(update_fields=['last_login'])
+        self.assertFalse([query for query in queries if 'UPDATE "main_student"' in query['sql']])
+        # Only the user row itself is written.
+        self.assertEqual(len(queries), 1)
+
+
+class SearchDirectoryTests(SchoolTestCase):
+    url = '/main/search/'
+
+    def test_finds_students_by_name_prefix(self):
+        response = self.client.get(self.url, {'q': 'stu1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['object_id'] for row in response.data['results']], [self.students[1].id])
+
+    def test_follows_user_renames(self):
+        user = self.students[2].user
+        user.first_name = 'Zebedee'
+        user.save(update_fields=['first_name'])
+        results = self.client.get(self.url, {'q': 'zeb'}).data['results']
+        self.assertEqual([row['object_id'] for row in results], [self.students[2].id])
+
+    def test_guardian_phone_is_staff_only(self):
+        self.assertEqual(len(self.client.get(self.url, {'q': '555001'}).data['results']), 1)
+        self.client.force_authenticate(self.students[0].user)
+        self.assertEqual(self.client.get(self.url, {'q': '555001'}).data['results'], [])
+        results = self.client.get(self.url, {'q': 'stu1'}).data['results']
+        self.assertNotIn('guardian_phone', results[0])
+
+    def test_rebuild_indexes_every_profile(self):
+        self.assertEqual(rebuild_search_index(), len(self.students) + 1)
+
+
+class StudentListTests(SchoolTestCase):
+    url = '/main/students/'
+
+    def setUp(self):
+        super().setUp()
+        caches['representations'].clear()
+
+    def list_students(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return {row['id']: row for row in response.data}
+
+    def test_cold_list_needs_no_query_per_student(self):
+        with CaptureQueriesContext(connection) as cold:
+            rows = self.list_students()
+        self.assertEqual(len(rows), len(self.students))
+        self.assertLessEqual(len(cold), 4)
+        self.assertEqual(rows[self.students[1].id]['attendance_percentage'], 100)
+        self.assertEqual(rows[self.students[0].id]['pending_fees'], 1)
+
+    def test_changes_replace_cached_representations(self):
+        student = self.students[0]
+        self.assertEqual(self.list_students()[student.id]['attendance_percentage'], 0)
+        Attendance.objects.create(student=student, date=date(2024, 3, 2), status='P')
+        student.roll_number = '99'
+        student.save()
+        row = self.list_students()[student.id]
+        self.assertEqual(row['attendance_percentage'], 50)
+        self.assertEqual(row['roll_number'], '99')
+
+    def test_saving_a_stale_instance_does_not_revive_old_representations(self):
+        stale = Student.objects.get(pk=self.students[0].pk)
+        self.list_students()
+        Fee.objects.filter(student=stale).update(status='PAI')
+        Fee.objects.filter(student=stale).first().save()
+        self.assertEqual(self.list_students()[stale.id]['pending_fees'], 0)
+        stale.save()
+        self.assertEqual(self.list_students()[stale.id]['pending_fees'], 0)
+
+
+class ExamResultGradeTests(SchoolTestCase):
+    def test_serializer_and_database_grades_agree(self):
+        result = ExamResult.objects.get(student=self.students[0])
+        result.marks_obtained, result.max_marks = Decimal('179.99'), Decimal('200')
+        result.save()
+        plain = ExamResultSerializer(ExamResult.objects.get(pk=result.pk)).data
+        annotated = ExamResultSerializer(ExamResult.objects.with_grades().get(pk=result.pk)).data
+        self.assertEqual(plain['grade'], 'A')
+        self.assertEqual(annotated['grade'], 'A')
+        self.assertEqual(plain['percentage'], annotated['percentage'])
+        self.assertIsInstance(annotated['percentage'], Decimal)
+
+    def test_results_filter_by_grade(self):
+        response = self.client.get('/main/exams/results/', {'exam': self.exam.id, 'grade': 'B'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['student'] for row in response.data], [self.students[1].id])
+
+
+class BackgroundJobTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = self.use_temporary_media_root()
+
+    def run_jobs(self):
+        return [run_job(job.pk, job.locked_by) for job in claim_jobs(10)]
+
+    def test_worker_runs_submitted_jobs(self):
+        response = self.client.post('/main/jobs/', {
+            'task': 'generate_term_fees', 'params': {'academic_year': '2023-2024', 'dry_run': True},
+        }, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.run_jobs(), ['SUC'])
+        job = self.client.get(f"/main/jobs/{response.data['id']}/").data
+        self.assertEqual(job['status'], 'SUC')
+        self.assertEqual(job['result']['academic_year'], '2023-2024')
+        self.assertEqual(claim_jobs(10), [])
+
+    def test_rejects_input_paths_outside_the_upload_directory(self):
+        for path in ('/etc/passwd', '../../etc/passwd', 'jobs/uploads/../../secret.csv', 'jobs/uploads'):
+            response = self.client.post('/main/jobs/', {
+                'task': 'reconcile_payments', 'params': {'path': path},
+            }, format='json')
+            self.assertEqual(response.status_code, 400, path)
+        self.assertFalse(Job.objects.exists())
+
+    def test_uploaded_statement_is_removed_once_reconciled(self):
+        statement = SimpleUploadedFile('statement.csv', b'admission_number,amount,date\nADM000,100.00,2024-02-01\n')
+        response = self.client.post('/main/fees/reconcile/', {'statement': statement}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        upload_path = os.path.join(self.media_root, Job.objects.get().params['path'])
+        self.assertTrue(os.path.exists(upload_path))
+
+        self.assertEqual(self.run_jobs(), ['SUC'])
+        self.assertFalse(os.path.exists(upload_path))
+        self.assertEqual(Fee.objects.get(student=self.students[0]).status, 'PAI')
+
+    def test_onboarding_upload_creates_users_and_reports_bad_rows(self):
+        rows = (
+            'email,password,first_name,last_name,profile,class_section,admission_number,roll_number,date_of_birth,'
+            'gender,address,guardian_name,guardian_phone,employee_id,qualification,experience_years,subjects\n'
+            f'new.student@example.com,s3cret,New,Student,student,{self.class_section.pk},ADM100,10,2012-05-01,'
+            'M,2 School Road,Parent,555100,,,,\n'
+            'new.teacher@example.com,s3cret,New,Teacher,teacher,,,,,,,,,T100,BEd,2,MATH\n'
+            'student0@example.com,s3cret,Dup,Licate,,,,,,,,,,,,,\n'
+            'lost@example.com,s3cret,Lost,Student,student,999,ADM101,11,2012-05-01,M,Road,Parent,555101,,,,\n'
+        )
+        upload = SimpleUploadedFile('users.csv', rows.encode())
+        response = self.client.post('/main/onboarding/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.run_jobs(), ['SUC'])
+
+        result = Job.objects.get().result
+        self.assertEqual((result['rows'], result['created'], result['failed']), (4, 2, 2))
+        student = Student.objects.get(admission_number='ADM100')
+        self.assertEqual((student.display_name, student.class_section_label), ('New Student', 'Grade 5 - A'))
+        self.assertTrue(student.user.check_password('s3cret'))
+        teacher = Teacher.objects.get(employee_id='T100')
+        self.assertEqual(list(teacher.subjects.values_list('code', flat=True)), ['MATH'])
+        self.assertFalse(CustomUser.objects.filter(email='lost@example.com').exists())
+
+
+class IdempotencyKeyTests(SchoolTestCase):
+    url = '/main/fees/payment/'
+
+    def pay(self, key, paid_amount):
+        fee = Fee.objects.get(student=self.students[0])
+        return self.client.post(
+            self.url, {'fee_id': fee.id, 'paid_amount': paid_amount}, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_a_retried_key_replays_the_first_response(self):
+        first = self.pay('payment-1', '40.00')
+        retry = self.pay('payment-1', '40.00')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Fee.objects.get(student=self.students[0]).paid_amount, Decimal('40.00'))
+
+    def test_a_reused_key_with_another_body_is_rejected(self):
+        self.pay('payment-2', '40.00')
+        self.assertEqual(self.pay('payment-2', '50.00').status_code, 422)
+
+    def test_purges_expired_keys(self):
+        cache = caches[IDEMPOTENCY_CACHE]
+        cache.set('expired', 1, -1)
+        cache.set('live', 1, 60)
+        self.assertEqual(purge_expired_keys(), 1)
+        self.assertEqual(cache.get('live'), 1)
+
+
+class RequestProfilingTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media_root()
+        # The middleware runs before DRF, so it only sees JWT credentials.
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin)}')
+
+    def test_staff_can_ask_for_a_profile(self):
+        response = self.client.get('/main/subjects/', HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.url_name, 'subject-list')
+        self.assertTrue(profile.stats_file)
+        self.assertEqual(self.client.get(f'/main/profiles/{profile.id}/').data['url_name'], 'subject-list')
+
+    def test_a_failed_save_does_not_fail_the_request(self):
+        with mock.patch.object(RequestProfile, 'save', side_effect=OSError('disk full')), \
+                self.assertLogs('apps.main.profiling', 'ERROR'):
+            response = self.client.get('/main/subjects/', HTTP_X_PROFILE='sample')
+        self.assertEqual(response.status_code, 200)
+
+
+class RequestLimitTests(SchoolTestCase):
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'read': '2/min'}})
+    def test_an_empty_bucket_answers_429(self):
+        self.assertEqual(self.client.get('/main/subjects/').status_code, 200)
+        self.assertEqual(self.client.get('/main/subjects/').status_code, 200)
+        response = self.client.get('/main/subjects/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_heavy_views_give_their_slot_back(self):
+        self.assertEqual(self.client.get('/main/dashboard/').status_code, 200)
+        self.assertEqual(heavy_in_flight.count, 0)
+
+    @override_settings(THROTTLE_MAX_HEAVY_IN_FLIGHT=0)
+    def test_heavy_views_are_shed_once_authenticated(self):
+        response = self.client.get('/main/dashboard/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        # Unauthenticated requests are turned away before they could take a slot.
+        self.assertEqual(APIClient().get('/main/dashboard/').status_code, 401)
+        response = self.client.post('/main/batch/', {'requests': [{'path': '/main/dashboard/'}]}, format='json')
+        self.assertEqual(response.data['responses'][0]['status'], 503)
+        self.assertEqual(heavy_in_flight.count, 0)
+
+
+class AdminChangelistTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def test_large_changelists_render_and_search_exact_columns(self):
+        for model in ('attendance', 'examresult', 'fee'):
+            response = self.client.get(f'/admin/main/{model}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['cl'].result_count, self.student_count)
+        response = self.client.get('/admin/main/fee/', {'q': 'ADM001'})
+        self.assertEqual([fee.student.admission_number for fee in response.context['cl'].result_list], ['ADM001'])
+
+    def test_estimated_count(self):
+        attendance = Attendance.objects.order_by('pk')
+        self.assertEqual(EstimatedCountPaginator(attendance, 10).count, attendance.last().pk)
+        paginator = EstimatedCountPaginator(attendance.filter(status='A'), 10)
+        paginator.count_limit = 1
+        self.assertEqual(paginator.count, 1)
+
+
+class ExamAnalyticsTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+
+    def test_distribution_and_grade_histogram(self):
+        response = self.client.get(f'/main/exams/{self.exam.pk}/analytics/')
+        self.assertEqual(response.status_code, 200)
+        overall = response.data['overall']
+        self.assertEqual((overall['count'], overall['mean'], overall['median'], overall['pass_rate']), (3, 70.0, 70.0, 100.0))
+        self.assertEqual(overall['percentiles']['p50'], 70.0)
+        self.assertEqual(overall['grade_histogram'], {'A+': 0, 'A': 1, 'B': 1, 'C': 1, 'D': 0, 'F': 0})
+        self.assertEqual(response.data['by_subject'][self.subject.pk]['count'], 3)
+
+    def test_a_result_change_invalidates_the_cached_analytics(self):
+        self.client.get(f'/main/exams/{self.exam.pk}/analytics/')
+        result = ExamResult.objects.get(student=self.students[0])
+        result.marks_obtained = 30
+        result.save()
+        overall = self.client.get(f'/main/exams/{self.exam.pk}/analytics/').data['overall']
+        self.assertEqual((overall['pass_rate'], overall['grade_histogram']['F']), (66.67, 1))
+
+    def test_non_integer_filters_are_rejected(self):
+        response = self.client.get(f'/main/exams/{self.exam.pk}/analytics/', {'subject': 'maths'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TermFeeGenerationTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.schedule = FeeSchedule.objects.create(
+            class_section=self.class_section, academic_year='2023-2024', fee_type='TUI',
+            amount=Decimal('500'), due_date=date(2024, 4, 1),
+        )
+
+    def generate(self, dry_run):
+        return self.client.post('/main/fees/generate/', {'academic_year': '2023-2024', 'dry_run': dry_run})
+
+    def test_dry_run_writes_nothing(self):
+        response = self.generate('true')
+        self.assertEqual((response.data['dry_run'], response.data['created']), (True, self.student_count))
+        self.assertFalse(Fee.objects.filter(schedule=self.schedule).exists())
+
+    def test_generation_is_idempotent(self):
+        # A form value of "false" is not a dry run.
+        self.assertEqual(self.generate('false').data['created'], self.student_count)
+        self.assertEqual(Fee.objects.filter(schedule=self.schedule, amount=500).count(), self.student_count)
+        response = self.generate('false')
+        self.assertEqual((response.data['created'], response.data['skipped']), (0, self.student_count))
+
+
+class NestedListQueryTests(SchoolTestCase):
+    paths = ('/main/class-sections/', '/main/teachers/', '/main/subjects/')
+
+    def query_counts(self):
+        counts = []
+        for path in self.paths:
+            caches['representations'].clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(path).status_code, 200)
+            counts.append(len(queries))
+        return counts
+
+    def test_query_count_does_not_grow_with_the_rows(self):
+        before = self.query_counts()
+        for index in range(3):
+            user = CustomUser.objects.create_user(f'teacher{index}@example.com', 'pw', role='teacher')
+            teacher = Teacher.objects.create(user=user, employee_id=f'T1{index}', qualification='BEd', experience_years=1)
+            subject = Subject.objects.create(name=f'Subject {index}', code=f'S{index}')
+            teacher.subjects.add(subject, self.subject)
+            ClassSection.objects.create(
+                class_name=Class.objects.create(name=f'Grade {index}'), section=self.class_section.section,
+                class_teacher=teacher, academic_year='2023-2024',
+            )
+        self.assertEqual(self.query_counts(), before)
+
+
+class DashboardTests(SchoolTestCase):
+    def test_aggregates_and_capped_details(self):
+        today = now().date()
+        Attendance.objects.create(student=self.students[0], date=today, status='P')
+        Attendance.objects.create(student=self.students[1], date=today, status='A')
+        Fee.objects.bulk_create(
+            Fee(student=self.students[0], fee_type='LIB', amount=10, due_date=date(2024, 2, day)) for day in range(1, 13)
+        )
+        response = self.client.get('/main/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        attendance = response.data['attendance_today']
+        self.assertEqual((attendance['total'], attendance['by_status']['P'], attendance['by_status']['A']), (2, 1, 1))
+        [section] = attendance['by_class_section']
+        self.assertEqual((section['class_section'], section['P'], section['A']), (self.class_section.pk, 1, 1))
+        fees = response.data['fees']
+        self.assertEqual((fees['overdue_count'], fees['overdue_amount']), (15, 420))
+        self.assertEqual({row['fee_type']: row['pending_count'] for row in fees['by_fee_type']}, {'LIB': 12, 'TUI': 3})
+        self.assertEqual(len(fees['most_overdue']), 10)
+        self.assertEqual(fees['most_overdue'][0]['fee_type'], 'TUI')
+
+
+# Archiving creates and drops tables, which SQLite refuses inside the
+# transaction a TestCase runs in.
+class AcademicYearArchiveTests(SchoolFixtures, TransactionTestCase):
+    def setUp(self):
+        self.create_school()
+        super().setUp()
+        caches['default'].clear()
+
+    def test_archived_years_stay_readable_but_not_writable(self):
+        record = archive_academic_year('2023-2024', chunk_size=2)
+        self.addCleanup(lambda: AcademicYearArchive.objects.exists() and restore_academic_year('2023-2024'))
+        self.assertEqual((record.attendance_rows, record.exam_result_rows), (3, 3))
+        self.assertFalse(Attendance.objects.exists() or ExamResult.objects.exists())
+
+        response = self.client.get('/main/attendance/report/', {'start_date': '2024-03-01', 'end_date': '2024-03-01'})
+        self.assertEqual(len(response.data), 3)
+        analytics = self.client.get(f'/main/exams/{self.exam.pk}/analytics/').data
+        self.assertEqual(analytics['overall']['count'], 3)
+
+        response = self.client.post(
+            '/main/attendance/mark/', {'student': self.students[0].pk, 'date': '2024-03-02', 'status': 'P'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.data)
+
+        restore_academic_year('2023-2024')
+        self.assertEqual((Attendance.objects.count(), ExamResult.objects.count()), (3, 3))
+        self.assertFalse(AcademicYearArchive.objects.exists())
+
+
+class LiveEventTests(SchoolTestCase):
+    def test_attendance_statuses_of_a_section_and_day_coalesce(self):
+        subscription = Subscription(loop=None)
+        key = ('attendance', (self.class_section.pk, '2024-03-02'))
+        for student, status in ((1, 'P'), (2, 'A'), (1, 'L')):
+            subscription.push(key, {'type': 'attendance', 'data': {'statuses': {student: status}}})
+        self.assertEqual(list(subscription.pending.values())[0]['data']['statuses'], {1: 'L', 2: 'A'})
+
+    def write(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Attendance.objects.create(student=self.students[0], date=date(2024, 3, 2), status='L')
+            fee = Fee.objects.get(student=self.students[1])
+            fee.status = 'OVE'
+            fee.save()
+
+    async def test_committed_writes_reach_subscribers_of_their_section(self):
+        subscription = broadcaster.subscribe(self.class_section.pk)
+        other_section = broadcaster.subscribe(self.class_section.pk + 1)
+        try:
+            await sync_to_async(self.write)()
+            events = await anext(subscription.batches(window=0))
+            await asyncio.sleep(0)
+            self.assertFalse(other_section.pending)
+        finally:
+            broadcaster.unsubscribe(subscription)
+            broadcaster.unsubscribe(other_section)
+        events = {event['type']: event['data'] for event in events}
+        self.assertEqual(events['attendance']['statuses'], {str(self.students[0].pk): 'L'})
+        self.assertEqual((events['fee']['student'], events['fee']['status']), (self.students[1].pk, 'OVE'))
+
+    async def test_the_stream_requires_a_staff_token(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/main/events/', 'query_string': b'', 'headers': []}
+        await sse_application(scope, None, send)
+        self.assertEqual(sent[0]['status'], 401)
+        student_token = AccessToken.for_user(self.students[0].user)
+        scope['query_string'] = f'access_token={student_token}'.encode()
+        await sse_application(scope, None, send)
+        self.assertEqual(sent[2]['status'], 403)
+
+
+class QueryLogTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        query_stats.reset()
+        self.addCleanup(query_stats.reset)
+
+    def test_fingerprints_ignore_literals_and_in_list_length(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x'"),
+            fingerprint("SELECT *  FROM t WHERE id IN (%s) AND name = %s"),
+        )
+
+    def test_statements_are_aggregated_per_url_name(self):
+        for _ in range(2):
+            self.client.get('/main/subjects/')
+        entries = self.client.get('/main/profiles/queries/', {'url_name': 'subject-list'}).data
+        self.assertTrue(entries)
+        self.assertTrue(all(entry['requests'] == 2 for entry in entries))
+        self.assertTrue(any('main_subject' in entry['fingerprint'] for entry in entries))
+
+    @override_settings(QUERY_LOG_N_PLUS_ONE_THRESHOLD=3)
+    def test_repeated_statements_are_flagged(self):
+        with self.assertLogs('apps.main.querylog', 'WARNING') as logs:
+            self.client.post('/main/batch/', {'requests': [{'path': '/main/subjects/'}] * 3}, format='json')
+        self.assertTrue(any('Possible N+1 in batch-requests' in line for line in logs.output))
+        entries = self.client.get('/main/profiles/queries/', {'n_plus_one': 'true'}).data
+        self.assertEqual({entry['url_name'] for entry in entries}, {'batch-requests'})
+
+
+class BatchRequestTests(SchoolTestCase):
+    def batch(self, requests, **extra):
+        return self.client.post('/main/batch/', {'requests': requests, **extra}, format='json')
+
+    def test_sub_requests_answer_in_order_with_their_own_status(self):
+        student = self.students[0]
+        response = self.batch([
+            {'id': 'subjects', 'path': '/main/subjects/'},
+            {'id': 'student', 'path': f'/main/students/{student.pk}/'},
+            {'id': 'mark', 'method': 'POST', 'path': '/main/attendance/mark/',
+             'body': {'student': student.pk, 'date': '2024-03-04', 'status': 'P'}},
+            {'id': 'missing', 'path': '/main/nowhere/'},
+            {'id': 'nested', 'method': 'POST', 'path': '/main/batch/'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.data['responses']
+        self.assertEqual([result['id'] for result in results], ['subjects', 'student', 'mark', 'missing', 'nested'])
+        self.assertEqual([result['status'] for result in results], [200, 200, 201, 404, 400])
+        self.assertEqual(results[1]['body']['admission_number'], student.admission_number)
+        self.assertTrue(Attendance.objects.filter(student=student, date=date(2024, 3, 4)).exists())
+
+    def test_invalid_batches_are_rejected(self):
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([{'path': '/accounts/payroll/run/'}]).status_code, 400)
+        with override_settings(BATCH_MAX_REQUESTS=2):
+            self.assertEqual(self.batch([{'path': '/main/subjects/'}] * 3).status_code, 400)
+
+
+# Concurrent sub-requests run on worker threads, which only see committed rows.
+class ConcurrentBatchTests(SchoolFixtures, TransactionTestCase):
+    def setUp(self):
+        self.create_school()
+        super().setUp()
+
+    def test_reads_run_concurrently(self):
+        paths = ['/main/subjects/', '/main/teachers/', '/main/class-sections/']
+        response = self.client.post(
+            '/main/batch/', {'requests': [{'path': path} for path in paths], 'concurrent': True}, format='json'
+        )
+        self.assertEqual([result['status'] for result in response.data['responses']], [200, 200, 200])
+        self.assertEqual(response.data['responses'][0]['body'][0]['code'], 'MATH')
+
+
+class StudentDisplayColumnTests(SchoolTestCase):
+    def labels(self):
+        return list(Student.objects.order_by('id').values_list('display_name', 'class_section_label'))
+
+    def test_columns_follow_the_user_class_and_section(self):
+        self.assertEqual(self.labels()[0], ('Stu0 Dent', 'Grade 5 - A'))
+        user = self.students[0].user
+        user.last_name = 'Renamed'
+        user.save()
+        section = self.class_section.section
+        section.name = 'B'
+        section.save()
+        self.assertEqual(self.labels(), [
+            ('Stu0 Renamed', 'Grade 5 - B'), ('Stu1 Dent', 'Grade 5 - B'), ('Stu2 Dent', 'Grade 5 - B'),
+        ])
+
+    def test_backfill_repairs_stale_columns(self):
+        expected = self.labels()
+        Student.objects.filter(pk=self.students[1].pk).update(display_name='', class_section_label='stale')
+        out = StringIO()
+        call_command('backfill_student_display', chunk_size=2, stdout=out)
+        self.assertIn('Checked 3 students, updated 1.', out.getvalue())
+        self.assertEqual(self.labels(), expected)
+
+
+class BulkEditTests(SchoolTestCase):
+    def test_student_edits_write_only_what_changed(self):
+        other_section = ClassSection.objects.create(
+            class_name=self.class_section.class_name, section=Section.objects.create(name='B'), academic_year='2023-2024',
+        )
+        first, second = self.students[:2]
+        response = self.client.patch('/main/students/bulk/', {'changes': [
+            {'id': first.pk, 'guardian_phone': '555999', 'class_section': other_section.pk},
+            {'id': second.pk, 'guardian_phone': second.guardian_phone},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['unchanged']), (1, 1))
+        self.assertEqual(response.data['changes'][0]['changes']['guardian_phone'], ['555000', '555999'])
+        first.refresh_from_db()
+        self.assertEqual((first.guardian_phone, first.class_section_label), ('555999', 'Grade 5 - B'))
+
+    def test_an_invalid_change_rejects_the_whole_batch(self):
+        first, second = self.students[:2]
+        response = self.client.patch('/main/students/bulk/', {'changes': [
+            {'id': first.pk, 'guardian_phone': '555999'},
+            {'id': second.pk, 'admission_number': self.students[2].admission_number},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        first.refresh_from_db()
+        self.assertEqual(first.guardian_phone, '555000')
+
+    def test_exam_results_are_upserted_on_exam_student_and_subject(self):
+        science = Subject.objects.create(name='Science', code='SCI')
+        student = self.students[0]
+        key = {'exam': self.exam.pk, 'student': student.pk}
+        changes = [
+            {**key, 'subject': self.subject.pk, 'marks_obtained': 95},
+            {**key, 'subject': science.pk, 'marks_obtained': 40, 'max_marks': 50},
+        ]
+        response = self.client.patch('/main/exams/results/bulk/', {'changes': changes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        self.assertEqual(
+            dict(ExamResult.objects.filter(student=student).values_list('subject__code', 'marks_obtained')),
+            {'MATH': 95, 'SCI': 40},
+        )
+        response = self.client.patch('/main/exams/results/bulk/', {'changes': changes}, format='json')
+        self.assertEqual(response.data['unchanged'], 2)
+
+    def test_new_exam_results_need_their_marks(self):
+        science = Subject.objects.create(name='Science', code='SCI')
+        response = self.client.patch('/main/exams/results/bulk/', {'changes': [
+            {'exam': self.exam.pk, 'student': self.students[0].pk, 'subject': science.pk, 'marks_obtained': 40},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('max_marks', response.data['errors'][0]['errors'])
+        self.assertFalse(ExamResult.objects.filter(subject=science).exists())
@@ -0,0 +1,250 @@
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+THROTTLE_MAX_BUCKETS = 10000
+THROTTLE_MAX_HEAVY_IN_FLIGHT = 4
+THROTTLE_SHED_RETRY_AFTER = 1
+THROTTLE_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+HEAVY_SHED_DETAIL = 'Server is busy with other heavy requests, retry shortly.'
+
+
+class HeavyViewsBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = HEAVY_SHED_DETAIL
+    default_code = 'heavy_views_busy'
+    # DRF's exception handler turns ``wait`` into Retry-After.
+    wait = THROTTLE_SHED_RETRY_AFTER
+
+
+def parse_rate(rate):
+    """'<tokens>/<period>' as in DEFAULT_THROTTLE_RATES -> (capacity, tokens per second)."""
+    tokens, period = rate.split('/')
+    tokens = int(tokens)
+    return tokens, tokens / THROTTLE_PERIODS[period[0]]
+
+
+def endpoint_class(request):
+    url_name = request.resolver_match.url_name if request.resolver_match else ''
+    if is_heavy_view(url_name):
+        return 'heavy'
+    return 'read' if request.method in SAFE_METHODS else 'write'
+
+
+def is_heavy_view(url_name):
+    return url_name in getattr(settings, 'THROTTLE_HEAVY_VIEWS', ())
+
+
+def max_heavy_in_flight():
+    return getattr(settings, 'THROTTLE_MAX_HEAVY_IN_FLIGHT', THROTTLE_MAX_HEAVY_IN_FLIGHT)
+
+
+def request_cost(request):
+    url_name = request.resolver_match.url_name if request.resolver_match else ''
+    return getattr(settings, 'THROTTLE_COSTS', {}).get(url_name, 1)
+
+
+def take_request_tokens(client, bucket_class, cost):
+    """Charge ``cost`` to the client's bucket of ``bucket_class``; returns 0, or the seconds to wait when throttled."""
+    rate = settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}).get(bucket_class)
+    if not rate:
+        return 0
+    capacity, refill_rate = parse_rate(rate)
+    wait = token_buckets.take((client, bucket_class), cost, capacity, refill_rate)
+    if wait:
+        limiter_metrics.throttled(bucket_class)
+    else:
+        limiter_metrics.allowed(bucket_class, cost)
+    return wait
+
+
+class LimiterMetrics:
+    """Per-process counters for the request limiter, reported by /main/limits/."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._allowed = defaultdict(int)
+            self._throttled = defaultdict(int)
+            self._tokens = defaultdict(float)
+            self._shed = defaultdict(int)
+            self._peak_in_flight = 0
+
+    def allowed(self, bucket_class, cost):
+        with self._lock:
+            self._allowed[bucket_class] += 1
+            self._tokens[bucket_class] += cost
+
+    def throttled(self, bucket_class):
+        with self._lock:
+            self._throttled[bucket_class] += 1
+
+    def shed(self, url_name):
+        with self._lock:
+            self._shed[url_name] += 1
+
+    def in_flight(self, count):
+        with self._lock:
+            self._peak_in_flight = max(self._peak_in_flight, count)
+
+    def report(self):
+        with self._lock:
+            classes = sorted(set(self._allowed) | set(self._throttled))
+            return {
+                'buckets': {
+                    bucket_class: {
+                        'allowed': self._allowed[bucket_class],
+                        'throttled': self._throttled[bucket_class],
+                        'tokens_spent': round(self._tokens[bucket_class], 2),
+                    }
+                    for bucket_class in classes
+                },
+                'shed': dict(self._shed),
+                'heavy_in_flight': heavy_in_flight.count,
+                'peak_heavy_in_flight': self._peak_in_flight,
+                'tracked_buckets': token_buckets.size(),
+                'rates': settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}),
+                'costs': getattr(settings, 'THROTTLE_COSTS', {}),
+                'heavy_views': getattr(settings, 'THROTTLE_HEAVY_VIEWS', ()),
+                'max_heavy_in_flight': max_heavy_in_flight(),
+            }
+
+
+limiter_metrics = LimiterMetrics()
+
+
+class TokenBuckets:
+    """
+    In-process token buckets keyed by (client, endpoint class). A bucket
+    holds up to ``capacity`` tokens and refills continuously; a request is
+    admitted when the bucket holds its cost. Only the THROTTLE_MAX_BUCKETS
+    most recently used buckets are kept; a dropped bucket comes back full.
+    """
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def size(self):
+        return len(self._buckets)
+
+    def take(self, key, cost, capacity, refill_rate):
+        """Spend ``cost`` tokens and return 0, or return the seconds until they are available."""
+        cost = min(cost, capacity)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            wait = 0 if tokens >= cost else (cost - tokens) / refill_rate
+            if not wait:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > getattr(settings, 'THROTTLE_MAX_BUCKETS', THROTTLE_MAX_BUCKETS):
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+token_buckets = TokenBuckets()
+
+
+class CostRateThrottle(BaseThrottle):
+    """
+    DRF throttle charging each request its view's THROTTLE_COSTS weight
+    (default 1) against the client's bucket for the endpoint class: 'heavy'
+    for THROTTLE_HEAVY_VIEWS, else 'read' or 'write' by method. Bucket sizes
+    and refill come from DEFAULT_THROTTLE_RATES in tokens per period, e.g.
+    '600/min'. Clients are users, or the client IP when anonymous.
+
+    An admitted heavy request then takes an in-flight slot, so only
+    authenticated, permitted and unthrottled requests hold one; without a
+    free slot it raises HeavyViewsBusy (503).
+    """
+
+    def allow_request(self, request, view):
+        client = f'user:{request.user.pk}' if request.user.is_authenticated else f'ip:{self.get_ident(request)}'
+        bucket_class = endpoint_class(request)
+        self._wait = take_request_tokens(client, bucket_class, request_cost(request))
+        if not self._wait and bucket_class == 'heavy':
+            take_heavy_slot(request._request)
+        return not self._wait
+
+    def wait(self):
+        return math.ceil(self._wait)
+
+
+class InFlightCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, limit):
+        with self._lock:
+            if self.count >= limit:
+                return False
+            self.count += 1
+            count = self.count
+        limiter_metrics.in_flight(count)
+        return True
+
+    def release(self):
+        with self._lock:
+            self.count -= 1
+
+
+heavy_in_flight = InFlightCounter()
+
+
+def take_heavy_slot(request):
+    """
+    Take one of the THROTTLE_MAX_HEAVY_IN_FLIGHT slots for ``request`` (the
+    HttpRequest) or raise HeavyViewsBusy. release_heavy_slot() gives it back.
+    """
+    if getattr(request, '_holds_heavy_slot', False):
+        return
+    if not heavy_in_flight.acquire(max_heavy_in_flight()):
+        limiter_metrics.shed(request.resolver_match.url_name)
+        raise HeavyViewsBusy()
+    request._holds_heavy_slot = True
+
+
+def release_heavy_slot(request, response=None):
+    """Give back the slot ``request`` holds, if any; a streamed ``response`` keeps it until closed."""
+    if not getattr(request, '_holds_heavy_slot', False):
+        return
+    request._holds_heavy_slot = False
+    if response is not None and response.streaming:
+        response._resource_closers.append(heavy_in_flight.release)
+    else:
+        heavy_in_flight.release()
+
+
+class InFlightLimitMiddleware:
+    """
+    Global cap on THROTTLE_HEAVY_VIEWS requests running at once in this
+    process. CostRateThrottle takes the slot once DRF has authenticated the
+    request; past THROTTLE_MAX_HEAVY_IN_FLIGHT, requests are shed with a 503
+    and Retry-After before the view runs. This middleware gives the slot
+    back, and a streamed response keeps it until the stream is closed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        release_heavy_slot(request, response)
+        return response
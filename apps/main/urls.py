@@ -7,6 +7,7 @@ urlpatterns = [
     # Student Management URLs
     path('students/', views.student_list, name='student-list'),
     path('students/<int:pk>/', views.student_detail, name='student-detail'),
+    path('students/bulk/', views.student_bulk_update, name='student-bulk-update'),
 
     # Teacher Management URLs
     path('teachers/', views.teacher_list, name='teacher-list'),
@@ -14,18 +15,48 @@ urlpatterns = [
     # Class Management URLs
     path('class-sections/', views.class_section_list, name='class-section-list'),
 
+    # Subject Management URLs
+    path('subjects/', views.subject_list, name='subject-list'),
+
     # Attendance Management URLs
     path('attendance/mark/', views.mark_attendance, name='mark-attendance'),
     path('attendance/report/', views.get_attendance_report, name='attendance-report'),
+    path('attendance/matrix/', views.get_attendance_matrix, name='attendance-matrix'),
 
     # Exam Management URLs
     path('exams/', views.exam_management, name='exam-management'),
     path('exams/results/add/', views.add_exam_result, name='add-exam-result'),
     path('exams/results/', views.get_exam_results, name='get-exam-results'),
+    path('exams/results/bulk/', views.exam_result_bulk_upsert, name='exam-result-bulk-upsert'),
+    path('exams/<int:pk>/analytics/', views.exam_analytics, name='exam-analytics'),
+    path('exams/report-cards/', views.report_cards, name='report-cards'),
 
     # Fee Management URLs
     path('fees/', views.fee_management, name='fee-management'),
     path('fees/payment/', views.record_fee_payment, name='record-fee-payment'),
+    path('fees/schedules/', views.fee_schedules, name='fee-schedules'),
+    path('fees/generate/', views.generate_fees, name='generate-fees'),
+    path('fees/reconcile/', views.reconcile_fee_payments, name='reconcile-fee-payments'),
+    path('onboarding/', views.onboard_users_import, name='onboard-users'),
+
+    # Background Job URLs
+    path('jobs/', views.submit_background_job, name='submit-background-job'),
+    path('jobs/<int:pk>/', views.background_job_detail, name='background-job-detail'),
+
+    # Search URLs
+    path('search/', views.search_directory, name='search-directory'),
+
+    # Delta Sync URLs
+    path('sync/', views.sync_changes, name='sync-changes'),
+
+    # Profiling URLs
+    path('profiles/', views.request_profiles, name='request-profiles'),
+    path('profiles/<int:pk>/', views.request_profile_detail, name='request-profile-detail'),
+    path('profiles/queries/', views.query_log, name='query-log'),
+    path('limits/', views.request_limits, name='request-limits'),
+
+    # Batch URL
+    path('batch/', views.batch_requests, name='batch-requests'),
 
     # Dashboard URL
     path('dashboard/', views.dashboard_summary, name='dashboard-summary'),
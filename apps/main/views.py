@@ -1,25 +1,50 @@
 # views.py
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.shortcuts import get_object_or_404
+from django.core.files.storage import default_storage
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from datetime import datetime, timedelta
-from django.db.models import Sum, Avg
+from decimal import Decimal, InvalidOperation
+import os
+import uuid
+from itertools import chain
+from django.db import IntegrityError
+from django.db.models import Sum, Avg, Count, F, Q
+from django.urls import reverse
 from django.utils.timezone import now
 
 from .models import (
     Student, Teacher, Class, Section, ClassSection, 
-    Subject, Attendance, Exam, ExamResult, Fee
+    Subject, Attendance, Exam, ExamResult, Fee, FeeSchedule, Job, RequestProfile
 )
 from .serializers import (
     StudentSerializer, TeacherSerializer, ClassSerializer, 
     SectionSerializer, ClassSectionSerializer, SubjectSerializer,
     AttendanceSerializer, ExamSerializer, ExamResultSerializer,
-    FeeSerializer
+    FeeSerializer, StudentAcademicReportSerializer, JobSerializer,
+    FeeScheduleSerializer, RequestProfileSerializer, RequestProfileDetailSerializer
 )
+from .search import search_index, KIND_STUDENT, KIND_TEACHER
+from .analytics import get_exam_analytics
+from .grading import GRADES, grade_percentage_range
+from .reports import load_report_cards, serialize_report_cards
+from .jobs import JOB_UPLOAD_DIR, TASKS, submit_job
+from .onboarding import ONBOARD_FORMATS
+from .fees import apply_fee_payment, generate_term_fees
+from .bulk_edits import BulkEditError, BulkEditInvalid, bulk_update_students, upsert_exam_results
+from .idempotency import idempotent, IDEMPOTENCY_KEY_PARAMETER
+from .representation_cache import serialize_cached, serialize_cached_object
+from .paginators import paginated_response
+from .throttling import limiter_metrics
+from .querylog import query_stats
+from .batch import BatchError, parse_sub_requests, run_batch
+from .archive import attendance_querysets, exam_result_manager, exam_result_managers
+from .changelog import SYNC_PAGE_SIZE, SYNC_MAX_PAGE_SIZE, collect_changes, current_cursor
 
 # Student Management Views
 @swagger_auto_schema(
@@ -37,9 +62,8 @@ from .serializers import (
 @permission_classes([IsAuthenticated])
 def student_list(request):
     if request.method == 'GET':
-        students = Student.objects.all()
-        serializer = StudentSerializer(students, many=True)
-        return Response(serializer.data)
+        students = StudentSerializer.setup_eager_loading(Student.objects.order_by('id'))
+        return Response(serialize_cached(StudentSerializer, students))
     
     elif request.method == 'POST':
         serializer = StudentSerializer(data=request.data)
@@ -62,8 +86,7 @@ def student_detail(request, pk):
     student = get_object_or_404(Student, pk=pk)
 
     if request.method == 'GET':
-        serializer = StudentSerializer(student)
-        return Response(serializer.data)
+        return Response(serialize_cached_object(StudentSerializer, student))
 
     elif request.method == 'PUT':
         serializer = StudentSerializer(student, data=request.data)
@@ -76,6 +99,49 @@ def student_detail(request, pk):
         student.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+BULK_EDIT_REQUEST = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    required=['changes'],
+    properties={'changes': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))}
+)
+BULK_EDIT_RESPONSE = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        'created': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'updated': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'unchanged': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'changes': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+    }
+)
+
+def _bulk_edit_response(apply, request):
+    try:
+        return Response(apply(request.data.get('changes')))
+    except BulkEditError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except BulkEditInvalid as exc:
+        return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+    except IntegrityError:
+        # A concurrent write took a unique value the batch was validated against.
+        return Response({'error': 'Conflicting concurrent update, retry the batch'}, status=status.HTTP_409_CONFLICT)
+
+@swagger_auto_schema(
+    method='patch',
+    request_body=BULK_EDIT_REQUEST,
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    responses={200: BULK_EDIT_RESPONSE, 400: 'Invalid changes; nothing was applied'},
+    operation_description="Partially update many students: changes is a list of {id, <fields to change>}"
+)
+@api_view(['PATCH'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def student_bulk_update(request):
+    """
+    All changes are validated together and applied in one transaction, or
+    none are. The response lists [old, new] for every field that changed.
+    """
+    return _bulk_edit_response(bulk_update_students, request)
+
 # Teacher Management Views
 @swagger_auto_schema(
     methods=['get', 'post'],
@@ -88,9 +154,8 @@ def student_detail(request, pk):
 @permission_classes([IsAuthenticated])
 def teacher_list(request):
     if request.method == 'GET':
-        teachers = Teacher.objects.all()
-        serializer = TeacherSerializer(teachers, many=True)
-        return Response(serializer.data)
+        teachers = TeacherSerializer.setup_eager_loading(Teacher.objects.order_by('id'))
+        return Response(serialize_cached(TeacherSerializer, teachers))
     
     elif request.method == 'POST':
         serializer = TeacherSerializer(data=request.data)
@@ -111,9 +176,8 @@ def teacher_list(request):
 @permission_classes([IsAuthenticated])
 def class_section_list(request):
     if request.method == 'GET':
-        class_sections = ClassSection.objects.all()
-        serializer = ClassSectionSerializer(class_sections, many=True)
-        return Response(serializer.data)
+        class_sections = ClassSectionSerializer.setup_eager_loading(ClassSection.objects.order_by('id'))
+        return Response(serialize_cached(ClassSectionSerializer, class_sections))
     
     elif request.method == 'POST':
         serializer = ClassSectionSerializer(data=request.data)
@@ -122,14 +186,39 @@ def class_section_list(request):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# Subject Management Views
+@swagger_auto_schema(
+    methods=['get', 'post'],
+    responses={
+        200: SubjectSerializer(many=True),
+        201: SubjectSerializer()
+    }
+)
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def subject_list(request):
+    if request.method == 'GET':
+        subjects = SubjectSerializer.setup_eager_loading(Subject.objects.order_by('id'))
+        serializer = SubjectSerializer(subjects, many=True)
+        return Response(serializer.data)
+
+    elif request.method == 'POST':
+        serializer = SubjectSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 # Attendance Management Views
 @swagger_auto_schema(
     method='post',
     request_body=AttendanceSerializer,
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
     responses={201: AttendanceSerializer()}
 )
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def mark_attendance(request):
     serializer = AttendanceSerializer(data=request.data)
     if serializer.is_valid():
@@ -143,6 +232,9 @@ def mark_attendance(request):
         openapi.Parameter('student_id', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
         openapi.Parameter('start_date', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date'),
         openapi.Parameter('end_date', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date'),
+        openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=[code for code, _ in Attendance.status_choices]),
+        openapi.Parameter('page', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Paginate the results'),
+        openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
     ],
     responses={200: AttendanceSerializer(many=True)}
 )
@@ -152,18 +244,112 @@ def get_attendance_report(request):
     student_id = request.query_params.get('student_id')
     start_date = request.query_params.get('start_date')
     end_date = request.query_params.get('end_date')
+    attendance_status = request.query_params.get('status')
     
-    attendance = Attendance.objects.all()
-    if student_id:
-        attendance = attendance.filter(student_id=student_id)
-    if start_date:
-        attendance = attendance.filter(date__gte=start_date)
-    if end_date:
-        attendance = attendance.filter(date__lte=end_date)
+    querysets = []
+    # Archived academic years are only read when the date range reaches them.
+    for manager in attendance_querysets(start_date, end_date):
+        attendance = manager.select_related('student').order_by('-date', 'id')
+        if student_id:
+            attendance = attendance.filter(student_id=student_id)
+        if start_date:
+            attendance = attendance.filter(date__gte=start_date)
+        if end_date:
+            attendance = attendance.filter(date__lte=end_date)
+        if attendance_status:
+            attendance = attendance.filter(status=attendance_status)
+        querysets.append(attendance)
+    if len(querysets) > 1:
+        attendance = sorted(chain(*querysets), key=lambda record: (-record.date.toordinal(), record.id))
+    if 'page' in request.query_params:
+        return paginated_response(request, attendance, AttendanceSerializer)
     
     serializer = AttendanceSerializer(attendance, many=True)
     return Response(serializer.data)
 
+ATTENDANCE_MATRIX_MAX_DAYS = 366
+ATTENDANCE_NOT_MARKED = '-'
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('class_section', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=True),
+        openapi.Parameter('start_date', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date', required=True),
+        openapi.Parameter('end_date', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date', required=True),
+    ],
+    responses={200: openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'class_section': openapi.Schema(type=openapi.TYPE_INTEGER),
+            'days': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+            'students': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+            'matrix': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+        }
+    )}
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_attendance_matrix(request):
+    """
+    Students x days attendance grid for one class section. Each student's row
+    is packed into a string with one status code per day ('-' = not marked).
+    """
+    try:
+        start_date = datetime.strptime(request.query_params.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.query_params.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return Response({'error': 'start_date and end_date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    total_days = (end_date - start_date).days + 1
+    if total_days < 1 or total_days > ATTENDANCE_MATRIX_MAX_DAYS:
+        return Response(
+            {'error': f'Date range must cover 1 to {ATTENDANCE_MATRIX_MAX_DAYS} days'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        class_section_id = int(request.query_params.get('class_section', ''))
+    except ValueError:
+        return Response({'error': 'class_section must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    class_section = get_object_or_404(ClassSection, pk=class_section_id)
+
+    students = list(
+        Student.objects.filter(class_section=class_section)
+        .order_by('id')
+        .values_list('id', 'admission_number', 'roll_number', 'user__first_name', 'user__last_name')
+    )
+    rows = {student[0]: [ATTENDANCE_NOT_MARKED] * total_days for student in students}
+
+    for manager in attendance_querysets(start_date, end_date):
+        attendance = (
+            manager.filter(
+                student__class_section=class_section,
+                date__gte=start_date, date__lte=end_date
+            )
+            .order_by('student_id', 'date')
+            .values_list('student_id', 'date', 'status')
+        )
+        for student_id, day, code in attendance.iterator():
+            row = rows.get(student_id)
+            if row is not None:
+                row[(day - start_date).days] = code
+
+    return Response({
+        'class_section': class_section.id,
+        'start_date': start_date,
+        'end_date': end_date,
+        'days': [start_date + timedelta(days=offset) for offset in range(total_days)],
+        'status_codes': dict(Attendance.status_choices),
+        'students': [
+            {
+                'id': student_id,
+                'name': f"{first_name or ''} {last_name or ''}".strip(),
+                'admission_number': admission_number,
+                'roll_number': roll_number,
+            }
+            for student_id, admission_number, roll_number, first_name, last_name in students
+        ],
+        'matrix': [''.join(rows[student[0]]) for student in students],
+    })
+
 # Exam Management Views
 @swagger_auto_schema(
     methods=['get', 'post'],
@@ -190,10 +376,12 @@ def exam_management(request):
 @swagger_auto_schema(
     method='post',
     request_body=ExamResultSerializer,
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
     responses={201: ExamResultSerializer()}
 )
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def add_exam_result(request):
     serializer = ExamResultSerializer(data=request.data)
     if serializer.is_valid():
@@ -201,11 +389,37 @@ def add_exam_result(request):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@swagger_auto_schema(
+    method='patch',
+    request_body=BULK_EDIT_REQUEST,
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    responses={200: BULK_EDIT_RESPONSE, 400: 'Invalid changes; nothing was applied'},
+    operation_description=(
+        "Create or update many exam results: changes is a list of "
+        "{exam, student, subject, marks_obtained, max_marks, remarks}, matched on (exam, student, subject)"
+    )
+)
+@api_view(['PATCH'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def exam_result_bulk_upsert(request):
+    """
+    Upsert of a whole mark sheet: existing results get only the submitted
+    fields, missing ones are created, so resubmitting is safe.
+    """
+    return _bulk_edit_response(upsert_exam_results, request)
+
+EXAM_RESULT_ORDERINGS = ('percentage', '-percentage', 'marks_obtained', '-marks_obtained')
+
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
         openapi.Parameter('student_id', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
         openapi.Parameter('exam_id', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter('grade', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(GRADES)),
+        openapi.Parameter('min_percentage', openapi.IN_QUERY, type=openapi.TYPE_NUMBER),
+        openapi.Parameter('ordering', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(EXAM_RESULT_ORDERINGS)),
+        openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
     ],
     responses={200: ExamResultSerializer(many=True)}
 )
@@ -214,29 +428,130 @@ def add_exam_result(request):
 def get_exam_results(request):
     student_id = request.query_params.get('student_id')
     exam_id = request.query_params.get('exam_id')
+    grade = request.query_params.get('grade')
+    min_percentage = request.query_params.get('min_percentage')
+    ordering = request.query_params.get('ordering')
+    limit = request.query_params.get('limit')
     
-    results = ExamResult.objects.all()
-    if student_id:
-        results = results.filter(student_id=student_id)
+    if grade and grade not in GRADES:
+        return Response({'error': f'grade must be one of {", ".join(GRADES)}'}, status=status.HTTP_400_BAD_REQUEST)
+    if ordering and ordering not in EXAM_RESULT_ORDERINGS:
+        return Response({'error': f'ordering must be one of {", ".join(EXAM_RESULT_ORDERINGS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        min_percentage = float(min_percentage) if min_percentage else None
+        limit = max(int(limit), 0) if limit else None
+    except ValueError:
+        return Response({'error': 'min_percentage and limit must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # An exam's results live in exactly one table; a student's history spans
+    # the hot table and every archived year.
     if exam_id:
-        results = results.filter(exam_id=exam_id)
-    
+        academic_year = Exam.objects.filter(pk=exam_id).values_list('academic_year', flat=True).first()
+        managers = [exam_result_manager(academic_year)]
+    elif student_id:
+        managers = exam_result_managers()
+    else:
+        managers = [ExamResult.objects]
+
+    querysets = []
+    for manager in managers:
+        results = manager.with_grades().select_related('student', 'subject')
+        if student_id:
+            results = results.filter(student_id=student_id)
+        if exam_id:
+            results = results.filter(exam_id=exam_id)
+        if grade:
+            # Filter on the grade's percentage band so the expression index applies.
+            minimum, upper = grade_percentage_range(grade)
+            if minimum is not None:
+                results = results.filter(percentage__gte=minimum)
+            if upper is not None:
+                results = results.filter(percentage__lt=upper)
+        if min_percentage is not None:
+            results = results.filter(percentage__gte=min_percentage)
+        if ordering:
+            results = results.order_by(ordering, 'id')
+        if limit is not None:
+            results = results[:limit]
+        querysets.append(results)
+
+    if len(querysets) > 1:
+        results = list(chain(*querysets))
+        if ordering:
+            field = ordering.lstrip('-')
+            results.sort(key=lambda result: (getattr(result, field), result.id))
+            if ordering.startswith('-'):
+                results.sort(key=lambda result: getattr(result, field), reverse=True)
+        if limit is not None:
+            results = results[:limit]
+
     serializer = ExamResultSerializer(results, many=True)
     return Response(serializer.data)
 
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('class_section', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter('subject', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: openapi.Schema(type=openapi.TYPE_OBJECT), 404: 'Not Found'}
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exam_analytics(request, pk):
+    exam = get_object_or_404(Exam, pk=pk)
+    try:
+        class_section_id = int(request.query_params.get('class_section') or 0) or None
+        subject_id = int(request.query_params.get('subject') or 0) or None
+    except ValueError:
+        return Response({'error': 'class_section and subject must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(get_exam_analytics(exam, class_section_id, subject_id))
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('class_section', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter('academic_year', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+    ],
+    responses={200: StudentAcademicReportSerializer(many=True)}
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def report_cards(request):
+    class_section_id = request.query_params.get('class_section')
+    academic_year = request.query_params.get('academic_year')
+    if not class_section_id and not academic_year:
+        return Response({'error': 'class_section or academic_year is required'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(serialize_report_cards(load_report_cards(class_section_id, academic_year)))
+
 # Fee Management Views
 @swagger_auto_schema(
-    methods=['get', 'post'],
-    responses={
-        200: FeeSerializer(many=True),
-        201: FeeSerializer()
-    }
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=[code for code, _ in Fee.status_choices]),
+        openapi.Parameter('overdue', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN),
+        openapi.Parameter('page', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Paginate the results'),
+        openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: FeeSerializer(many=True)}
+)
+@swagger_auto_schema(
+    method='post',
+    request_body=FeeSerializer,
+    responses={201: FeeSerializer()}
 )
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def fee_management(request):
     if request.method == 'GET':
-        fees = Fee.objects.all()
+        fees = Fee.objects.select_related('student').order_by('due_date', 'id')
+        fee_status = request.query_params.get('status')
+        if fee_status:
+            fees = fees.filter(status=fee_status)
+        if request.query_params.get('overdue'):
+            fees = fees.filter(Q(status='OVE') | Q(status='PEN', due_date__lt=now().date()))
+        if 'page' in request.query_params:
+            return paginated_response(request, fees, FeeSerializer)
         serializer = FeeSerializer(fees, many=True)
         return Response(serializer.data)
     
@@ -257,23 +572,184 @@ def fee_management(request):
             'paid_amount': openapi.Schema(type=openapi.TYPE_NUMBER),
         }
     ),
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
     responses={200: FeeSerializer()}
 )
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def record_fee_payment(request):
     fee_id = request.data.get('fee_id')
     fee = get_object_or_404(Fee, pk=fee_id)
-    
-    fee.paid_date = now()
-    fee.payment_method = request.data.get('payment_method')
-    fee.status = 'PAI'
-    fee.save()
+
+    # Without paid_amount the outstanding balance is settled in full.
+    outstanding = fee.amount - fee.paid_amount
+    paid_amount = request.data.get('paid_amount')
+    if paid_amount in (None, ''):
+        paid_amount = outstanding
+    else:
+        try:
+            paid_amount = Decimal(str(paid_amount))
+        except InvalidOperation:
+            paid_amount = None
+        if paid_amount is None or not paid_amount.is_finite():
+            return Response({'error': 'paid_amount must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    if paid_amount <= 0:
+        return Response({'error': 'paid_amount must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+    if not apply_fee_payment(fee, paid_amount, request.data.get('payment_method') or ''):
+        fee.refresh_from_db()
+        return Response(
+            {'error': f'paid_amount exceeds the outstanding balance of {fee.amount - fee.paid_amount}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     serializer = FeeSerializer(fee)
     return Response(serializer.data)
 
+@swagger_auto_schema(
+    methods=['get', 'post'],
+    responses={
+        200: FeeScheduleSerializer(many=True),
+        201: FeeScheduleSerializer()
+    }
+)
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def fee_schedules(request):
+    if request.method == 'GET':
+        schedules = FeeSchedule.objects.all()
+        academic_year = request.query_params.get('academic_year')
+        if academic_year:
+            schedules = schedules.filter(academic_year=academic_year)
+        serializer = FeeScheduleSerializer(schedules, many=True)
+        return Response(serializer.data)
+
+    elif request.method == 'POST':
+        serializer = FeeScheduleSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'academic_year': openapi.Schema(type=openapi.TYPE_STRING),
+            'schedule_ids': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)),
+            'dry_run': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+        },
+        required=['academic_year']
+    ),
+    responses={200: 'Created/skipped counts per schedule', 400: 'Validation error'}
+)
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def generate_fees(request):
+    academic_year = request.data.get('academic_year')
+    schedule_ids = request.data.get('schedule_ids') or None
+    if not academic_year:
+        return Response({'error': 'academic_year is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if schedule_ids is not None and not isinstance(schedule_ids, list):
+        return Response({'error': 'schedule_ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+    dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+    report = generate_term_fees(academic_year, schedule_ids, dry_run=dry_run)
+    return Response(report)
+
+@swagger_auto_schema(
+    method='post',
+    manual_parameters=[
+        openapi.Parameter('statement', openapi.IN_FORM, type=openapi.TYPE_FILE, required=True),
+        openapi.Parameter('payment_method', openapi.IN_FORM, type=openapi.TYPE_STRING),
+        openapi.Parameter('dry_run', openapi.IN_FORM, type=openapi.TYPE_BOOLEAN),
+    ],
+    responses={202: JobSerializer(), 400: 'No statement file'}
+)
+@api_view(['POST'])
+@parser_classes([MultiPartParser])
+@permission_classes([IsAdminUser])
+def reconcile_fee_payments(request):
+    statement = request.FILES.get('statement')
+    if not statement:
+        return Response({'error': 'statement file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    path = default_storage.save(os.path.join(JOB_UPLOAD_DIR, f'{uuid.uuid4().hex}.csv'), statement)
+    job = submit_job('reconcile_payments', {
+        'path': path,
+        'payment_method': request.data.get('payment_method') or 'Bank transfer',
+        'dry_run': str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes'),
+    }, user=request.user, max_attempts=1)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+@swagger_auto_schema(
+    method='post',
+    manual_parameters=[
+        openapi.Parameter('file', openapi.IN_FORM, type=openapi.TYPE_FILE, required=True),
+        openapi.Parameter('format', openapi.IN_FORM, type=openapi.TYPE_STRING, enum=list(ONBOARD_FORMATS)),
+        openapi.Parameter('dry_run', openapi.IN_FORM, type=openapi.TYPE_BOOLEAN),
+    ],
+    responses={202: JobSerializer(), 400: 'No onboarding file'}
+)
+@api_view(['POST'])
+@parser_classes([MultiPartParser])
+@permission_classes([IsAdminUser])
+def onboard_users_import(request):
+    upload = request.FILES.get('file')
+    if not upload:
+        return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    fmt = request.data.get('format') or ('json' if upload.name.lower().endswith('.json') else 'csv')
+    if fmt not in ONBOARD_FORMATS:
+        return Response({'error': f'format must be one of {", ".join(ONBOARD_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    path = default_storage.save(os.path.join(JOB_UPLOAD_DIR, f'{uuid.uuid4().hex}.{fmt}'), upload)
+    job = submit_job('onboard_users', {
+        'path': path,
+        'format': fmt,
+        'dry_run': str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes'),
+    }, user=request.user, max_attempts=1)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+# Background Job Views
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'task': openapi.Schema(type=openapi.TYPE_STRING),
+            'params': openapi.Schema(type=openapi.TYPE_OBJECT),
+        },
+        required=['task']
+    ),
+    responses={202: JobSerializer(), 400: 'Unknown task'}
+)
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def submit_background_job(request):
+    task_name = request.data.get('task')
+    params = request.data.get('params') or {}
+    if task_name not in TASKS:
+        return Response({'error': f'task must be one of {", ".join(sorted(TASKS))}'}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(params, dict):
+        return Response({'error': 'params must be an object'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        job = submit_job(task_name, params, user=request.user)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+@swagger_auto_schema(
+    method='get',
+    responses={200: JobSerializer(), 404: 'Not Found'}
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def background_job_detail(request, pk):
+    jobs = Job.objects.all() if request.user.is_staff else Job.objects.filter(created_by=request.user)
+    job = get_object_or_404(jobs, pk=pk)
+    return Response(JobSerializer(job).data)
+
 # Dashboard Views
+DASHBOARD_DETAIL_LIMIT = 10
+
 @swagger_auto_schema(
     method='get',
     responses={200: openapi.Schema(
@@ -281,32 +757,334 @@ def record_fee_payment(request):
         properties={
             'total_students': openapi.Schema(type=openapi.TYPE_INTEGER),
             'total_teachers': openapi.Schema(type=openapi.TYPE_INTEGER),
-            'recent_attendance': AttendanceSerializer(many=True),
-            'upcoming_exams': ExamSerializer(many=True),
-            'pending_fees': FeeSerializer(many=True),
+            'attendance_today': openapi.Schema(type=openapi.TYPE_OBJECT),
+            'fees': openapi.Schema(type=openapi.TYPE_OBJECT),
+            'exams': openapi.Schema(type=openapi.TYPE_OBJECT),
+            'links': openapi.Schema(type=openapi.TYPE_OBJECT),
         }
     )}
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_summary(request):
+    """
+    Aggregates only: every figure comes from a grouped query and detail
+    lists are capped at DASHBOARD_DETAIL_LIMIT rows, with links to the
+    paginated endpoints for the full data.
+    """
     today = now().date()
-    
+    status_codes = [code for code, _ in Attendance.status_choices]
+
+    attendance_by_status = dict.fromkeys(status_codes, 0)
+    attendance_by_section = {}
+    rows = (
+        Attendance.objects.filter(date=today)
+        .values('student__class_section', 'status')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        attendance_by_status[row['status']] += row['total']
+        section = attendance_by_section.setdefault(
+            row['student__class_section'], dict.fromkeys(status_codes, 0)
+        )
+        section[row['status']] += row['total']
+    section_names = {
+        cs.id: str(cs) for cs in
+        ClassSection.objects.filter(pk__in=attendance_by_section).select_related('class_name', 'section')
+    }
+
+    outstanding = F('amount') - F('paid_amount')
+    overdue = Q(status='OVE') | Q(status='PEN', due_date__lt=today)
+    fees_by_type = (
+        Fee.objects.filter(status__in=('PEN', 'OVE'))
+        .values('fee_type')
+        .annotate(
+            pending_count=Count('id'),
+            pending_amount=Sum(outstanding),
+            overdue_count=Count('id', filter=overdue),
+            overdue_amount=Sum(outstanding, filter=overdue),
+        )
+        .order_by('fee_type')
+    )
+    fee_type_names = dict(Fee.fee_type_choices)
+    fee_breakdown = [
+        {
+            'fee_type': row['fee_type'],
+            'fee_type_display': fee_type_names.get(row['fee_type'], row['fee_type']),
+            'pending_count': row['pending_count'],
+            'pending_amount': row['pending_amount'] or 0,
+            'overdue_count': row['overdue_count'],
+            'overdue_amount': row['overdue_amount'] or 0,
+        }
+        for row in fees_by_type
+    ]
+    most_overdue = (
+        Fee.objects.filter(overdue)
+        .order_by('due_date', 'id')
+        .values('id', 'student_id', 'student__admission_number', 'fee_type', 'amount', 'paid_amount', 'due_date')
+        [:DASHBOARD_DETAIL_LIMIT]
+    )
+
+    upcoming_exams = Exam.objects.filter(start_date__gte=today).order_by('start_date', 'id')
+
     summary = {
         'total_students': Student.objects.count(),
         'total_teachers': Teacher.objects.count(),
-        'recent_attendance': AttendanceSerializer(
-            Attendance.objects.filter(date=today),
-            many=True
-        ).data,
-        'upcoming_exams': ExamSerializer(
-            Exam.objects.filter(start_date__gte=today),
-            many=True
-        ).data,
-        'pending_fees': FeeSerializer(
-            Fee.objects.filter(status='PEN'),
-            many=True
-        ).data,
+        'attendance_today': {
+            'date': today,
+            'total': sum(attendance_by_status.values()),
+            'by_status': attendance_by_status,
+            'by_class_section': [
+                dict(class_section=class_section_id, name=section_names.get(class_section_id, ''), **counts)
+                for class_section_id, counts in sorted(attendance_by_section.items())
+            ],
+        },
+        'fees': {
+            'pending_count': sum(row['pending_count'] for row in fee_breakdown),
+            'pending_amount': sum(row['pending_amount'] for row in fee_breakdown),
+            'overdue_count': sum(row['overdue_count'] for row in fee_breakdown),
+            'overdue_amount': sum(row['overdue_amount'] for row in fee_breakdown),
+            'by_fee_type': fee_breakdown,
+            'most_overdue': list(most_overdue),
+        },
+        'exams': {
+            'upcoming_count': upcoming_exams.count(),
+            'upcoming': list(upcoming_exams.values('id', 'name', 'exam_type', 'start_date', 'end_date')[:DASHBOARD_DETAIL_LIMIT]),
+        },
+        'links': {
+            'attendance_today': request.build_absolute_uri(
+                f"{reverse('attendance-report')}?start_date={today}&end_date={today}&page=1"
+            ),
+            'absent_today': request.build_absolute_uri(
+                f"{reverse('attendance-report')}?start_date={today}&end_date={today}&status=A&page=1"
+            ),
+            'pending_fees': request.build_absolute_uri(f"{reverse('fee-management')}?status=PEN&page=1"),
+            'overdue_fees': request.build_absolute_uri(f"{reverse('fee-management')}?overdue=1&page=1"),
+            'exams': request.build_absolute_uri(reverse('exam-management')),
+        },
     }
     
-    return Response(summary)
\ No newline at end of file
+    return Response(summary)
+
+# Search Views
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('type', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=[KIND_STUDENT, KIND_TEACHER]),
+        openapi.Parameter('page', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'page': openapi.Schema(type=openapi.TYPE_INTEGER),
+            'has_next': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+            'results': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+        }
+    )}
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_directory(request):
+    query = request.query_params.get('q', '')
+    kind = request.query_params.get('type')
+    if kind and kind not in (KIND_STUDENT, KIND_TEACHER):
+        return Response({'error': 'type must be student or teacher'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+        page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 100)
+    except ValueError:
+        return Response({'error': 'page and page_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    results, has_next = search_index(
+        query, kind=kind, limit=page_size, offset=(page - 1) * page_size, staff=request.user.is_staff
+    )
+    return Response({
+        'page': page,
+        'has_next': has_next,
+        'results': results,
+    })
+
+# Delta Sync Views
+def _sync_representations(key, ids):
+    if not ids:
+        return []
+    if key == 'students':
+        students = StudentSerializer.setup_eager_loading(Student.objects.filter(pk__in=ids).order_by('id'))
+        return serialize_cached(StudentSerializer, students)
+    if key == 'teachers':
+        teachers = TeacherSerializer.setup_eager_loading(Teacher.objects.filter(pk__in=ids).order_by('id'))
+        return serialize_cached(TeacherSerializer, teachers)
+    if key == 'exams':
+        return ExamSerializer(Exam.objects.filter(pk__in=ids).order_by('id'), many=True).data
+    fees = Fee.objects.select_related('student').filter(pk__in=ids).order_by('id')
+    return FeeSerializer(fees, many=True).data
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('since', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Cursor from the previous sync; omit to get the current cursor only'),
+        openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description=f'Change log entries to read (max {SYNC_MAX_PAGE_SIZE})'),
+    ],
+    responses={200: openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'cursor': openapi.Schema(type=openapi.TYPE_INTEGER),
+            'has_more': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+            'changes': openapi.Schema(type=openapi.TYPE_OBJECT),
+        }
+    )}
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """
+    Students, teachers, exams and fees changed since a cursor. A client takes
+    the current cursor, does one full pull of the list endpoints and from
+    then on only asks for the delta, repeating while has_more is true.
+    """
+    if 'since' not in request.query_params:
+        return Response({'cursor': current_cursor(), 'has_more': False, 'changes': {}})
+    try:
+        since = max(int(request.query_params['since']), 0)
+        limit = min(max(int(request.query_params.get('limit', SYNC_PAGE_SIZE)), 1), SYNC_MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({'error': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    changes, cursor, has_more = collect_changes(since, limit)
+    return Response({
+        'cursor': cursor,
+        'has_more': has_more,
+        'changes': {
+            key: {
+                'inserted': _sync_representations(key, delta['inserted']),
+                'updated': _sync_representations(key, delta['updated']),
+                'deleted': sorted(delta['deleted']),
+            }
+            for key, delta in changes.items()
+        },
+    })
+
+# Profiling Views
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('url_name', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter('min_duration_ms', openapi.IN_QUERY, type=openapi.TYPE_NUMBER),
+        openapi.Parameter('page', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: RequestProfileSerializer(many=True)}
+)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def request_profiles(request):
+    profiles = RequestProfile.objects.order_by('-created_at', '-id')
+    url_name = request.query_params.get('url_name')
+    if url_name:
+        profiles = profiles.filter(url_name=url_name)
+    try:
+        if request.query_params.get('min_duration_ms'):
+            profiles = profiles.filter(duration_ms__gte=float(request.query_params['min_duration_ms']))
+    except ValueError:
+        return Response({'error': 'min_duration_ms must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    return paginated_response(request, profiles, RequestProfileSerializer)
+
+@swagger_auto_schema(
+    method='get',
+    responses={200: RequestProfileDetailSerializer(), 404: 'Not Found'}
+)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def request_profile_detail(request, pk):
+    profile = get_object_or_404(RequestProfile, pk=pk)
+    return Response(RequestProfileDetailSerializer(profile).data)
+
+QUERY_LOG_ORDERINGS = ('total_ms', 'count', 'max_ms', 'max_per_request')
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('url_name', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter('ordering', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(QUERY_LOG_ORDERINGS)),
+        openapi.Parameter('n_plus_one', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN),
+        openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))}
+)
+@swagger_auto_schema(method='delete', responses={204: 'No Content'})
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def query_log(request):
+    """SQL fingerprints aggregated per URL name by the worker serving this request."""
+    if request.method == 'DELETE':
+        query_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    ordering = request.query_params.get('ordering', 'total_ms')
+    if ordering not in QUERY_LOG_ORDERINGS:
+        return Response({'error': f'ordering must be one of {", ".join(QUERY_LOG_ORDERINGS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 50)), 1), 500)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(query_stats.report(
+        url_name=request.query_params.get('url_name'),
+        order_by=ordering,
+        n_plus_one=request.query_params.get('n_plus_one') in ('1', 'true', 'True'),
+        limit=limit,
+    ))
+
+@swagger_auto_schema(method='get', responses={200: openapi.Schema(type=openapi.TYPE_OBJECT)})
+@swagger_auto_schema(method='delete', responses={204: 'No Content'})
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def request_limits(request):
+    """Request limiter counters and configuration of the worker serving this request."""
+    if request.method == 'DELETE':
+        limiter_metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(limiter_metrics.report())
+
+# Batch Views
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'requests': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'id': openapi.Schema(type=openapi.TYPE_STRING),
+                    'method': openapi.Schema(type=openapi.TYPE_STRING, default='GET'),
+                    'path': openapi.Schema(type=openapi.TYPE_STRING, example='/main/students/?page=1'),
+                    'body': openapi.Schema(type=openapi.TYPE_OBJECT),
+                    'headers': openapi.Schema(type=openapi.TYPE_OBJECT),
+                },
+                required=['path']
+            )),
+            'concurrent': openapi.Schema(type=openapi.TYPE_BOOLEAN, default=False),
+        },
+        required=['requests']
+    ),
+    responses={200: openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={'responses': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))}
+    )}
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_requests(request):
+    """
+    Run several /main/ requests in one round trip. Each result carries the
+    sub-request's id, status and body; the batch itself answers 200 even when
+    some sub-requests fail.
+    """
+    try:
+        sub_requests = parse_sub_requests(request.data.get('requests'))
+    except BatchError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'responses': run_batch(request, sub_requests, concurrent=bool(request.data.get('concurrent')))})
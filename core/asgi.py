@@ -13,4 +13,21 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up. The event stream is served outside the
+# Django handler so each open stream is a coroutine rather than a thread and
+# is torn down as soon as the client disconnects.
+from django.conf import settings  # noqa: E402
+from apps.accounts.login import LOGIN_PATH, login_application  # noqa: E402
+from apps.main.events import EVENTS_PATH, sse_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        return await sse_application(scope, receive, send)
+    # Logins wait on the password hashing pool as coroutines, see apps/accounts/login.py.
+    if (scope['type'] == 'http' and scope['path'] == LOGIN_PATH and scope['method'] == 'POST'
+            and getattr(settings, 'LOGIN_ASYNC', True)):
+        return await login_application(scope, receive, send)
+    return await django_application(scope, receive, send)
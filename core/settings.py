@@ -57,6 +57,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.main.throttling.InFlightLimitMiddleware',
+    'apps.main.profiling.ProfilingMiddleware',
+    'apps.main.querylog.QueryLogMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,10 +92,98 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Wait for the write lock instead of failing when web workers and
+            # the background job worker write at the same time.
+            'timeout': 20,
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Idempotency-Key -> stored response for retried writes. In the database
+    # so the key lock holds across every web worker process.
+    'idempotency': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'main_idempotency_cache',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    },
+    # Versioned per-object serializer output (apps/main/representation_cache.py).
+    # Entries are only ever read under the version stored on the row, so
+    # each process can keep its own copy.
+    'representations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'representations',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 200000,
+        },
+    },
+    # Small keys every web and job worker process must agree on, such as
+    # the payroll version. Its table is created by migrate.
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'main_shared_cache',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000000,
+        },
+    },
+}
+
+REPRESENTATION_CACHE_ENABLED = True
+
+# Academic years run from the first of this month; used to archive closed years.
+ACADEMIC_YEAR_START_MONTH = 7
+
+# Superseded change log entries older than this are removed by compact_change_log.
+CHANGE_LOG_COMPACT_AFTER_DAYS = 7
+
+# Seconds the /main/events/ stream waits to coalesce events before flushing.
+EVENT_COALESCE_WINDOW = 0.5
+
+# Request profiling: fraction of requests to profile at random (staff can
+# always ask with an X-Profile header), default profiler and how many
+# profiles to keep (older ones are pruned periodically).
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_MODE = 'cprofile'
+PROFILING_KEEP = 200
+
+# SQL fingerprint log: per-process aggregate of statements per URL name.
+# A statement run this many times in one request is flagged as a likely N+1.
+QUERY_LOG_ENABLED = True
+QUERY_LOG_MAX_ENTRIES = 2000
+QUERY_LOG_N_PLUS_ONE_THRESHOLD = 10
+QUERY_LOG_SLOW_MS = 200
+
+# /main/batch/ limits.
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# Under ASGI, POST /accounts/login/ runs as a coroutine and authenticates on
+# a bounded 'thread' or 'process' pool (workers default to the CPU count).
+# With more than LOGIN_HASH_MAX_PENDING logins queued, logins get a 503.
+LOGIN_ASYNC = True
+LOGIN_HASH_POOL = 'thread'
+LOGIN_HASH_WORKERS = None
+LOGIN_HASH_MAX_PENDING = 64
+
+# Rehash a correct password on login when its stored hash differs from the
+# preferred hasher: 'match' (Django's behaviour, raising or lowering the work
+# factor), 'upgrade' (only when the stored hash is weaker) or 'never'.
+LOGIN_REHASH_POLICY = 'match'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -155,6 +246,43 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # Token buckets per client and endpoint class (apps/main/throttling.py);
+    # rates are in cost tokens, see THROTTLE_COSTS.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'apps.main.throttling.CostRateThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'read': '600/min',
+        'write': '120/min',
+        'heavy': '60/min',
+    },
+}
+
+# Views in the 'heavy' bucket class. At most THROTTLE_MAX_HEAVY_IN_FLIGHT of
+# them run at once per process; the rest get a 503.
+THROTTLE_HEAVY_VIEWS = (
+    'attendance-report', 'attendance-matrix', 'exam-analytics', 'report-cards',
+    'dashboard-summary', 'generate-fees', 'payroll-run', 'payroll-org-report',
+    'payroll-export',
+)
+THROTTLE_MAX_HEAVY_IN_FLIGHT = 4
+
+# Tokens a request to these views costs; anything else costs 1. Logins cost
+# more than other writes to slow down password guessing from one address.
+THROTTLE_COSTS = {
+    'attendance-report': 10,
+    'attendance-matrix': 5,
+    'exam-analytics': 5,
+    'report-cards': 20,
+    'dashboard-summary': 3,
+    'generate-fees': 20,
+    'payroll-run': 5,
+    'payroll-org-report': 5,
+    'payroll-export': 20,
+    'student-list': 2,
+    'get-exam-results': 2,
+    'sync-changes': 2,
+    'login': 4,
 }
 
 